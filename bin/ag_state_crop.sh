@@ -24,6 +24,26 @@ parameter=$9
 t_array=`echo  "print('(\"'+'\" \"'.join(\"${crops}\".split(\";\"))+'\")')" | python`
 #crops_array=`echo  "for item in \"corn;soybeans\".split(\";\"): print(item) " | python`
 
+# data: all crops and statistics of the state in one request, one wide table
+if [ "${operation}" = "data" ] || \
+   [[ "${operation}" =~ ^[#[:space:]]*$ ]]; then
+    lower_state_code=`echo "print('${state_code}'.lower())" | python`
+    start_year_cond=""
+    if ! [[ "${start_year}" =~ ^[#[:space:]]*$ ]]; then
+        start_year_cond="year;__GE;${start_year}"
+    fi
+    python "${py_srcdir}src/agstats.py" "nass_quickstats" \
+        --operation crops \
+        --api-key "${api_key}" \
+        --output "${output_dir}/survey_${lower_state_code}_crops.parquet" \
+        --commodities "${crops}" \
+        --statistics "yield;prod;dollar;acres" \
+        --search-conditions \
+                    "state_alpha;;${state_code}" \
+                    "${start_year_cond}"
+    exit $?
+fi
+
 echo "$t_array"
 eval "crops_array=${t_array}"
 for i in ${!crops_array[@]}; do
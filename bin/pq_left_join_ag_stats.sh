@@ -47,5 +47,5 @@ python "${py_src}" \
     --join-method \
     "left" \
     "${input_dir}/${lower_state_code}_year_combine.parquet" \
-    "${input_dir}/survey_${lower_state_code}_*.parquet"
+    "${input_dir}/survey_${lower_state_code}_crops.parquet"
 
@@ -2,17 +2,707 @@
     Module
 """
 import argparse
+import codecs
+import contextlib
+import csv
 import logging
 import pandas as pd
 import io
 import json
+import hashlib
+import os
+import re
+import threading
+import time
 import requests
+import requests.adapters
+from concurrent.futures import ThreadPoolExecutor
 from enum import StrEnum
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.csv as pv
 import pyarrow.parquet as pq
+from manifest import OutputManifest, atomic_write, replace_file
+
+class NassQuickStatsClient:
+    """
+        QuickStats API client on one keep-alive requests.Session, so the
+        queries of a run reuse their TLS connections. It is safe to share
+        between threads; pool_maxsize bounds the pooled connections.
+    """
+    api_root = "https://quickstats.nass.usda.gov/api"
+    # api_GET rejects queries matching more records than this
+    max_records = 50000
+    # fields a too large query is split on, coarsest first
+    partition_fields = ["year", "state_alpha", "county_ansi"]
+    _shared = dict()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, api_key:str, pool_maxsize:int=10,
+                 timeout:float=300.0) -> None:
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize, max_retries=3)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def shared(cls, api_key:str, pool_maxsize:int=10) -> "NassQuickStatsClient":
+        with cls._shared_lock:
+            client = cls._shared.get(api_key)
+            if client is None:
+                client = cls(api_key=api_key, pool_maxsize=pool_maxsize)
+                cls._shared[api_key] = client
+            return client
+
+    @staticmethod
+    def search_params(search_conditions:list[str]) -> list[tuple]:
+        """
+            "field;operator;value" -> (field+operator, value)
+        """
+        params = list()
+        for qstr in search_conditions or []:
+            qstrs = qstr.split(';')
+            if len(qstrs) == 3:
+                params.append((f'{qstrs[0]}{qstrs[1]}',qstrs[2]))
+        return params
+
+    def get(self, endpoint:str, search_conditions:list[str],
+            params:list[tuple]=None, stream:bool=False) -> requests.Response:
+        the_params = [("key", self.api_key)]
+        the_params.extend(params or [])
+        the_params.extend(self.search_params(search_conditions))
+        the_response = self.session.get(
+            url=f"{self.api_root}/{endpoint}/",
+            params=the_params,
+            timeout=self.timeout,
+            stream=stream)
+        the_response.raise_for_status()
+        return the_response
+
+    def get_param_values(self, parameter:str,
+                         search_conditions:list[str]) -> dict:
+        return self.get("get_param_values", search_conditions,
+                        params=[("param", parameter)]).json()
+
+    def get_counts(self, search_conditions:list[str]) -> dict:
+        return self.get("get_counts", search_conditions).json()
+
+    def get_data(self, search_conditions:list[str]) -> dict:
+        return self.get("api_GET", search_conditions).json()
+
+
+class NassQuickStatsCache:
+    """
+        On-disk cache of QuickStats api_GET responses.
+
+        Entries are keyed by a hash of the normalized search conditions
+        and the response format (the API key is not part of them). Each
+        entry keeps the raw response in <key>.data and the conditions,
+        record count and fetch time in <key>.meta.json. An entry younger than ttl seconds
+        is used as is; an older one has to be revalidated (see
+        NassQuickStatsUtil.revalidate) before it is used again. The least
+        recently used entries are evicted once the cache grows beyond
+        max_bytes.
+    """
+    _shared = dict()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache_dir:str,
+                 ttl:float=7*24*3600,
+                 max_bytes:int=1024*1024*1024) -> None:
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def shared(cls, cache_dir:str, ttl:float, max_bytes:int) -> "NassQuickStatsCache":
+        with cls._shared_lock:
+            cache = cls._shared.get(cache_dir)
+            if cache is None:
+                cache = cls(cache_dir=cache_dir, ttl=ttl, max_bytes=max_bytes)
+                cls._shared[cache_dir] = cache
+            return cache
+
+    @staticmethod
+    def normalize_conditions(search_conditions:list[str]) -> list[str]:
+        """
+            Valid "field;operator;value" conditions, trimmed, without
+            duplicates, in sorted order: the order does not change the query.
+        """
+        conditions = set()
+        for qstr in search_conditions or []:
+            qstrs = [part.strip() for part in qstr.split(';')]
+            if len(qstrs) == 3:
+                conditions.add(";".join(qstrs))
+        return sorted(conditions)
+
+    def key(self, search_conditions:list[str], response_format:str="json") -> str:
+        query = json.dumps([self.normalize_conditions(search_conditions),
+                            str(response_format).lower()])
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def _paths(self, key:str) -> tuple[str, str]:
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + ".data", base + ".meta.json"
+
+    def get(self, key:str) -> tuple:
+        """
+            Returns (data file opened for reading, metadata), or (None, None).
+            The file is opened under the lock, so an eviction running in
+            another thread can not remove it before it is read.
+        """
+        data_path, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, "r") as f:
+                    metadata = json.load(f)
+                data_file = open(data_path, "rb")
+            except (OSError, ValueError):
+                return None, None
+            # mark as recently used
+            os.utime(data_path)
+        return data_file, metadata
+
+    def is_fresh(self, metadata:dict) -> bool:
+        return not self.ttl or time.time() - metadata["validated"] <= self.ttl
+
+    def _write_metadata(self, meta_path:str, metadata:dict) -> None:
+        with atomic_write(meta_path) as f:
+            json.dump(metadata, f, indent=2)
+
+    def mark_validated(self, key:str) -> None:
+        _, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, "r") as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                return
+            metadata["validated"] = time.time()
+            self._write_metadata(meta_path, metadata)
+
+    def put(self, key:str, chunks, search_conditions:list[str],
+            count:int):
+        """
+            Store the response body given as an iterable of byte chunks.
+            Returns the stored body opened for reading.
+        """
+        data_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        # a download failing half way leaves no temp file behind
+        with replace_file(data_path) as tmp_file:
+            with open(tmp_file, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            # opened before the move, so it stays readable if evicted meanwhile
+            data_file = open(tmp_file, "rb")
+        now = time.time()
+        metadata = {
+            "fetched": now,
+            "validated": now,
+            "count": count,
+            "size": os.fstat(data_file.fileno()).st_size,
+            "search_conditions": self.normalize_conditions(search_conditions)}
+        with self._lock:
+            self._write_metadata(meta_path, metadata)
+            self._evict(keep=data_path)
+        return data_file
+
+    def _evict(self, keep:str=None) -> None:
+        entries = list()
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(".data"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            meta_path = path[:-len(".data")] + ".meta.json"
+            for entry_path in (path, meta_path):
+                try:
+                    os.remove(entry_path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+class NassQuickStatsCrops:
+    """
+        State crop statistics of bin/ag_state_crop_{yield,prod,dollar,acres}.sh
+        in one query: commodity_desc and statisticcat_desc are given once
+        per value (the API ORs repeated parameters) and the unit of each
+        crop and statistic is picked from the result.
+    """
+    base_conditions = [
+        "source_desc;;SURVEY",
+        "sector_desc;;CROPS",
+        "agg_level_desc;;STATE",
+        "group_desc;;FIELD CROPS",
+        "class_desc;;ALL CLASSES",
+        "reference_period_desc;;YEAR",
+        "prodn_practice_desc;;ALL PRODUCTION PRACTICES",
+        "freq_desc;;ANNUAL"]
+    columns = ["state_alpha", "year", "commodity_desc", "statisticcat_desc",
+               "unit_desc", "util_practice_desc", "Value"]
+    yield_units = {
+        "PEANUTS": "LB / ACRE", "RICE": "LB / ACRE", "SUNFLOWER": "LB / ACRE",
+        "SAFFLOWER": "LB / ACRE", "TOBACCO": "LB / ACRE", "HOPS": "LB / ACRE",
+        "CANOLA": "LB / ACRE", "LENTILS": "LB / ACRE", "CHICKPEAS": "LB / ACRE",
+        "COTTON": "LB / ACRE",
+        "HAY": "TONS / ACRE", "SUGARBEETS": "TONS / ACRE", "SUGARCANE": "TONS / ACRE",
+        "MAPLE SYRUP": "GALLONS / TAP",
+        "HAY & HAYLAGE": "TONS / ACRE, DRY BASIS"}
+    prod_units = {
+        "PEANUTS": "LB", "SUNFLOWER": "LB", "SAFFLOWER": "LB", "TOBACCO": "LB",
+        "HOPS": "LB", "CANOLA": "LB",
+        "RICE": "CWT", "CHICKPEAS": "CWT", "LENTILS": "CWT",
+        "COTTON": "480 LB BALES",
+        "HAY & HAYLAGE": "TONS, DRY BASIS",
+        "MAPLE SYRUP": "GALLONS",
+        "HAY": "TONS", "SUGARBEETS": "TONS", "SUGARCANE": "TONS"}
+    harvested_area_crops = ["HAY", "TOBACCO", "HOPS", "HAY & HAYLAGE", "SUGARCANE"]
+    label_columns = ["state_alpha", "year", "column", "util_practice_desc",
+                     "Value", "flag"]
+
+    @staticmethod
+    def selector(crop:str, statistic:"NassQuickStatsCropStatistic") -> dict:
+        """
+            Field values identifying statistic of crop in the result.
+        """
+        crop = crop.upper()
+        if statistic == NassQuickStatsCropStatistic.crop_yield:
+            the_selector = {"statisticcat_desc": "YIELD",
+                            "unit_desc": NassQuickStatsCrops.yield_units.get(crop, "BU / ACRE")}
+        elif statistic == NassQuickStatsCropStatistic.prod:
+            the_selector = {"statisticcat_desc": "PRODUCTION",
+                            "unit_desc": NassQuickStatsCrops.prod_units.get(crop, "BU")}
+        elif statistic == NassQuickStatsCropStatistic.dollar:
+            the_selector = {"statisticcat_desc": "PRODUCTION", "unit_desc": "$"}
+        elif crop == "MAPLE SYRUP":
+            the_selector = {"statisticcat_desc": "AREA",
+                            "unit_desc": "ACRES WHERE TAPS SET"}
+        elif crop in NassQuickStatsCrops.harvested_area_crops:
+            the_selector = {"statisticcat_desc": "AREA HARVESTED", "unit_desc": "ACRES"}
+        else:
+            the_selector = {"statisticcat_desc": "AREA PLANTED", "unit_desc": "ACRES"}
+        the_selector["commodity_desc"] = crop
+        if crop == "SUGARCANE":
+            the_selector["util_practice_desc"] = "SUGAR"
+        return the_selector
+
+    @staticmethod
+    def column_name(crop:str, statistic:"NassQuickStatsCropStatistic") -> str:
+        return f"{crop.replace(' ', '_').lower()}_{statistic.value}"
+
+    @staticmethod
+    def search_conditions(crops:list[str],
+                          statistics:list["NassQuickStatsCropStatistic"],
+                          search_conditions:list[str]) -> list[str]:
+        selectors = [NassQuickStatsCrops.selector(crop, statistic)
+                     for crop in crops for statistic in statistics]
+        commodities = sorted({selector["commodity_desc"] for selector in selectors})
+        categories = sorted({selector["statisticcat_desc"] for selector in selectors})
+        return (NassQuickStatsCrops.base_conditions
+                + [f"commodity_desc;;{commodity}" for commodity in commodities]
+                + [f"statisticcat_desc;;{category}" for category in categories]
+                + list(search_conditions or []))
+
+    @staticmethod
+    def label_batch(batch:pa.RecordBatch, crops:list[str],
+                    statistics:list["NassQuickStatsCropStatistic"]) -> pa.RecordBatch:
+        """
+            Keep the rows of the requested crop statistics, labelled with
+            their output column in a "column" field, and their suppression
+            code (convert_values) in a "flag" field.
+        """
+        label = pa.nulls(batch.num_rows, pa.string())
+        for crop in crops:
+            for statistic in statistics:
+                mask = None
+                for field, value in NassQuickStatsCrops.selector(crop, statistic).items():
+                    field_mask = pc.equal(batch.column(field), value)
+                    mask = field_mask if mask is None else pc.and_(mask, field_mask)
+                label = pc.if_else(pc.fill_null(mask, False),
+                                   NassQuickStatsCrops.column_name(crop, statistic),
+                                   label)
+        flag_index = batch.schema.get_field_index(
+            NassQuickStatsUtil.flag_column("Value"))
+        flag = (batch.column(flag_index).cast(pa.string()) if flag_index >= 0
+                else pa.nulls(batch.num_rows, pa.string()))
+        batch = pa.RecordBatch.from_arrays(
+            [batch.column("state_alpha"), batch.column("year"), label,
+             batch.column("util_practice_desc"), batch.column("Value"), flag],
+            names=NassQuickStatsCrops.label_columns)
+        return batch.filter(pc.is_valid(label))
+
 
 class NassQuickStatsUtil:
+    @staticmethod
+    def get_cache(args) -> (NassQuickStatsCache | None):
+        if getattr(args, "no_cache", True) or not getattr(args, "cache_dir", None):
+            return None
+        return NassQuickStatsCache.shared(
+            cache_dir=args.cache_dir,
+            ttl=args.cache_ttl_hours*3600,
+            max_bytes=args.cache_max_mb*1024*1024)
+
+    @staticmethod
+    def revalidate(client:NassQuickStatsClient,
+                   search_conditions:list[str],
+                   metadata:dict) -> bool:
+        """
+            Two get_counts calls instead of a new api_GET. The entry is
+            current when the record count is unchanged and no record was
+            loaded since it was fetched (with a day of margin for the
+            server time zone).
+        """
+        counts = client.get_counts(search_conditions=search_conditions)
+        if int(counts.get("count", -1)) != metadata["count"]:
+            return False
+        since = time.strftime("%Y-%m-%d %H:%M:%S",
+                              time.gmtime(metadata["fetched"] - 24*3600))
+        counts = client.get_counts(
+            search_conditions=list(search_conditions) + [f"load_time;__GE;{since}"])
+        return int(counts.get("count", -1)) == 0
+
+    chunk_size = 1024*1024
+    # "data": [ opening the record array of an api_GET response
+    _data_array = re.compile(r'"data"\s*:\s*\[')
+
+    # explicit types of the response columns, the others are strings, so
+    # the JSON and CSV paths give the same schema
+    column_types = {"year": pa.int64()}
+
+    @staticmethod
+    def column_type(column:str) -> pa.DataType:
+        return NassQuickStatsUtil.column_types.get(column, pa.string())
+
+    @staticmethod
+    def response_format(args) -> "NassQuickStatsFormat":
+        return NassQuickStatsFormat(getattr(args, "format", None)
+                                    or NassQuickStatsFormat.json)
+
+    @staticmethod
+    def value_type(args) -> "NassQuickStatsValueType":
+        return NassQuickStatsValueType(getattr(args, "value_type", None)
+                                       or NassQuickStatsValueType.float64)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def open_data(args, count:int):
+        """
+            The api_GET response body for args.search_conditions, in
+            args.format, as a binary file object, from the cache when it
+            holds a current copy. count is the number of matching records
+            (get_counts).
+        """
+        client = NassQuickStatsUtil.get_client(args)
+        cache = NassQuickStatsUtil.get_cache(args)
+        response_format = NassQuickStatsUtil.response_format(args)
+        if cache:
+            key = cache.key(args.search_conditions, response_format)
+            data_file, metadata = cache.get(key)
+            if data_file:
+                with data_file:
+                    current = cache.is_fresh(metadata)
+                    if not current and NassQuickStatsUtil.revalidate(
+                            client=client,
+                            search_conditions=args.search_conditions,
+                            metadata=metadata):
+                        cache.mark_validated(key)
+                        current = True
+                    if current:
+                        print("using cached response:", data_file.name)
+                        yield data_file
+                        return
+        with client.get("api_GET", args.search_conditions,
+                        params=[("format", response_format.value.upper())],
+                        stream=True) as response:
+            if not cache:
+                response.raw.decode_content = True
+                yield response.raw
+                return
+            data_file = cache.put(
+                key=key,
+                chunks=response.iter_content(chunk_size=NassQuickStatsUtil.chunk_size),
+                search_conditions=args.search_conditions,
+                count=count)
+        with data_file:
+            yield data_file
+
+    @staticmethod
+    def iter_records(data_file):
+        """
+            Yield the records of the "data" array of a JSON api_GET response
+            one by one while reading it in chunks, so the whole body and
+            the list of records are never held in memory.
+        """
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        in_array = False
+        for chunk in iter(lambda: data_file.read(NassQuickStatsUtil.chunk_size), b""):
+            buffer += text_decoder.decode(chunk)
+            pos = 0
+            if not in_array:
+                m = NassQuickStatsUtil._data_array.search(buffer)
+                if not m:
+                    # keep enough to match a key split between chunks
+                    buffer = buffer[-64:]
+                    continue
+                in_array = True
+                pos = m.end()
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos == len(buffer):
+                    break
+                if buffer[pos] == "]":
+                    return
+                try:
+                    record, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # the record continues in the next chunk
+                    break
+                yield record
+            buffer = buffer[pos:]
+        if not in_array:
+            raise ValueError(f"No data in the QuickStats response: {buffer[:200]}")
+        raise ValueError("Truncated QuickStats response")
+
+    @staticmethod
+    def record_batches(records, columns:list[str], names:list[str],
+                       batch_rows:int):
+        """
+            Group records into Arrow record batches of at most batch_rows
+            rows, keeping only columns, renamed to names.
+        """
+        values = {column: [] for column in columns}
+        nrows = 0
+        for record in records:
+            if not values:
+                # all columns, in the order of the first record
+                columns = list(record.keys())
+                names = names or columns
+                values = {column: [] for column in columns}
+            for column in columns:
+                values[column].append(record.get(column))
+            nrows += 1
+            if nrows == batch_rows:
+                yield NassQuickStatsUtil._typed_batch(values, columns, names)
+                values = {column: [] for column in columns}
+                nrows = 0
+        if nrows:
+            yield NassQuickStatsUtil._typed_batch(values, columns, names)
+
+    @staticmethod
+    def _typed_batch(values:dict, columns:list[str], names:list[str]) -> pa.RecordBatch:
+        return pa.RecordBatch.from_arrays(
+            [pa.array(values[column]).cast(NassQuickStatsUtil.column_type(column))
+             for column in columns],
+            names=names)
+
+    @staticmethod
+    def csv_batches(data_file, columns:list[str], names:list[str]):
+        """
+            Arrow record batches of a CSV api_GET response, read block by
+            block with pyarrow.csv. Only columns are parsed, with explicit
+            types, and renamed to names.
+        """
+        # the header is read here so that every column, including the
+        # ones unknown in advance like "CV (%)", gets an explicit type
+        header = data_file.readline().decode("utf-8-sig").rstrip("\r\n")
+        if not header:
+            return
+        column_names = next(csv.reader([header]))
+        reader = pv.open_csv(
+            data_file,
+            read_options=pv.ReadOptions(
+                column_names=column_names,
+                block_size=NassQuickStatsUtil.chunk_size),
+            convert_options=pv.ConvertOptions(
+                column_types={column: NassQuickStatsUtil.column_type(column)
+                              for column in column_names},
+                include_columns=columns or None,
+                strings_can_be_null=True))
+        for batch in reader:
+            if batch.num_rows:
+                yield batch.rename_columns(names or batch.schema.names)
+
+    @staticmethod
+    def value_column(columns:list[str], names:list[str]) -> (str | None):
+        """
+            Output name of the QuickStats Value field, None if not selected.
+        """
+        if not columns:
+            return "Value"
+        if "Value" in columns:
+            return names[columns.index("Value")]
+        return None
+
+    @staticmethod
+    def flag_column(value_column:str) -> str:
+        return f"{value_column.lower()}_flag"
+
+    @staticmethod
+    def convert_values(batch:pa.RecordBatch, value_column:str,
+                       value_type:"NassQuickStatsValueType") -> pa.RecordBatch:
+        """
+            Turn the Value strings of batch ("1,234,000", "(D)", ...) into
+            numbers with Arrow compute: separators are stripped and the
+            suppression codes like (D), (Z) and (NA) become nulls, with the
+            code kept in a dictionary encoded <value>_flag column. Other
+            text, and fractions for int64, also become nulls flagged with
+            the original text.
+        """
+        index = batch.schema.get_field_index(value_column)
+        if index < 0 or value_type == NassQuickStatsValueType.string:
+            return batch
+        null = pa.scalar(None, pa.string())
+        raw = pc.utf8_trim_whitespace(batch.column(index).cast(pa.string()))
+        numbers = pc.replace_substring(raw, ",", "")
+        is_number = pc.fill_null(pc.match_substring_regex(
+            numbers, r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"), False)
+        # through float64, so "12.0" is a valid int64 and "12.5" is not
+        values = pc.if_else(is_number, numbers, null).cast(pa.float64())
+        if value_type == NassQuickStatsValueType.int64:
+            is_number = pc.and_(is_number, pc.fill_null(
+                pc.equal(values, pc.floor(values)), False))
+            values = pc.if_else(is_number, values, None).cast(pa.int64())
+        is_flag = pc.and_(pc.invert(is_number),
+                          pc.fill_null(pc.not_equal(numbers, ""), False))
+        nunexpected = pc.sum(pc.and_(is_flag, pc.invert(pc.fill_null(
+            pc.match_substring_regex(raw, r"^\(.*\)$"), False)))).as_py()
+        if nunexpected:
+            logging.warning(f"{nunexpected} {value_column} values are not "
+                            f"{value_type} numbers, stored as nulls and flagged")
+        flags = pc.if_else(is_flag, raw, null).dictionary_encode()
+        batch = batch.set_column(index, value_column, values)
+        return batch.add_column(index + 1,
+                                NassQuickStatsUtil.flag_column(value_column),
+                                flags)
+
+    @staticmethod
+    def response_batches(data_file, response_format:"NassQuickStatsFormat",
+                         columns:list[str], names:list[str], batch_rows:int,
+                         value_type:"NassQuickStatsValueType"=None):
+        if response_format == NassQuickStatsFormat.csv:
+            batches = NassQuickStatsUtil.csv_batches(
+                data_file=data_file, columns=columns, names=names)
+        else:
+            batches = NassQuickStatsUtil.record_batches(
+                records=NassQuickStatsUtil.iter_records(data_file),
+                columns=columns, names=names, batch_rows=batch_rows)
+        value_column = NassQuickStatsUtil.value_column(columns=columns, names=names)
+        if not value_column or not value_type:
+            return batches
+        return (NassQuickStatsUtil.convert_values(
+                    batch=batch, value_column=value_column, value_type=value_type)
+                for batch in batches)
+
+    @staticmethod
+    def empty_table(columns:list[str], names:list[str],
+                    value_type:"NassQuickStatsValueType"=None) -> pa.Table:
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array([], pa.string()) for _ in names], names=names)
+        value_column = NassQuickStatsUtil.value_column(columns=columns, names=names)
+        if value_column and value_type:
+            batch = NassQuickStatsUtil.convert_values(
+                batch=batch, value_column=value_column, value_type=value_type)
+        return pa.Table.from_batches([batch])
+
+    @staticmethod
+    def write_batches(batches, output:str, names:list[str]) -> None:
+        """
+            Write a stream of record batches to one Parquet file.
+        """
+        writer = None
+        try:
+            for batch in batches:
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        output, NassQuickStatsUtil.writer_schema(batch))
+                writer.write_batch(batch.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            pq.write_table(NassQuickStatsUtil.empty_table(
+                columns=names, names=names), output)
+
+    @staticmethod
+    def writer_schema(batch:pa.RecordBatch) -> pa.Schema:
+        # an all-null column of the first batch is stored as strings
+        return pa.schema([field.with_type(pa.string())
+                          if pa.types.is_null(field.type) else field
+                          for field in batch.schema])
+
+    @staticmethod
+    def partition_conditions(client:NassQuickStatsClient,
+                             search_conditions:list[str]) -> list[tuple[list[str], int]]:
+        """
+            Split search_conditions on the values of year, state_alpha and
+            then county_ansi until each part matches at most
+            client.max_records records. Returns (conditions, count) of each
+            part; parts without records are dropped.
+        """
+        search_conditions = list(search_conditions or [])
+        count = int(client.get_counts(search_conditions=search_conditions)["count"])
+        if count <= client.max_records:
+            return [(search_conditions, count)] if count else []
+        # values a field is restricted to with = conditions (several = an IN list)
+        equal_values = dict()
+        for qstr in search_conditions:
+            qstrs = [part.strip() for part in qstr.split(";")]
+            if len(qstrs) == 3 and qstrs[1] in ("", "__EQ"):
+                equal_values.setdefault(qstrs[0], []).append(qstrs[2])
+        for field in client.partition_fields:
+            if field in equal_values:
+                if len(equal_values[field]) < 2:
+                    continue
+                # split the IN list into its values
+                values = equal_values[field]
+                the_conditions = [qstr for qstr in search_conditions
+                                  if not (qstr.split(";")[0].strip() == field
+                                          and len(qstr.split(";")) == 3
+                                          and qstr.split(";")[1].strip() in ("", "__EQ"))]
+            else:
+                values = client.get_param_values(
+                    parameter=field, search_conditions=search_conditions)[field]
+                the_conditions = search_conditions
+            if len(values) < 2:
+                continue
+            partitions = list()
+            for value in values:
+                partitions.extend(NassQuickStatsUtil.partition_conditions(
+                    client=client,
+                    search_conditions=the_conditions + [f"{field};;{value}"]))
+            return partitions
+        raise ValueError(f"{count} records match {search_conditions}, more than "
+                         f"{client.max_records}, and it can not be split further")
+
+    @staticmethod
+    def get_client(args) -> NassQuickStatsClient:
+        return NassQuickStatsClient.shared(
+            api_key=args.api_key,
+            pool_maxsize=max(1, getattr(args, "workers", 1) or 1))
+
     @staticmethod
     def retrieve(args):
         if args.operation == 'parameters':
@@ -23,6 +713,8 @@ class NassQuickStatsUtil:
             NassQuickStatsUtil.count(args)
         if args.operation == 'data':
             NassQuickStatsUtil.data(args)
+        if args.operation == 'crops':
+            NassQuickStatsUtil.crops(args)
     @staticmethod
     def list_parameters():
         print(
@@ -32,21 +724,12 @@ class NassQuickStatsUtil:
     @staticmethod
     def describe_parameter(args):
         print("describe parameter:", args.parameter)
-        urlstr="https://quickstats.nass.usda.gov/api/get_param_values/"
-        #urlstr = (urlstr + "key=" + args.api_key
-        #          + "&param=" +
-        #          args.parameter)
-        params = list()
-        params.append(("key",args.api_key))
-        params.append(("param",args.parameter))
-        for qstr in args.search_conditions:
-            qstrs = qstr.split(';')
-            if len(qstrs) == 3:
-                params.append((f'{qstrs[0]}{qstrs[1]}',qstrs[2]))
-        the_response = requests.get(url=urlstr,params=params)
-        print("response:", the_response.json())
+        the_values = NassQuickStatsUtil.get_client(args).get_param_values(
+            parameter=args.parameter,
+            search_conditions=args.search_conditions)
+        print("response:", the_values)
         if args.parameter == "commodity_desc":
-            the_c = the_response.json()["commodity_desc"]
+            the_c = the_values["commodity_desc"]
             the_results = ";".join(the_c)
             print("the_results=", f"\"{the_results}\"",)
 
@@ -54,50 +737,297 @@ class NassQuickStatsUtil:
     @staticmethod
     def count(args):
         print("counting matches:", args.search_conditions)
-        urlstr="https://quickstats.nass.usda.gov/api/get_counts/"
-        params = list()
-        params.append(("key",args.api_key))
-        #urlstr = (urlstr + "key=" + args.api_key
-        #          + "&param=" +
-        #          args.parameter)
-        for qstr in args.search_conditions:
-            qstrs = qstr.split(';')
-            if len(qstrs) == 3:
-                params.append((f'{qstrs[0]}{qstrs[1]}',qstrs[2]))
-        #        urlstr += "&"+qstrs[0]+qstrs[1]+"="+qstrs[2]
-        the_response = requests.get(url=urlstr, params=params)
-        print("response:", the_response.json())
+        print("response:", NassQuickStatsUtil.get_client(args).get_counts(
+            search_conditions=args.search_conditions))
+
+    @staticmethod
+    def data_manifest(args) -> OutputManifest:
+        # the API key is left out: it does not change the data
+        return OutputManifest(
+            output=args.output,
+            tool_file=__file__,
+            params={
+                "operation": "data",
+                "format": str(NassQuickStatsUtil.response_format(args)),
+                "value_type": str(NassQuickStatsUtil.value_type(args)),
+                "search_conditions": sorted(args.search_conditions or []),
+                "output_columns": args.output_columns,
+                "output_column_names": args.output_column_names})
+
+    @staticmethod
+    def for_each_batch(args, columns:list[str], names:list[str], consume) -> None:
+        """
+            Fetch args.search_conditions, split into parts that fit one
+            request, on args.workers threads, and hand each record batch to
+            consume(batch), one call at a time. Returns the number of
+            matching records.
+        """
+        partitions = NassQuickStatsUtil.partition_conditions(
+            client=NassQuickStatsUtil.get_client(args),
+            search_conditions=args.search_conditions)
+        if len(partitions) > 1:
+            print(f"split into {len(partitions)} queries")
+        batch_rows = getattr(args, "batch_rows", 65536)
+        response_format = NassQuickStatsUtil.response_format(args)
+        value_type = NassQuickStatsUtil.value_type(args)
+        consume_lock = threading.Lock()
+        def fetch_partition(partition):
+            the_args = argparse.Namespace(**vars(args))
+            the_args.search_conditions, count = partition
+            with NassQuickStatsUtil.open_data(args=the_args, count=count) as data_file:
+                for batch in NassQuickStatsUtil.response_batches(
+                        data_file=data_file,
+                        response_format=response_format,
+                        columns=columns, names=names, batch_rows=batch_rows,
+                        value_type=value_type):
+                    with consume_lock:
+                        consume(batch)
+        workers = max(1, min(getattr(args, "workers", 1) or 1, len(partitions)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(fetch_partition, partitions))
+        return sum(count for _, count in partitions)
+
+    @staticmethod
+    def is_current(args, manifest:OutputManifest,
+                   search_conditions:list[str]) -> bool:
+        """
+            The output matches its manifest and still holds what QuickStats
+            has for search_conditions: within the cache TTL of the last
+            check as is, after it when revalidate accepts the record count
+            and fetch time recorded in the manifest.
+        """
+        if getattr(args, "force", False) or not manifest.is_up_to_date():
+            return False
+        source = manifest.recorded_source()
+        if not source:
+            return False
+        ttl = (getattr(args, "cache_ttl_hours", 0) or 0)*3600
+        if not ttl or time.time() - source["validated"] <= ttl:
+            return True
+        if not NassQuickStatsUtil.revalidate(
+                client=NassQuickStatsUtil.get_client(args),
+                search_conditions=search_conditions,
+                metadata=source):
+            return False
+        manifest.write_source(dict(source, validated=time.time()))
+        return True
+
+    @staticmethod
+    def manifest_source(count:int, fetched:float) -> dict:
+        return {"count": count, "fetched": fetched, "validated": fetched}
 
     @staticmethod
     def data(args):
+        manifest = NassQuickStatsUtil.data_manifest(args)
+        if NassQuickStatsUtil.is_current(
+                args=args, manifest=manifest,
+                search_conditions=args.search_conditions):
+            print(f"{args.output} is up to date")
+            return
         print("getting data matches:", args.search_conditions)
-        urlstr="https://quickstats.nass.usda.gov/api/api_GET/"
-        params = list()
-        params.append(("key",args.api_key))
-        #urlstr = (urlstr + "key=" + args.api_key
-        #          + "&param=" +
-        #          args.parameter)
-        for qstr in args.search_conditions:
-            qstrs = qstr.split(';')
-            if len(qstrs) == 3:
-                params.append((f'{qstrs[0]}{qstrs[1]}',qstrs[2]))
-        #        urlstr += "&"+qstrs[0]+qstrs[1]+"="+qstrs[2]
-        the_response = requests.get(url=urlstr, params=params)
-        data = the_response.json()
-        df = pd.json_normalize(data["data"])
-        if args.output_columns:
-            o_columns = args.output_columns.split(";")
-            df = df[o_columns]
-        if args.output_column_names:
-            o_column_names = args.output_column_names.split(";")
-            df.columns = o_column_names
-        #print("df=", df.columns.tolist())
-        df.to_parquet(args.output)
+        columns = args.output_columns.split(";") if args.output_columns else []
+        names = (args.output_column_names.split(";")
+                 if args.output_column_names else columns)
+        fetched = time.time()
+        with replace_file(args.output) as tmp_file:
+            # the parts are written as they stream in, one batch at a time
+            writer = None
+            def write_batch(batch):
+                nonlocal writer
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        tmp_file, NassQuickStatsUtil.writer_schema(batch))
+                writer.write_batch(batch.cast(writer.schema))
+            try:
+                count = NassQuickStatsUtil.for_each_batch(
+                    args=args, columns=columns, names=names, consume=write_batch)
+            finally:
+                if writer is not None:
+                    writer.close()
+            if writer is None:
+                pq.write_table(NassQuickStatsUtil.empty_table(
+                    columns=columns, names=names,
+                    value_type=NassQuickStatsUtil.value_type(args)), tmp_file)
+        manifest.source = NassQuickStatsUtil.manifest_source(count, fetched)
+        manifest.write()
         #print("response:", the_response.json())
 
 
+    @staticmethod
+    def crop_statistics(args) -> tuple[list[str], list["NassQuickStatsCropStatistic"]]:
+        crops = [crop.strip() for crop in (args.commodities or "").split(";")
+                 if crop.strip()]
+        statistics = [NassQuickStatsCropStatistic(statistic.strip())
+                      for statistic in (args.statistics or "").split(";")
+                      if statistic.strip()]
+        return crops, statistics
+
+    @staticmethod
+    def crops_manifest(args) -> OutputManifest:
+        crops, statistics = NassQuickStatsUtil.crop_statistics(args)
+        return OutputManifest(
+            output=args.output,
+            tool_file=__file__,
+            params={
+                "operation": "crops",
+                "format": str(NassQuickStatsUtil.response_format(args)),
+                "commodities": crops,
+                "statistics": [str(statistic) for statistic in statistics],
+                "search_conditions": sorted(args.search_conditions or [])})
+
+    @staticmethod
+    def crops(args):
+        """
+            Statistics of several crops in one wide (state_alpha, year)
+            table with a <crop>_<statistic> column each, e.g. corn_yield
+            and soybeans_acres, from as few api_GET requests as possible.
+            Each is followed by a <crop>_<statistic>_flag column with the
+            suppression code of its nulls, e.g. (D).
+        """
+        crops, statistics = NassQuickStatsUtil.crop_statistics(args)
+        if not crops or not statistics:
+            raise ValueError("--commodities and --statistics are required")
+        the_args = argparse.Namespace(**vars(args))
+        the_args.search_conditions = NassQuickStatsCrops.search_conditions(
+            crops=crops, statistics=statistics,
+            search_conditions=args.search_conditions)
+        manifest = NassQuickStatsUtil.crops_manifest(args)
+        if NassQuickStatsUtil.is_current(
+                args=args, manifest=manifest,
+                search_conditions=the_args.search_conditions):
+            print(f"{args.output} is up to date")
+            return
+        # yields have decimals, so all statistics are float64
+        the_args.value_type = NassQuickStatsValueType.float64
+        print("getting crop statistics:", the_args.search_conditions)
+        batches = list()
+        fetched = time.time()
+        count = NassQuickStatsUtil.for_each_batch(
+            args=the_args,
+            columns=NassQuickStatsCrops.columns,
+            names=NassQuickStatsCrops.columns,
+            consume=lambda batch: batches.append(NassQuickStatsCrops.label_batch(
+                batch=batch, crops=crops, statistics=statistics)))
+        df = pa.Table.from_batches(batches).to_pandas() if batches else pd.DataFrame(
+            columns=NassQuickStatsCrops.label_columns)
+        keys = ["state_alpha", "year", "column"]
+        # batches arrive in thread order: sort so that the value kept for a
+        # duplicate is always the same, the all-practices total first
+        df = df.assign(
+            not_all_practices=df["util_practice_desc"] != "ALL UTILIZATION PRACTICES")
+        df = df.sort_values(keys + ["not_all_practices", "util_practice_desc", "Value"],
+                            kind="stable")
+        duplicated = df.duplicated(subset=keys)
+        if duplicated.any():
+            logging.warning(f"{duplicated.sum()} duplicate values, keeping the "
+                            "ALL UTILIZATION PRACTICES (or first by practice) of each")
+            df = df[~duplicated]
+        values = df.pivot(index=["state_alpha", "year"], columns="column", values="Value")
+        flags = df.pivot(index=["state_alpha", "year"], columns="column", values="flag")
+        names = [NassQuickStatsCrops.column_name(crop, statistic)
+                 for crop in crops for statistic in statistics]
+        values = values.reindex(columns=names)
+        flags = flags.reindex(columns=names)
+        flags.columns = [NassQuickStatsUtil.flag_column(name) for name in names]
+        wide = pd.concat([values, flags], axis=1)
+        wide = wide[[column for name in names
+                     for column in (name, NassQuickStatsUtil.flag_column(name))]]
+        wide = wide.sort_index().reset_index()
+        wide.columns.name = None
+        # the flags dictionary encoded as in data, also when all are null
+        schema = pa.schema(
+            [("state_alpha", pa.string()), ("year", pa.int64())]
+            + [field for name in names for field in (
+                (name, pa.float64()),
+                (NassQuickStatsUtil.flag_column(name), pa.string()))])
+        table = pa.Table.from_pandas(wide, schema=schema, preserve_index=False)
+        table = table.cast(pa.schema([
+            field.with_type(pa.dictionary(pa.int32(), pa.string()))
+            if field.name.endswith("_flag") else field
+            for field in schema]))
+        with replace_file(args.output) as tmp_file:
+            pq.write_table(table, tmp_file)
+        manifest.source = NassQuickStatsUtil.manifest_source(count, fetched)
+        manifest.write()
+
+    @staticmethod
+    def load_queries(queries_file:str, args) -> list[argparse.Namespace]:
+        """
+            Read a JSON or YAML list of queries (or {"queries": [...]}).
+            Each query uses the long option names of nass_quickstats, with
+            dashes or underscores, e.g. {"output": "...", "output-columns":
+            "year;Value", "search-conditions": ["source_desc;;SURVEY", ...]}.
+            Options not given in a query fall back to the command line.
+        """
+        with open(queries_file, "r") as f:
+            if queries_file.endswith((".yaml", ".yml")):
+                import yaml
+                queries = yaml.safe_load(f)
+            else:
+                queries = json.load(f)
+        if isinstance(queries, dict):
+            queries = queries.get("queries", [])
+        query_args = list()
+        for query in queries:
+            the_args = dict(vars(args))
+            for key, value in query.items():
+                the_args[key.lstrip("-").replace("-", "_")] = value
+            if isinstance(the_args.get("operation"), str):
+                the_args["operation"] = NassQuickStatsOperationType(the_args["operation"])
+            query_args.append(argparse.Namespace(**the_args))
+        return query_args
+
+    @staticmethod
+    def retrieve_all(args) -> bool:
+        """
+            Run the queries of args.queries concurrently, at most
+            args.workers at a time, on one shared client.
+        """
+        queries = NassQuickStatsUtil.load_queries(
+            queries_file=args.queries, args=args)
+        def run_query(query_args):
+            try:
+                NassQuickStatsUtil.retrieve(query_args)
+                return True
+            except Exception as ee:
+                logging.error(f"Query {query_args.output or query_args.search_conditions} "
+                              f"failed: {ee!r}")
+                return False
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            statuses = list(executor.map(run_query, queries))
+        failed = [nquery for nquery, status in enumerate(statuses) if not status]
+        if failed:
+            print(f"Failed queries: {failed} of {len(queries)}")
+        return not failed
+
+
+class NassQuickStatsFormat(StrEnum):
+    """
+        Format of the api_GET response
+    """
+    json="json"
+    csv="csv"
+
+class NassQuickStatsValueType(StrEnum):
+    """
+        Type the Value field is stored as. string keeps the text as returned
+    """
+    float64="float64"
+    int64="int64"
+    string="string"
+
+class NassQuickStatsCropStatistic(StrEnum):
+    """
+        Crop statistics of the crops operation, as in bin/ag_state_crop_*.sh
+    """
+    crop_yield="yield"
+    prod="prod"
+    dollar="dollar"
+    acres="acres"
+
 class NassQuickStatsOperationType(StrEnum):
     data="data"
+    crops="crops"
     data_count="count"
     parameters="parameters"
     parameter_desc="parameter_desc"
@@ -350,6 +1280,23 @@ def get_args():
                         default=NassQuickStatsOperationType.data,
                         choices=list(NassQuickStatsOperationType),
                         metavar=[gpt.value for gpt in NassQuickStatsOperationType])
+    cmd_nass.add_argument("--format",
+                        dest="format",
+                        type=NassQuickStatsFormat,
+                        default=NassQuickStatsFormat.json,
+                        choices=list(NassQuickStatsFormat),
+                        metavar=[gpt.value for gpt in NassQuickStatsFormat],
+                        help="Format of the data responses. csv is smaller and "
+                        "parsed by pyarrow.csv. Default = json")
+    cmd_nass.add_argument("--value-type",
+                        dest="value_type",
+                        type=NassQuickStatsValueType,
+                        default=NassQuickStatsValueType.float64,
+                        choices=list(NassQuickStatsValueType),
+                        metavar=[gpt.value for gpt in NassQuickStatsValueType],
+                        help="Type of the Value column. Suppression codes such as (D), "
+                        "other text and, for int64, fractions become nulls, kept in a "
+                        "<value>_flag column. Default = float64")
     cmd_nass.add_argument("--parameter",
                           dest="parameter",
                           type=str)
@@ -365,6 +1312,59 @@ def get_args():
                           dest="search_conditions",
                           type=str,
                           nargs="*")
+    cmd_nass.add_argument("--commodities",
+                          dest="commodities",
+                          type=str,
+                          help="crops operation: crops separated by semicolon, e.g. \"corn;soybeans\"")
+    cmd_nass.add_argument("--statistics",
+                          dest="statistics",
+                          type=str,
+                          default=";".join(gpt.value for gpt in NassQuickStatsCropStatistic),
+                          help="crops operation: statistics separated by semicolon, of "
+                          f"{[gpt.value for gpt in NassQuickStatsCropStatistic]}. Default = all")
+    cmd_nass.add_argument("--queries",
+                          dest="queries",
+                          type=str,
+                          help="JSON or YAML file with a list of queries to run in one "
+                          "process. Each query uses the long option names above.")
+    cmd_nass.add_argument("--cache-dir",
+                          dest="cache_dir",
+                          type=str,
+                          default="~/.cache/ag-climate-toolkit/quickstats",
+                          help="Directory of the QuickStats response cache.")
+    cmd_nass.add_argument("--no-cache",
+                          dest="no_cache",
+                          action="store_true",
+                          help="Always download, do not read or write the cache.")
+    cmd_nass.add_argument("--cache-ttl-hours",
+                          dest="cache_ttl_hours",
+                          type=float,
+                          default=7*24,
+                          help="Age after which a cached response, or the output "
+                          "of data and crops, is revalidated with get_counts. "
+                          "0 = never. Default = 168")
+    cmd_nass.add_argument("--cache-max-mb",
+                          dest="cache_max_mb",
+                          type=float,
+                          default=1024,
+                          help="Size limit of the cache, least recently used entries "
+                          "are evicted first. Default = 1024")
+    cmd_nass.add_argument("--workers",
+                          dest="workers",
+                          type=int,
+                          default=4,
+                          help="Number of queries, or parts of a query too large for "
+                          "one request, running concurrently. Default = 4")
+    cmd_nass.add_argument("--batch-rows",
+                          dest="batch_rows",
+                          type=int,
+                          default=65536,
+                          help="Rows per Parquet write; bounds the records held in "
+                          "memory per running query. Default = 65536")
+    cmd_nass.add_argument("--force",
+                          dest="force",
+                          action="store_true",
+                          help="Fetch the data even if the output is up to date.")
     args = parser.parse_args()
     return args
 
@@ -372,6 +1372,8 @@ def agstats_main()->bool:
     args = get_args()
     print("args=", args)
     if args.source == 'nass_quickstats':
+        if args.queries:
+            return NassQuickStatsUtil.retrieve_all(args)
         NassQuickStatsUtil.retrieve(args)
     return True
 
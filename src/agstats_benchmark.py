@@ -0,0 +1,130 @@
+"""
+    Module
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+from agstats import NassQuickStatsFormat, NassQuickStatsUtil
+
+class NassQuickStatsBenchmark:
+    """
+        Time the JSON and the CSV api_GET paths of agstats.py on recorded
+        responses: from the response file to the Parquet output, with the
+        same column selection. A recorded response is any saved api_GET
+        body, e.g. a <key>.data file of the QuickStats response cache.
+    """
+    @staticmethod
+    def json_to_csv_fixture(json_fixture:str, csv_fixture:str) -> None:
+        with open(json_fixture, "rb") as f:
+            records = list(NassQuickStatsUtil.iter_records(f))
+        pv.write_csv(pa.Table.from_pylist(records), csv_fixture)
+
+    @staticmethod
+    def run_once(fixture:str, response_format:NassQuickStatsFormat,
+                 columns:list[str], names:list[str], batch_rows:int,
+                 output:str) -> float:
+        start = time.perf_counter()
+        with open(fixture, "rb") as f:
+            NassQuickStatsUtil.write_batches(
+                batches=NassQuickStatsUtil.response_batches(
+                    data_file=f,
+                    response_format=response_format,
+                    columns=columns, names=names, batch_rows=batch_rows),
+                output=output,
+                names=names)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def run(args) -> dict:
+        columns = args.output_columns.split(";") if args.output_columns else []
+        names = (args.output_column_names.split(";")
+                 if args.output_column_names else columns)
+        results = dict()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fixtures = {NassQuickStatsFormat.json: args.json_fixture,
+                        NassQuickStatsFormat.csv: args.csv_fixture}
+            if not fixtures[NassQuickStatsFormat.csv]:
+                fixtures[NassQuickStatsFormat.csv] = os.path.join(tmp_dir, "fixture.csv")
+                NassQuickStatsBenchmark.json_to_csv_fixture(
+                    json_fixture=args.json_fixture,
+                    csv_fixture=fixtures[NassQuickStatsFormat.csv])
+            for response_format, fixture in fixtures.items():
+                output = os.path.join(tmp_dir, f"{response_format.value}.parquet")
+                elapsed = [NassQuickStatsBenchmark.run_once(
+                               fixture=fixture,
+                               response_format=response_format,
+                               columns=columns, names=names,
+                               batch_rows=args.batch_rows,
+                               output=output)
+                           for _ in range(max(1, args.repeat))]
+                results[response_format.value] = {
+                    "fixture_bytes": os.path.getsize(fixture),
+                    "rows": pq.read_metadata(output).num_rows,
+                    "best": min(elapsed),
+                    "median": statistics.median(elapsed)}
+        return results
+
+    @staticmethod
+    def print_results(results:dict) -> None:
+        print(f"{'format':<8}{'MB':>10}{'rows':>12}{'best s':>10}{'median s':>10}")
+        for response_format, result in results.items():
+            print(f"{response_format:<8}{result['fixture_bytes']/1e6:>10.2f}"
+                  f"{result['rows']:>12}{result['best']:>10.3f}{result['median']:>10.3f}")
+        json_result = results[NassQuickStatsFormat.json.value]
+        csv_result = results[NassQuickStatsFormat.csv.value]
+        print(f"csv speedup: {json_result['median']/csv_result['median']:.1f}x, "
+              f"size: {csv_result['fixture_bytes']/json_result['fixture_bytes']:.0%} of json")
+
+#--------main-----------
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the JSON and CSV QuickStats data paths"
+    )
+    parser.add_argument("--json-fixture",
+                        dest="json_fixture",
+                        type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             "..", "tests", "fixtures",
+                                             "quickstats_api_get.json"),
+                        help="Recorded JSON api_GET response. Default = the 600 "
+                        "county yields of tests/fixtures/quickstats_api_get.json")
+    parser.add_argument("--csv-fixture",
+                        dest="csv_fixture",
+                        type=str,
+                        help="Recorded CSV api_GET response of the same query. "
+                        "Made from the JSON fixture if not given.")
+    parser.add_argument("--output-columns",
+                        dest="output_columns",
+                        type=str,
+                        default="year;Value",
+                        help="List of selected fields separated by semicolon")
+    parser.add_argument("--output-column-names",
+                        dest="output_column_names",
+                        type=str,
+                        help="List of corresponding field names separated by semicolon")
+    parser.add_argument("--batch-rows",
+                        dest="batch_rows",
+                        type=int,
+                        default=65536)
+    parser.add_argument("--repeat",
+                        dest="repeat",
+                        type=int,
+                        default=5)
+    args = parser.parse_args()
+    return args
+
+def benchmark_main()->bool:
+    args = get_args()
+    NassQuickStatsBenchmark.print_results(NassQuickStatsBenchmark.run(args))
+    return True
+
+if __name__ == "__main__":
+    if not benchmark_main():
+        print("Failed.")
+    else:
+        print("Success!")
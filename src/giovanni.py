@@ -6,18 +6,35 @@ import maya
 import calendar
 import time
 import logging
+import queue
+import random
+import threading
 import urllib
+import urllib.parse
 import pandas as pd
 import io
+import csv
+import difflib
+import functools
 import json
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import requests
+import requests.adapters
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.csv as pv
 import pyarrow.parquet as pq
-from http.cookiejar import CookieJar
+from http.cookiejar import LWPCookieJar
+from manifest import OutputManifest, atomic_write, replace_file
 from enum import StrEnum
 from selenium import webdriver
 from selenium.common.exceptions import (
-    TimeoutException, NoSuchElementException, ElementNotVisibleException, ElementNotSelectableException
+    TimeoutException, NoSuchElementException, ElementNotVisibleException, ElementNotSelectableException,
+    WebDriverException
 )
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
@@ -116,6 +133,474 @@ class GiovanniShapeGroups(StrEnum):
         return None
 
 
+class GiovanniBackends(StrEnum):
+    """
+        selenium - drive the Giovanni web portal with Chrome
+        http - submit requests straight to the Giovanni service (no browser)
+    """
+    selenium = "selenium"
+    http = "http"
+
+
+def timed_step(func):
+    """
+        Record a Giovanni step as a span in self.step_timings:
+            {"step", "start", "elapsed", "status", "depth", "bytes", "rows"}
+        start is the wall clock time, elapsed is in seconds, depth counts
+        the enclosing spans. The step adds its bytes and rows with
+        self.count_step(). A step that raises or returns a falsy value
+        other than None (False, no URLs) has the "error" status.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        span = {
+            "step": func.__name__,
+            "start": time.time(),
+            "elapsed": None,
+            "status": "error",
+            "depth": len(self.open_steps),
+            "bytes": None,
+            "rows": None}
+        self.open_steps.append(span)
+        start = time.perf_counter()
+        try:
+            result = func(self, *args, **kwargs)
+            if result is None or result:
+                span["status"] = "ok"
+            return result
+        finally:
+            span["elapsed"] = time.perf_counter() - start
+            self.open_steps.pop()
+            self.step_timings.append(span)
+    return wrapper
+
+
+class GiovanniVariableCatalog:
+    """
+        Local catalog of Giovanni variables with a keyword index.
+
+        Each variable keeps its ID (e.g. M2TMNXFLX_5_12_4_PRECTOT), long name,
+        product short name (e.g. M2TMNXFLX), units and temporal coverage.
+        Keywords resolve to an ID through an inverted index instead of the
+        portal's faceted search. The catalog is loaded from and saved to
+        catalog_file, and refresh() rebuilds it from the Giovanni catalog
+        service (Solr select API).
+    """
+    catalog_path = "/daac-bin/aesir_proxy.pl/solr/select/"
+    solr_fields = {
+        "dataFieldId": "id",
+        "dataFieldLongName": "long_name",
+        "dataProductShortName": "product",
+        "dataFieldUnits": "units",
+        "dataProductBeginDateTime": "start",
+        "dataProductEndDateTime": "end"}
+
+    def __init__(self, catalog_file:str=None) -> None:
+        self.catalog_file = None
+        if catalog_file:
+            self.catalog_file = os.path.expanduser(catalog_file)
+        self.variables = dict()
+        self.index = dict()
+        self._lock = threading.Lock()
+        if self.catalog_file and os.path.exists(self.catalog_file):
+            with open(self.catalog_file, "r") as f:
+                self._add_entries(json.load(f).get("variables", []))
+
+    @staticmethod
+    def _tokens(text:str) -> set[str]:
+        return set(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+    def _add_entries(self, entries:list[dict]) -> None:
+        for entry in entries:
+            var_id = entry.get("id")
+            if not var_id:
+                continue
+            self.variables[var_id] = entry
+            tokens = {var_id.lower()}
+            for key in ("id", "long_name", "product", "units"):
+                tokens |= self._tokens(entry.get(key) or "")
+            for token in tokens:
+                self.index.setdefault(token, set()).add(var_id)
+
+    def add(self, docs:list[dict]) -> None:
+        """
+            Add Solr documents of the Giovanni catalog service.
+        """
+        entries = list()
+        for doc in docs:
+            entry = dict()
+            for solr_field, key in self.solr_fields.items():
+                value = doc.get(solr_field)
+                if isinstance(value, list):
+                    value = value[0] if value else None
+                entry[key] = value
+            entries.append(entry)
+        with self._lock:
+            self._add_entries(entries)
+
+    def search(self, keywords:str) -> list[dict]:
+        """
+            Variables matching every keyword, sorted by long name like the
+            portal's variable table.
+        """
+        tokens = self._tokens(keywords)
+        if not tokens:
+            return []
+        with self._lock:
+            matches = None
+            for token in tokens:
+                ids = self.index.get(token, set())
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    return []
+            entries = [self.variables[var_id] for var_id in matches]
+        return sorted(entries, key=lambda entry: (entry.get("long_name") or "",
+                                                  entry["id"]))
+
+    def resolve(self, keywords:str) -> (str | None):
+        if keywords in self.variables:
+            return keywords
+        entries = self.search(keywords)
+        if not entries:
+            return None
+        return entries[0]["id"]
+
+    def refresh(self, session:requests.Session,
+                giovanni_root:str,
+                rows:int=1000,
+                timeout:float=60.0) -> int:
+        """
+            Rebuild the catalog from the Giovanni catalog service.
+            Returns the number of variables.
+        """
+        docs = list()
+        start = 0
+        while True:
+            response = session.get(
+                giovanni_root.rstrip("/") + self.catalog_path,
+                params={"q": "*:*", "wt": "json", "rows": rows, "start": start,
+                        "fl": ",".join(self.solr_fields)},
+                timeout=timeout)
+            response.raise_for_status()
+            page = response.json().get("response", {})
+            page_docs = page.get("docs", [])
+            docs.extend(page_docs)
+            start += len(page_docs)
+            if not page_docs or start >= page.get("numFound", 0):
+                break
+        with self._lock:
+            self.variables = dict()
+            self.index = dict()
+        self.add(docs)
+        self.save()
+        return len(self.variables)
+
+    def save(self) -> None:
+        if not self.catalog_file:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.catalog_file) or ".", exist_ok=True)
+            with atomic_write(self.catalog_file) as f:
+                json.dump({"updated": time.time(),
+                           "variables": list(self.variables.values())}, f)
+
+
+class GiovanniShapeCatalog:
+    """
+        Local catalog of the Giovanni shapes of each GiovanniShapeGroups
+        group, e.g. "US States" -> {"Indiana": "tl_2014_us_state/shp_13"}.
+
+        lookup() takes a shape string with or without the group prefix and
+        falls back to a case-insensitive match of the name; close names are
+        only suggested in a warning. The catalog is loaded from and saved to
+        catalog_file. refresh() rebuilds it from the Giovanni shape service.
+    """
+    shape_path = "/daac-bin/getProvisionedShapefiles.py"
+
+    def __init__(self, catalog_file:str=None) -> None:
+        self.catalog_file = None
+        if catalog_file:
+            self.catalog_file = os.path.expanduser(catalog_file)
+        self.shapes = dict()
+        self._lock = threading.Lock()
+        if self.catalog_file and os.path.exists(self.catalog_file):
+            with open(self.catalog_file, "r") as f:
+                self.shapes = json.load(f).get("shapes", {})
+
+    def add(self, shape_group:GiovanniShapeGroups, shape_name:str,
+            shape_id:str=None) -> None:
+        with self._lock:
+            group_shapes = self.shapes.setdefault(shape_group.value, dict())
+            if shape_id or shape_name not in group_shapes:
+                group_shapes[shape_name] = shape_id
+
+    def has_group(self, shape_group:GiovanniShapeGroups) -> bool:
+        return bool(self.shapes.get(shape_group.value))
+
+    def lookup(self, shape_str:str) -> (tuple | None):
+        """
+            Returns (shape_group, shape_name, shape_id) or None.
+        """
+        if not shape_str:
+            return None
+        shape_group = GiovanniShapeGroups.from_shape_string(shape_str)
+        if shape_group:
+            shape_name = shape_str[len(shape_group.value)+1:]
+            groups = [shape_group.value]
+        else:
+            shape_name = shape_str
+            groups = list(self.shapes)
+        with self._lock:
+            candidates = [
+                (group, name, shape_id)
+                for group in groups
+                for name, shape_id in self.shapes.get(group, {}).items()]
+        for match in (lambda name: name == shape_name,
+                      lambda name: name.lower() == shape_name.lower()):
+            for group, name, shape_id in candidates:
+                if match(name):
+                    return (GiovanniShapeGroups(group), name, shape_id)
+        # no fuzzy match: "Kansas" must not become "Arkansas"
+        close = difflib.get_close_matches(
+            shape_name.lower(), [name.lower() for _, name, _ in candidates],
+            n=3, cutoff=0.8)
+        if close:
+            logging.warning(f"Shape '{shape_str}' not found, did you mean "
+                            f"{', '.join(close)}?")
+        return None
+
+    def refresh(self, session:requests.Session,
+                giovanni_root:str,
+                timeout:float=60.0) -> int:
+        """
+            Rebuild the catalog from the Giovanni shape service:
+                {"available": {<shapefile>: {"title": <group>,
+                 "shapes": [{"name": .., "id": ..}, ...]}}}
+            Returns the number of shapes.
+        """
+        response = session.get(
+            giovanni_root.rstrip("/") + self.shape_path, timeout=timeout)
+        response.raise_for_status()
+        shapes = dict()
+        for shapefile, shape_info in response.json().get("available", {}).items():
+            group_shapes = shapes.setdefault(shape_info.get("title"), dict())
+            for shape in shape_info.get("shapes", []):
+                group_shapes[shape.get("name")] = f"{shapefile}/{shape.get('id')}"
+        with self._lock:
+            self.shapes = shapes
+        self.save()
+        return sum(len(group_shapes) for group_shapes in shapes.values())
+
+    def save(self) -> None:
+        if not self.catalog_file:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.catalog_file) or ".", exist_ok=True)
+            with atomic_write(self.catalog_file) as f:
+                json.dump({"updated": time.time(), "shapes": self.shapes}, f)
+
+
+class EarthdataSession(requests.Session):
+    """
+        Keep-alive HTTP session authenticated with Earthdata Login (URS).
+
+        The URS redirect and login happen once; after that the session
+        cookies are sent with every request over pooled connections. With a
+        cookie_file the cookies are kept on disk between runs. The file is
+        ignored once it is older than cookie_max_age seconds, and expired
+        cookies are dropped when it is loaded. An Earthdata bearer token can
+        be used in place of (or in addition to) user name and password.
+
+        Use EarthdataSession.shared() so that concurrent downloads, e.g. from
+        the workers of a GiovanniWorkerPool, share one authenticated session.
+    """
+    auth_host = "urs.earthdata.nasa.gov"
+    _shared_sessions = dict()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, user_name:str=None, password:str=None,
+                 token:str=None,
+                 cookie_file:str=None,
+                 cookie_max_age:float=24*3600,
+                 pool_maxsize:int=10) -> None:
+        super().__init__()
+        if user_name and password:
+            self.auth = (user_name, password)
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_maxsize,
+            pool_maxsize=pool_maxsize)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.cookie_file = None
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+        if cookie_file:
+            self.cookie_file = os.path.expanduser(cookie_file)
+            self.cookies = LWPCookieJar(self.cookie_file)
+            self._load_cookies(cookie_max_age=cookie_max_age)
+
+    @classmethod
+    def shared(cls, user_name:str=None, password:str=None,
+               token:str=None, cookie_file:str=None) -> "EarthdataSession":
+        key = (user_name, token, cookie_file)
+        with cls._shared_lock:
+            session = cls._shared_sessions.get(key)
+            if session is None:
+                session = cls(user_name=user_name, password=password,
+                              token=token, cookie_file=cookie_file)
+                cls._shared_sessions[key] = session
+            return session
+
+    def _load_cookies(self, cookie_max_age:float) -> None:
+        if not os.path.exists(self.cookie_file):
+            return
+        if time.time() - os.path.getmtime(self.cookie_file) > cookie_max_age:
+            logging.info("Earthdata cookie file is stale: "+self.cookie_file)
+            return
+        try:
+            self.cookies.load(ignore_discard=True)
+        except OSError as ee:
+            logging.error("Loading Earthdata cookies: "+repr(ee))
+
+    def save_cookies(self) -> None:
+        if not self.cookie_file:
+            return
+        with self._lock:
+            self.cookies.save(ignore_discard=True)
+
+    def rebuild_auth(self, prepared_request, response):
+        """
+            Keep the credentials on redirects to and from Earthdata Login,
+            drop them for any other host change.
+        """
+        headers = prepared_request.headers
+        url_str = prepared_request.url
+        if "Authorization" in headers:
+            original_host = urllib.parse.urlparse(response.request.url).hostname
+            redirect_host = urllib.parse.urlparse(url_str).hostname
+            if (original_host != redirect_host
+                and redirect_host != self.auth_host
+                and original_host != self.auth_host):
+                del headers["Authorization"]
+
+    def download(self, url_str:str, timeout:float=300.0) -> bytes:
+        response = self.get(url_str, timeout=timeout)
+        response.raise_for_status()
+        self.save_cookies()
+        return response.content
+
+    def download_to_file(self, url_str:str, file_path:str,
+                         timeout:float=300.0,
+                         chunk_size:int=1024*1024,
+                         max_retries:int=5) -> int:
+        """
+            Stream url_str to file_path in chunks. If the connection drops,
+            the download resumes from the last byte written with an HTTP
+            Range request. The validator of the first response (a strong
+            ETag or Last-Modified) is kept in <file_path>.part.json and sent
+            as If-Range, so a changed file is fetched whole again; without
+            a validator, on 416 or when the server answers from another
+            offset the download restarts from byte 0.
+
+            Returns the number of bytes in the file.
+        """
+        part_path = file_path + ".part"
+        meta_path = part_path + ".json"
+        written = 0
+        validator = None
+        if os.path.exists(part_path):
+            written = os.path.getsize(part_path)
+            validator = self._part_validator(meta_path, url_str)
+        nretries = 0
+        while True:
+            headers = dict()
+            if written > 0 and validator:
+                headers["Range"] = f"bytes={written}-"
+                headers["If-Range"] = validator
+            else:
+                written = 0
+            try:
+                with self.get(url_str, headers=headers, stream=True,
+                              timeout=timeout) as response:
+                    if response.status_code == 416 and written > 0:
+                        logging.warning(f"Range from {written} not satisfiable, "
+                                        f"restarting {url_str}")
+                        written = 0
+                        continue
+                    response.raise_for_status()
+                    if written > 0 and not self._resumes_at(response, written):
+                        written = 0
+                    if written == 0:
+                        validator = self._response_validator(response)
+                        with atomic_write(meta_path) as f:
+                            json.dump({"url": url_str, "validator": validator}, f)
+                    mode = "ab" if written > 0 else "wb"
+                    total = response.headers.get("Content-Length")
+                    if total is not None:
+                        total = int(total) + written
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            f.write(chunk)
+                            written += len(chunk)
+                            self._count_bytes(len(chunk))
+                            logging.debug(f"Downloaded {written}"
+                                          f"{'/'+str(total) if total else ''} bytes "
+                                          f"of {url_str}")
+                break
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as ee:
+                nretries += 1
+                if nretries > max_retries:
+                    raise
+                logging.warning(f"Download interrupted at {written} bytes, "
+                                f"resuming ({nretries}/{max_retries}): {ee!r}")
+                if os.path.exists(part_path):
+                    written = os.path.getsize(part_path)
+        os.replace(part_path, file_path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        self.save_cookies()
+        return written
+
+    @staticmethod
+    def _part_validator(meta_path:str, url_str:str) -> (str | None):
+        """
+            The validator saved with a .part file of url_str, if any.
+        """
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url_str:
+            return None
+        return meta.get("validator")
+
+    @staticmethod
+    def _response_validator(response:requests.Response) -> (str | None):
+        # If-Range takes a strong ETag or a date
+        etag = response.headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return response.headers.get("Last-Modified")
+
+    @staticmethod
+    def _resumes_at(response:requests.Response, written:int) -> bool:
+        """
+            A 206 response whose Content-Range starts at byte written.
+        """
+        if response.status_code != 206:
+            return False
+        match = re.match(r"bytes\s+(\d+)-", response.headers.get("Content-Range", ""))
+        return match is not None and int(match.group(1)) == written
+
+    def _count_bytes(self, nbytes:int) -> None:
+        with self._lock:
+            self.bytes_downloaded += nbytes
+
 
 class Giovanni:
     """
@@ -169,11 +654,24 @@ class Giovanni:
         
         driver.quit()
     """
-    def __init__(self, user_name=None, password=None) -> None:
-        self.giovanni_root = "https://giovanni.gsfc.nasa.gov/giovanni"
+    wait_poll_frequency = 0.1
+    default_root = "https://giovanni.gsfc.nasa.gov/giovanni"
+
+    def __init__(self, user_name=None, password=None,
+                 headless:bool=False,
+                 earthdata_cookie_file:str=None,
+                 variable_catalog:GiovanniVariableCatalog=None,
+                 shape_catalog:GiovanniShapeCatalog=None) -> None:
+        self.giovanni_root = self.default_root
+        self.variable_catalog = variable_catalog
+        self.shape_catalog = shape_catalog
         self.user_name = user_name
         self.password = password
+        self.headless = headless
+        self.earthdata_cookie_file = earthdata_cookie_file
         self.driver = None
+        self.step_timings = list()
+        self.open_steps = list()
     
     def __enter__(self):
         self._init_driver()
@@ -182,12 +680,46 @@ class Giovanni:
             password=self.password)
         return self
 
+    @timed_step
     def _init_driver(self) -> None:
-        self.driver = webdriver.Chrome() #.Firefox()
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument("--headless=new")
+            options.add_argument("--window-size=1920,1080")
+        self.driver = webdriver.Chrome(options=options) #.Firefox()
         self.driver.get(self.giovanni_root)
         # implicit waiting - switch to explicit time wait?
         #self.driver.implicitly_wait(5)
 
+    def _wait(self, timeout:float, driver=None) -> WebDriverWait:
+        """
+            Condition-based wait with a short polling interval.
+        """
+        if driver is None:
+            driver = self.driver
+        return WebDriverWait(driver=driver, timeout=timeout,
+                             poll_frequency=self.wait_poll_frequency)
+
+    def count_step(self, nbytes:int=None, nrows:int=None) -> None:
+        """
+            Add the bytes and rows handled by the innermost running step.
+        """
+        if not self.open_steps:
+            return
+        span = self.open_steps[-1]
+        if nbytes is not None:
+            span["bytes"] = (span["bytes"] or 0) + nbytes
+        if nrows is not None:
+            span["rows"] = (span["rows"] or 0) + nrows
+
+    def pop_step_timings(self) -> list[dict]:
+        """
+            Return the step timings recorded so far and start a new report.
+        """
+        step_timings = self.step_timings
+        self.step_timings = list()
+        return step_timings
+
     def _find_button_by_label(self, label) -> (WebElement | None):
         label_pattern = f"//button[contains(text(), '{label}')]"
         elems = self.driver.find_elements(
@@ -246,7 +778,7 @@ class Giovanni:
 
     def _handle_alert(self, alert_message:str=None)->None:
         try:
-            WebDriverWait(driver=self.driver, timeout=5).until(EC.alert_is_present(), alert_message)
+            self._wait(timeout=5).until(EC.alert_is_present(), alert_message)
             alert = self.driver.switch_to.alert
             print(alert.text)
             alert.accept()
@@ -254,17 +786,25 @@ class Giovanni:
             logging.error("Handling alert '"+alert_message+"':"+repr(ee))
     
     def _detect_and_handle_alert(
-            self, alert_text:str=None)->tuple:
+            self, alert_text:str=None,
+            done_condition=None)->tuple:
         """
             Parameters:
                 alert_text(str): Expected partial text in alert message.
+                done_condition: Expected condition meaning no alert is coming,
+                    which ends the wait early.
 
             Returns: (status, alert_text)
                     status(bool): True - Got expected alert or no alert (alert_tex will be None). False - Got unexpected alert.
                     alert_text(str): Returned alert text.
         """
         try:
-            WebDriverWait(driver=self.driver, timeout=5).until(EC.alert_is_present())
+            condition = EC.alert_is_present()
+            if done_condition:
+                condition = EC.any_of(condition, done_condition)
+            result = self._wait(timeout=5).until(condition)
+            if not isinstance(result, Alert):
+                return (True, None)
             alert = self.driver.switch_to.alert
             alert_msg = alert.text
             alert.accept()
@@ -295,47 +835,35 @@ class Giovanni:
             logging.error("Finding element with ID='"+value+"':"+repr(ee))
             return None
 
-    def download_from_earthdata(
-            self,url_str:str, username:str, password:str):
-        # Create a password manager to deal with the 401 reponse that is returned from
-        # Earthdata Login
-
-        password_manager = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-        password_manager.add_password(None, "https://urs.earthdata.nasa.gov", username, password)
-
-
-        # Create a cookie jar for storing cookies. This is used to store and return
-        # the session cookie given to use by the data server (otherwise it will just
-        # keep sending us back to Earthdata Login to authenticate).  Ideally, we
-        # should use a file based cookie jar to preserve cookies between runs. This
-        # will make it much more efficient.
-
-        cookie_jar = CookieJar()
-
-
-        # Install all the handlers.
-
-        opener = urllib.request.build_opener(
-            urllib.request.HTTPBasicAuthHandler(password_manager),
-            #urllib.request.HTTPHandler(debuglevel=1),    # Uncomment these two lines to see
-            #urllib.request.HTTPSHandler(debuglevel=1),   # details of the requests/responses
-            urllib.request.HTTPCookieProcessor(cookie_jar))
-        urllib.request.install_opener(opener)
-
-
-        # Create and submit the request. There are a wide range of exceptions that
-        # can be thrown here, including HTTPError and URLError. These should be
-        # caught and handled.
-
-        request = urllib.request.Request(url_str)
-        response = urllib.request.urlopen(request)
-
-
-        # Print out the result (not a good idea with binary data!)
-
-        body = response.read()
-        return body
+    def _get_earthdata_session(
+            self, username:str=None, password:str=None) -> EarthdataSession:
+        return EarthdataSession.shared(
+            user_name=username or self.user_name,
+            password=password or self.password,
+            cookie_file=self.earthdata_cookie_file)
 
+    @timed_step
+    def download_from_earthdata(
+            self,url_str:str, username:str, password:str,
+            to_file:str=None):
+        """
+            Returns the body as bytes, or streams it to to_file and returns
+            the file path when to_file is given.
+        """
+        # The shared session keeps the Earthdata Login cookies (on disk too,
+        # with earthdata_cookie_file), so the URS redirect and login happen
+        # once instead of on every download.
+        session = self._get_earthdata_session(
+            username=username, password=password)
+        if to_file:
+            self.count_step(
+                nbytes=session.download_to_file(url_str, file_path=to_file))
+            return to_file
+        content = session.download(url_str)
+        self.count_step(nbytes=len(content))
+        return content
+
+    @timed_step
     def logout(self) -> bool:
         elem = self.driver.find_element(
             by=By.ID, value="logoutLink"
@@ -348,7 +876,7 @@ class Giovanni:
             EC.presence_of_element_located((By.ID, "username")),
             EC.presence_of_element_located((By.ID, "password"))
         ]
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.all_of(*conditions))
         elem1=self._find_element_by_atribute(
             tag="a", attribute="href",
@@ -358,6 +886,7 @@ class Giovanni:
         elem1.click()
         return True
 
+    @timed_step
     def login(self, user_name, password) -> bool:
         """
             Log in Eaethdata
@@ -376,12 +905,12 @@ class Giovanni:
         #visibility check of overlappying progressbar
         elem = self._find_element_by_id("progressModal")
         if elem:
-            WebDriverWait(driver=self.driver, timeout=30).until(
+            self._wait(timeout=30).until(
                 EC.invisibility_of_element((By.ID, 'progressModal')))
 
         #print(self.driver.page_source)
         # wait for 'loginButton' or 'loginLink'
-        WebDriverWait(driver=self.driver, timeout=30).until(
+        self._wait(timeout=30).until(
             EC.element_to_be_clickable((By.ID, 'loginButton')))
         # Find login button and click it
         elem = self._find_element_by_id(value="loginButton")
@@ -395,7 +924,7 @@ class Giovanni:
             EC.presence_of_element_located((By.ID, "password")),
             EC.presence_of_element_located((By.ID,"stay_in"))
         ]
-        WebDriverWait(driver=self.driver, timeout=30).until(
+        self._wait(timeout=30).until(
             EC.all_of(*conditions))
         #Fill username
         #elem = self._find_input_field_after_label("Username")
@@ -427,10 +956,10 @@ class Giovanni:
         else:
             logging.error("'LOG IN' element may not be visible. ")
             return False
-        WebDriverWait(driver=self.driver, timeout=50).until(
+        self._wait(timeout=50).until(
             EC.invisibility_of_element((By.ID, 'progressModal')))
         #time.sleep(3)
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.visibility_of_element_located((By.ID, 'loginButton')))
 
         #self._print_input_field()
@@ -446,13 +975,13 @@ class Giovanni:
  
         return True
 
+    @timed_step
     def select_plot_type(self, 
                     plot_type:GiovanniPlotTypes=GiovanniPlotTypes.ArAvTs)->bool:
-        WebDriverWait(driver=self.driver,
-                      timeout=20).until(
+        self._wait(timeout=20).until(
                           EC.invisibility_of_element((By.ID, "progressModal"))
                       )
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.element_to_be_clickable((By.ID, 'serviceSelect-button')))
         elem = self.driver.find_element(
             by=By.ID,
@@ -461,7 +990,7 @@ class Giovanni:
         if not elem:
             return False
         elem.click()
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.presence_of_element_located((By.ID, plot_type.name)))
         elem = self.driver.find_element(
             By.ID,
@@ -472,11 +1001,12 @@ class Giovanni:
         elem.click()
         return True
 
+    @timed_step
     def select_plot_start_date(
             self,
             start_date:maya.MayaDT)->bool:
         #main_window = self.driver.current_window_handle
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.element_to_be_clickable((By.CSS_SELECTOR, '#startDateCalendarLink > .fa')))
         #'startDateCalendarLink')))
         elem = self.driver.find_element(
@@ -485,7 +1015,9 @@ class Giovanni:
         )
         if not elem:
             return False
-        time.sleep(5)
+        # the calendar link is clickable before the plot type reload is done
+        self._wait(timeout=20).until(
+            EC.invisibility_of_element((By.ID, "progressModal")))
         #elem.click()
         ActionChains(self.driver).move_to_element(
             elem
@@ -499,8 +1031,7 @@ class Giovanni:
         #    print(elem.get_attribute("innerHTML"))
 
         # set year
-        WebDriverWait(driver=self.driver,
-                      timeout=30).until(
+        self._wait(timeout=30).until(
                           EC.presence_of_element_located((By.ID, "startDateCalendar_t"))
                       )
         elem0 = self.driver.find_element(
@@ -533,8 +1064,7 @@ class Giovanni:
         #if not elem:
         #    return False
         #elem.click()
-        WebDriverWait(driver=self.driver,
-                      timeout=30).until(
+        self._wait(timeout=30).until(
                           EC.presence_of_element_located((By.ID, "startDateCalendar_t"))
                       )
         elem0 = self.driver.find_element(
@@ -558,7 +1088,7 @@ class Giovanni:
         # day
         # wait condition - dall_cell_str should occcur whhich may not be the one retrieved
         day_cell_str = 'startDateCalendar_t_cell'+str(start_date.day)
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.presence_of_element_located((By.ID, day_cell_str)))
         #elem = self.driver.find_element(
         #    By.ID,
@@ -580,10 +1110,11 @@ class Giovanni:
 
         return True
 
+    @timed_step
     def select_plot_end_date(
             self,
             end_date:maya.MayaDT)->bool:
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.element_to_be_clickable((By.CSS_SELECTOR, '#endDateCalendarLink > .fa')))
         #'startDateCalendarLink')))
         elem = self.driver.find_element(
@@ -618,8 +1149,7 @@ class Giovanni:
         #for elem in elems:
         #    print(elem.get_attribute("innerHTML"))
         # set year
-        WebDriverWait(driver=self.driver,
-                      timeout=30).until(
+        self._wait(timeout=30).until(
                           EC.presence_of_element_located((By.ID, "endDateCalendar_t"))
                       )
         elem0 = self.driver.find_element(
@@ -656,8 +1186,7 @@ class Giovanni:
         sel_endyear.select_by_visible_text(year_str)
 
         #print(self.driver.page_source)
-        WebDriverWait(driver=self.driver,
-                      timeout=30).until(
+        self._wait(timeout=30).until(
                           EC.presence_of_element_located((By.ID, "endDateCalendar_t"))
                       )
         elem0 = self.driver.find_element(
@@ -693,7 +1222,7 @@ class Giovanni:
         # day
         # wait condition - dall_cell_str should occcur whhich may not be the one retrieved
         day_cell_str = 'endDateCalendar_t_cell'+str(end_date.day)
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.presence_of_element_located((By.ID, day_cell_str)))
         #elem = self.driver.find_element(
         #    By.ID,
@@ -714,6 +1243,7 @@ class Giovanni:
 
         return True
 
+    @timed_step
     def select_plot_area_by_bbox(
             self, bbox_str=None)->bool:
         if not bbox_str:
@@ -745,6 +1275,7 @@ class Giovanni:
         elem.send_keys(send_value)
         return True
 
+    @timed_step
     def select_plot_area_by_shape(
             self, shape_str=None)->bool:
         """
@@ -780,6 +1311,10 @@ class Giovanni:
     def parse_shape_string(self, shape_str=None)->tuple:
         if not shape_str:
             return (None, None)
+        if self.shape_catalog:
+            found = self.shape_catalog.lookup(shape_str)
+            if found:
+                return found[0], found[1]
         group = GiovanniShapeGroups.from_shape_string(shape_str)
         if not group:
             return (None, shape_str)
@@ -788,11 +1323,19 @@ class Giovanni:
         shape_name = shape_str[group_len:]
         return group, shape_name
 
+    @timed_step
     def select_plot_area_by_shape_selector(
             self, shape_str=None)->bool:
         if not shape_str:
             return False
         shape_group, shape_name = self.parse_shape_string(shape_str=shape_str)
+        # the picker has no input for a shape ID, but an unknown shape
+        # fails here instead of after a wait in the picker
+        if (self.shape_catalog and shape_group
+            and self.shape_catalog.has_group(shape_group)
+            and not self.shape_catalog.lookup(shape_str)):
+            logging.error("Shape not found: '"+shape_str+"'")
+            return False
         #elems = self.driver.find_elements(
         #    by=By.XPATH,
         #    value="//*[contains(text(), 'Region')]/following-sibling::*"
@@ -800,7 +1343,7 @@ class Giovanni:
         #for elem in elems:
         #    print(elem.get_attribute("innerHTML"))
         main_page = self.driver.current_window_handle
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.visibility_of_element_located((By.ID, 'sessionDataSelBbPkshapeLink')))
         elem = self._find_element_by_id(value="sessionDataSelBbPkshapeLink")
         if not elem:
@@ -821,7 +1364,7 @@ class Giovanni:
             logging.error("To-Be-Programmed for searching by shape name")
             return False
         shape_group_xpath = "//span[starts-with(text(), '"+shape_group.value+"')]/preceding-sibling::span"
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.visibility_of_element_located((By.XPATH, shape_group_xpath)))
         #print(self.driver.page_source)
         elem = self.driver.find_element(
@@ -838,7 +1381,7 @@ class Giovanni:
         ActionChains(self.driver).move_to_element(elem).click().perform()
 
         shape_name_xpath = "//ul[@style='display: block;']/li[@class='select2-results__option' and text()='"+shape_name+"']"
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.presence_of_element_located((By.XPATH, shape_name_xpath)))
         elem = self.driver.find_element(
             by=By.XPATH,
@@ -869,7 +1412,7 @@ class Giovanni:
         #elem.click()
 
         #print(self.driver.page_source)
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.presence_of_element_located((By.LINK_TEXT, "Close")))
         elem = self.driver.find_element(
             by=By.LINK_TEXT,
@@ -884,9 +1427,7 @@ class Giovanni:
         return True
 
     def _scroll_down_until_elem_visible(
-            self):
-        SCROLL_PAUSE_TIME = 0.5
-
+            self, load_timeout:float=0.5):
         # Get scroll height
         last_height = self.driver.execute_script("return document.body.scrollHeight")
 
@@ -894,12 +1435,14 @@ class Giovanni:
             # Scroll down to bottom
             self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
 
-            # Wait to load page
-            time.sleep(SCROLL_PAUSE_TIME)
-
-            # Calculate new scroll height and compare with last scroll height
-            new_height = self.driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
+            # Wait for more content to load, i.e. the scroll height to grow
+            try:
+                new_height = self._wait(timeout=load_timeout).until(
+                    lambda driver: (
+                        driver.execute_script("return document.body.scrollHeight")
+                        != last_height) and
+                        driver.execute_script("return document.body.scrollHeight"))
+            except TimeoutException:
                 break
             last_height = new_height
         
@@ -936,12 +1479,40 @@ class Giovanni:
         passed_in_driver.execute_script(scroll_by_coord)
         passed_in_driver.execute_script(scroll_nav_out_of_way)
 
+    @timed_step
     def select_plot_variable_by_keywords(
             self, var_str=None)->bool:
         if not var_str:
             return False
+        if self.variable_catalog:
+            var_id = self.variable_catalog.resolve(var_str)
+            if var_id:
+                return self.select_plot_variable_by_id(var_id=var_id)
+        return self._select_first_variable_by_search(search_str=var_str)
+
+    @timed_step
+    def select_plot_variable_by_id(
+            self, var_id=None)->bool:
+        """
+            The variable ID (e.g. M2TMNXFLX_5_12_4_PRECTOT) matches a single
+            row of the variable table. The portal has no selection by ID,
+            so it still goes through the faceted search.
+        """
+        if not var_id:
+            return False
+        return self._select_first_variable_by_search(
+            search_str=var_id, var_id=var_id)
+
+    def _select_first_variable_by_search(
+            self, search_str:str, var_id:str=None)->bool:
+        """
+            Search the variable table for search_str and check the row
+            whose variable ID (var_id) or title matches. A row that is
+            already checked is left as it is, a second click unchecks it.
+        """
+        var_str = search_str
         # Fill the search with seartch_str
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.presence_of_element_located((By.ID, "facetedSearchBarInput")))
         elem = self.driver.find_element(
             by=By.ID,
@@ -949,9 +1520,11 @@ class Giovanni:
         )
         if not elem:
             return False
+        # the previous variable's search is still in the box
+        elem.clear()
         elem.send_keys(var_str)
         # click the search button
-        WebDriverWait(driver=self.driver, timeout=20).until(
+        self._wait(timeout=20).until(
             EC.presence_of_element_located((By.ID, "facetedSearchButton")))
         elem = self.driver.find_element(
             by=By.ID,
@@ -970,16 +1543,25 @@ class Giovanni:
         #for elem in elems:
         #    print(elem.get_attribute("innerHTML"))
 
-        WebDriverWait(driver=self.driver, timeout=50).until(
+        self._wait(timeout=50).until(
             EC.presence_of_element_located((By.XPATH, "//a[@href='yui-dt0-href-varName']")))
         # click Variable column to sort it ascneding
         elem = self.driver.find_element(
             by=By.XPATH,
             value="//a[@href='yui-dt0-href-varName']"
         )
+        checkbox_xpath = "//input[@type='checkbox' and starts-with(@title, 'Select ')]"
         #print(elem.get_attribute("title"))
         if (elem and elem.get_attribute("title")=="Click to sort ascending"):
+            old_elems = self.driver.find_elements(
+                by=By.XPATH, value=checkbox_xpath)
             elem.click()
+            # sorting re-renders the rows
+            if old_elems:
+                try:
+                    self._wait(timeout=10).until(EC.staleness_of(old_elems[0]))
+                except TimeoutException:
+                    pass
         #elem = self.driver.find_element(
         #    by=By.XPATH,
         #    value="//a[@href='yui-dt0-href-varName']"
@@ -1009,22 +1591,59 @@ class Giovanni:
         # value="//input[@type='checkbox' and starts-with(@title, 'Select ')]/../../.."
         # get td
         # value="//input[@type='checkbox' and starts-with(@title, 'Select ')]/../.."
-        time.sleep(1)
+        self._wait(timeout=20).until(
+            EC.element_to_be_clickable((By.XPATH, checkbox_xpath)))
         elems = self.driver.find_elements(
             by=By.XPATH,
-            value="//input[@type='checkbox' and starts-with(@title, 'Select ')]"
+            value=checkbox_xpath
         )
         #print(len(elems))
         #for elem in elems:
         #    self._print_long_element(elem=elem)
-        if (len(elems)>0):
-            elem = elems[0]
+        elem = self._match_variable_checkbox(
+            elems=elems, search_str=search_str, var_id=var_id)
+        if not elem:
+            return False
+        if not elem.is_selected():
             elem.click()
-            return True
-        return False
+        return True
 
+    def _match_variable_checkbox(
+            self, elems:list[WebElement], search_str:str,
+            var_id:str=None) -> (WebElement | None):
+        """
+            Pick the checkbox of the row matching the search. With a
+            variable ID the row must carry the ID (checkbox value or row
+            markup) or the catalog long name as its title; a keyword
+            search takes the first row whose title contains the keywords,
+            else the first row.
+        """
+        if not elems:
+            return None
+        if var_id:
+            long_name = None
+            if self.variable_catalog:
+                long_name = self.variable_catalog.variables.get(
+                    var_id, {}).get("long_name")
+            for elem in elems:
+                if elem.get_attribute("value") == var_id:
+                    return elem
+                if long_name and elem.get_attribute("title") == f"Select {long_name}":
+                    return elem
+                row = elem.find_element(by=By.XPATH, value="./ancestor::tr[1]")
+                if row and names_variable(row.get_attribute("outerHTML") or "", var_id):
+                    return elem
+            # a single hit for an exact ID is the variable itself
+            return elems[0] if len(elems)==1 else None
+        keywords = search_str.lower()
+        for elem in elems:
+            if keywords in (elem.get_attribute("title") or "").lower():
+                return elem
+        return elems[0]
+
+    @timed_step
     def plot_data(self):
-        WebDriverWait(driver=self.driver, timeout=50).until(
+        self._wait(timeout=50).until(
             EC.presence_of_element_located((By.ID, "sessionDataSelToolbarplotBTN-button")))
         elem = self.driver.find_element(
             by=By.ID,
@@ -1035,7 +1654,9 @@ class Giovanni:
         #print(elem.get_attribute("outerHTML"))
         ActionChains(self.driver).move_to_element(elem).click().perform()
         #print(self.driver.page_source)
-        alert_status, alert_text = self._detect_and_handle_alert()
+        # the progress modal shows up once the plot request is accepted
+        alert_status, alert_text = self._detect_and_handle_alert(
+            done_condition=EC.visibility_of_element_located((By.ID, "progressModal")))
         if not alert_status:
             print("Error: unexpected alert.")
             print(alert_text)
@@ -1043,7 +1664,15 @@ class Giovanni:
         return True
 
     def get_results_csv_url(self):
+        s_urls = self.get_results_csv_urls()
+        return s_urls[0] if s_urls else None
+
+    @timed_step
+    def get_results_csv_urls(self) -> list[str]:
         """
+            CSV links of the latest plot, one per plotted variable, in the
+            order Giovanni lists them. The plot is deleted afterwards.
+
             print("elem=", elem.get_attribute("outerHTML"))
             elem1 = self._find_element_by_id("progressBar")
             if elem1:
@@ -1082,10 +1711,10 @@ class Giovanni:
 
         """
         #visibility check of overlappying progressbar
-        WebDriverWait(driver=self.driver,timeout=50).until(
+        self._wait(timeout=50).until(
             EC.invisibility_of_element((By.ID,"progressModal"))
         )
-        WebDriverWait(driver=self.driver,timeout=300).until(
+        self._wait(timeout=300).until(
             EC.invisibility_of_element((By.ID,"progressBar"))
         )
         #WebDriverWait(driver=self.driver, timeout=30).until(
@@ -1095,7 +1724,7 @@ class Giovanni:
         #    value="sessionDataSelToolbarbackBTN-button"
         #)
         #if not elem:
-        #    return None
+        #    return []
         #elem.click()
 
         #Collapse History
@@ -1121,7 +1750,7 @@ class Giovanni:
 
         #sessionWorkspaceExpand button
         # Expand all
-        WebDriverWait(driver=self.driver, timeout=30).until(
+        self._wait(timeout=30).until(
             EC.presence_of_element_located((By.ID, "sessionWorkspaceExpand")))
         elem = self.driver.find_element(
             by=By.ID,
@@ -1131,7 +1760,7 @@ class Giovanni:
 
         #print(elem.get_attribute("outerHTML"))
         #get download link
-        WebDriverWait(driver=self.driver, timeout=50).until(
+        self._wait(timeout=50).until(
             EC.presence_of_element_located((By.XPATH, "//div[contains(@class, 'ygtvitem') and @id='ygtv1']/div[contains(@class,'ygtvchildren')]/div[contains(@class,'ygtvitem')]")))
         elems = self.driver.find_elements(
             by=By.XPATH,
@@ -1141,40 +1770,36 @@ class Giovanni:
         #for elem in elems:
         #    print(elem.get_attribute("outerHTML"))
         if not elems:
-            return None
+            return []
         elem = elems[0]
         
         if not elem:
-            return None
-        WebDriverWait(driver=elem, timeout=30).until(
+            return []
+        self._wait(timeout=30, driver=elem).until(
             EC.visibility_of_element_located(locator=(By.XPATH, ".//*[text()='Downloads']"))
         )
         elems = elem.find_elements(by=By.XPATH, value=".//*[text()='Downloads']")
         if not elems:
-            return None
+            return []
         elem = elems[0]
         if not elem:
-            return None
+            return []
         ActionChains(self.driver).move_to_element(elem).click().perform()
-        WebDriverWait(driver=self.driver, timeout=30).until(
+        self._wait(timeout=30).until(
             EC.visibility_of_element_located(locator=(By.LINK_TEXT, "CSV"))
         )
         elems = self.driver.find_elements(
             by=By.LINK_TEXT,
             value="CSV"
         )
-        if not elems:
-            return None
-        elem = elems[0]
-        if not elem:
-            return None
-        s_url = elem.get_attribute("href")
+        s_urls = [elem.get_attribute("href") for elem in elems]
+        s_urls = [s_url for s_url in s_urls if s_url]
         elem = self.driver.find_element(
             by=By.XPATH,
             value="//div[contains(@class, 'ygtvitem') and @id='ygtv1']/div[contains(@class,'ygtvchildren')]/div[contains(@class,'ygtvitem')]"
         )
         if not elem:
-            return None
+            return []
         #print("--------")
         #print(elem.get_attribute("outerHTML"))
         elem1 = elem.find_element(
@@ -1182,204 +1807,314 @@ class Giovanni:
             value=".//i[@title='Delete plot']"
         )
         if not elem1:
-            return None
+            return []
         ActionChains(self.driver).move_to_element(elem1).click().perform()
         self._handle_alert(alert_message="Are you sure you want to permanently delete this plot?")
-        if not s_url:
-            return None
-        print("URL=", s_url)
-        return s_url
+        print("URLs=", s_urls)
+        return s_urls
     
-    def _find_skip_index_by_keywords(
-            self, csv_content_str:str,
-            header_keyword:str=None):
-        if not header_keyword:
-            return -1
-        sio = io.StringIO(csv_content_str)
-        nline = -1
-        while line := sio.readline():
-            nline += 1
-            if header_keyword in line:
-                return nline
-        return -1
+    def _csv_buffer(self, csv_content) -> pa.Buffer:
+        """
+            csv_content is either the CSV bytes or the path of a CSV file,
+            which is memory mapped rather than read into memory.
+        """
+        if isinstance(csv_content, (bytes, bytearray)):
+            return pa.py_buffer(csv_content)
+        return pa.memory_map(csv_content, "r").read_buffer()
 
-    def save_to_csv_file(
+    def _find_header_offset(
+            self, buffer:pa.Buffer,
+            csv_skip_rows:int=-1,
+            csv_skip_signature:str=None,
+            scan_size:int=64*1024) -> tuple[int, int, bytes]:
+        """
+            Byte-level scan of the beginning of the buffer for the column
+            header line, either the line after csv_skip_rows lines or the
+            first line containing csv_skip_signature.
+
+            Returns (skip_rows, header_offset, head) where head holds the
+            bytes up to the end of the header line; (-1, 0, b"") if there
+            is nothing to skip.
+        """
+        if csv_skip_rows <= 0 and not csv_skip_signature:
+            return (-1, 0, b"")
+        size = buffer.size
+        signature = csv_skip_signature.encode("utf-8") if csv_skip_signature else None
+        while True:
+            head = buffer.slice(0, min(scan_size, size)).to_pybytes()
+            complete = len(head) >= size
+            header_offset = -1
+            if csv_skip_rows > 0:
+                header_offset = 0
+                for _ in range(csv_skip_rows):
+                    newline = head.find(b"\n", header_offset)
+                    if newline < 0:
+                        header_offset = -1
+                        break
+                    header_offset = newline + 1
+            else:
+                index = head.find(signature)
+                if index >= 0:
+                    header_offset = head.rfind(b"\n", 0, index) + 1
+            header_end = -1
+            if header_offset >= 0:
+                header_end = head.find(b"\n", header_offset)
+            if header_offset >= 0 and (header_end >= 0 or complete):
+                if header_end < 0:
+                    header_end = len(head) - 1
+                break
+            if complete:
+                return (-1, 0, b"")
+            scan_size *= 4
+        skip_rows = head.count(b"\n", 0, header_offset)
+        return (skip_rows, header_offset, head[:header_end+1])
+
+    @timed_step
+    def parse_csv_content(
             self, csv_content,
-            csv_file:str,
             csv_skip_rows:int=-1,
             csv_skip_signature:str=None,
-            csv_keep_metadata:bool=False,
             csv_sep:str=",",
             rename_column:str=None,
             rename_column_index:int=1,
-            rename_column_old_name:str=None):
-        csv_content_str = csv_content.decode('utf-8')
-        skip_rows = -1
-        if csv_skip_rows > 0:
-            skip_rows = csv_skip_rows
-        elif csv_skip_signature:
-            skip_rows = self._find_skip_index_by_keywords(
-                csv_content_str=csv_content_str,
-                header_keyword=csv_skip_signature)
-        if skip_rows>0:
-            df = pd.read_csv(io.StringIO(csv_content_str),
-                             skiprows=skip_rows,sep=csv_sep)
-        else:
-            df = pd.read_csv(io.StringIO(csv_content_str), sep=csv_sep)
-        giovanni_util_metadata = list()
+            rename_column_old_name:str=None,
+            time_column:str="time") -> dict:
+        """
+            Parse a Giovanni CSV once for all the writers.
+
+            The header is located with a byte-level scan and the data block
+            is parsed by pyarrow.csv with multiple threads, typing the
+            time_column as timestamp and the other columns as float64 (or
+            inferring the types if the data does not fit them).
+
+            Returns a dict with:
+                table(pa.Table): data block, with the rename applied
+                header_lines(list): lines before the data, including the
+                    column header line (empty without csv_skip_rows/signature)
+                csv_metadata(dict): "key:,value" pairs of the header lines
+                rename(dict): {"old_col_name", "new_col_name"} or None
+                csv_sep(str): separator
+        """
+        buffer = self._csv_buffer(csv_content)
+        skip_rows, header_offset, head = self._find_header_offset(
+            buffer=buffer,
+            csv_skip_rows=csv_skip_rows,
+            csv_skip_signature=csv_skip_signature)
+        header_lines = head.decode("utf-8").splitlines(keepends=True)
+        data_buffer = buffer.slice(header_offset)
+
+        read_options = pv.ReadOptions(use_threads=True)
+        parse_options = pv.ParseOptions(delimiter=csv_sep)
+        header_line = data_buffer.slice(
+            0, min(64*1024, data_buffer.size)).to_pybytes().split(b"\n", 1)[0]
+        column_names = next(csv.reader(
+            [header_line.decode("utf-8", errors="replace").rstrip("\r")],
+            delimiter=csv_sep))
+        column_types = {
+            name: (pa.timestamp("s") if name.strip() == time_column
+                   else pa.float64())
+            for name in column_names}
+        try:
+            table = pv.read_csv(
+                pa.BufferReader(data_buffer),
+                read_options=read_options,
+                parse_options=parse_options,
+                convert_options=pv.ConvertOptions(column_types=column_types))
+        except pa.ArrowInvalid as ee:
+            logging.warning("Falling back to inferred column types: "+repr(ee))
+            table = pv.read_csv(
+                pa.BufferReader(data_buffer),
+                read_options=read_options,
+                parse_options=parse_options)
+
+        rename = None
         if rename_column:
-            if rename_column_old_name:
-                df = df.rename(columns={rename_column_old_name:rename_column})
-                _elem = dict()
-                _elem['key'] = "gu_rename_old_col_name"
-                _elem['value'] = rename_column_old_name
-                giovanni_util_metadata.append(_elem)
-                _elem = dict()
-                _elem['key'] = "gu_rename_new_col_name"
-                _elem['value'] = rename_column
-                giovanni_util_metadata.append(_elem)
-            else:
-                old_col_name = df.columns[rename_column_index]
-                df = df.rename(columns={old_col_name:rename_column})
-                _elem = dict()
-                _elem['key'] = "gu_rename_old_col_name"
-                _elem['value'] = old_col_name
-                giovanni_util_metadata.append(_elem)
-                _elem = dict()
-                _elem['key'] = "gu_rename_new_col_name"
-                _elem['value'] = rename_column
-                giovanni_util_metadata.append(_elem)
+            old_col_name = rename_column_old_name
+            if not old_col_name:
+                old_col_name = table.column_names[rename_column_index]
+            table = table.rename_columns(
+                [rename_column if name == old_col_name else name
+                 for name in table.column_names])
+            rename = {"old_col_name": old_col_name,
+                      "new_col_name": rename_column}
+
+        self.count_step(nbytes=data_buffer.size, nrows=table.num_rows)
+        return {
+            "table": table,
+            "header_lines": header_lines,
+            "csv_metadata": self._parse_csv_metadata(
+                header_lines=header_lines, csv_sep=csv_sep),
+            "rename": rename,
+            "csv_sep": csv_sep}
+
+    def _parse_csv_metadata(
+            self, header_lines:list[str], csv_sep:str=",") -> dict:
+        csv_metadata = dict()
+        for row in csv.reader(header_lines, delimiter=csv_sep):
+            if len(row) != 2:
+                continue
+            if row[0].endswith(":"):
+                csv_metadata[row[0][:-1]] = row[1]
+        return csv_metadata
+
+    @timed_step
+    def write_csv_file(
+            self, parsed:dict,
+            csv_file:str,
+            csv_keep_metadata:bool=False):
+        df = parsed["table"].to_pandas()
         print(df)
         df.to_csv(csv_file, index=False)
+        self.count_step(nbytes=os.path.getsize(csv_file), nrows=len(df))
         if csv_keep_metadata:
             self._write_csv_metadata(
                 csv_meta_file=csv_file+".metadata",
-                csv_content_str=csv_content_str,
-                skip_rows=skip_rows,
-                csv_sep=csv_sep,
-                gu_metadata=giovanni_util_metadata)
+                parsed=parsed)
 
     def _write_csv_metadata(
             self,
             csv_meta_file:str,
-            csv_content_str:str,
-            skip_rows:int=-1,
-            csv_sep:str=",",
-            gu_metadata:list=[]):
-        if not csv_content_str:
-            return
-        sio = io.StringIO(csv_content_str)
+            parsed:dict):
+        csv_sep = parsed["csv_sep"]
+        gu_metadata = list()
+        renames = parsed["rename"] or []
+        # a list for jobs of several variables
+        if isinstance(renames, dict):
+            renames = [renames]
+        for rename in renames:
+            gu_metadata.append({
+                "key": "gu_rename_old_col_name",
+                "value": rename["old_col_name"]})
+            gu_metadata.append({
+                "key": "gu_rename_new_col_name",
+                "value": rename["new_col_name"]})
         with open(csv_meta_file, "w") as f:
-            nline = -1
-            while line := sio.readline():
-                nline += 1
-                if skip_rows < nline:
-                    break
+            for line in parsed["header_lines"]:
                 f.write(line)
             for kv in gu_metadata:
                 f.write(f"{kv['key']}{csv_sep}{kv['value']}\n")
 
-    def save_to_parquet_file(
-            self, csv_content,
+    @timed_step
+    def write_parquet_file(
+            self, parsed:dict,
             parquet_file:str,
-            csv_skip_rows:int=-1,
-            csv_skip_signature:str=None,
-            csv_keep_metadata:bool=False,
-            csv_sep:str=",",
-            rename_column:str=None,
-            rename_column_index:int=1,
-            rename_column_old_name:str=None):
-        csv_content_str = csv_content.decode('utf-8')
-        skip_rows = -1
-        if csv_skip_rows > 0:
-            skip_rows = csv_skip_rows
-        elif csv_skip_signature:
-            skip_rows = self._find_skip_index_by_keywords(
-                csv_content_str=csv_content_str,
-                header_keyword=csv_skip_signature)
-        if skip_rows>0:
-            df = pd.read_csv(io.StringIO(csv_content_str),
-                             skiprows=skip_rows,sep=csv_sep)
-        else:
-            df = pd.read_csv(io.StringIO(csv_content_str), sep=csv_sep)
-
-        giovanni_util_metadata = dict()
-        if rename_column:
-            if rename_column_old_name:
-                df = df.rename(columns={rename_column_old_name:rename_column})
-                _rename = dict()
-                _rename["old_col_name"] = rename_column_old_name
-                _rename["new_col_name"] = rename_column
-                giovanni_util_metadata["rename"] = _rename
-            else:
-                old_col_name = df.columns[rename_column_index]
-                df = df.rename(columns={old_col_name:rename_column})
-                _rename = dict()
-                _rename["old_col_name"] = old_col_name
-                _rename["new_col_name"] = rename_column
-                giovanni_util_metadata["rename"] = _rename
-
-        pt = pa.Table.from_pandas(df)
-
+            csv_keep_metadata:bool=False):
+        pt = parsed["table"]
         if csv_keep_metadata:
             pt = self._append_parquet_metadata(
                 parquet_table=pt,
-                csv_content_str=csv_content_str,
-                skip_rows=skip_rows,
-                csv_sep=csv_sep,
-                gu_metadata=giovanni_util_metadata)
+                parsed=parsed)
+        with replace_file(parquet_file) as tmp_file:
+            pq.write_table(table=pt,
+                           where=tmp_file)
+        self.count_step(nbytes=os.path.getsize(parquet_file), nrows=pt.num_rows)
+
+    @timed_step
+    def upsert_parquet_table(
+            self, parsed:dict,
+            parquet_file:str,
+            key_column:str="time") -> dict:
+        """
+            Merge the newly parsed rows into the rows of an existing Parquet
+            file. Rows with the same key_column value are replaced by the new
+            ones and the result is sorted by key_column.
 
-        pq.write_table(table=pt,
-                       where=parquet_file)
+            Returns a copy of parsed with the merged table.
+        """
+        new_table = parsed["table"]
+        if not os.path.exists(parquet_file):
+            return parsed
+        old_table = pq.read_table(parquet_file)
+        try:
+            old_table = old_table.select(new_table.column_names).cast(
+                new_table.schema.remove_metadata())
+        except (KeyError, pa.ArrowInvalid, pa.ArrowNotImplementedError) as ee:
+            raise ValueError(
+                f"Cannot merge into {parquet_file}, columns differ: {ee!r}")
+        replaced = pc.is_in(old_table[key_column],
+                            value_set=new_table[key_column])
+        old_table = old_table.filter(pc.invert(replaced))
+        table = pa.concat_tables(
+            [old_table.replace_schema_metadata(new_table.schema.metadata),
+             new_table])
+        merged = dict(parsed)
+        merged["table"] = table.sort_by(key_column)
+        self.count_step(nrows=merged["table"].num_rows)
+        return merged
 
     def _append_parquet_metadata(
             self,
             parquet_table,
-            csv_content_str:str,
-            skip_rows:int=-1,
-            csv_sep:str=",",
-            gu_metadata:dict={}):
-        if not csv_content_str:
-            return parquet_table
-        if skip_rows < 1:
-            return parquet_table
-        sio = io.StringIO(csv_content_str)
-        soo = io.StringIO()
-        nline = -1
-        while line := sio.readline():
-            nline += 1
-            if skip_rows < nline:
-                break
-            soo.write(line+"\n")
-        soo.seek(0)
-        df = pd.read_csv(filepath_or_buffer=soo,
-                         sep=csv_sep, header=None)
-        add_metadata = {}
-        new_metadata = {b'csv_metadata': b'{}'}
-        num_columns = len(df.columns)
-        if num_columns != 2:
+            parsed:dict):
+        if len(parsed["header_lines"]) < 2:
             return parquet_table
-        # Using iterrows()
-        for index, row in df.iterrows():
-            column_name = row[0]
-            print("row0=",row[0], "row1=", row[1])
-            if column_name.endswith(":"):
-                ncolumn_name = column_name[:-1]
-                column_value = row[1]
-                add_metadata[ncolumn_name] = column_value
-        json_str = json.dumps(add_metadata)
-        bytes_obj = bytes(json_str, "utf-8")
-        new_metadata[b'csv_metadata'] = bytes_obj
-        if gu_metadata:
-            json_str = json.dumps(gu_metadata)
-            bytes_obj = bytes(json_str, "utf-8")
-            new_metadata[b'gu_metadata'] = bytes_obj
+        new_metadata = dict()
+        json_str = json.dumps(parsed["csv_metadata"])
+        new_metadata[b'csv_metadata'] = bytes(json_str, "utf-8")
+        if parsed["rename"]:
+            json_str = json.dumps({"rename": parsed["rename"]})
+            new_metadata[b'gu_metadata'] = bytes(json_str, "utf-8")
 
         print("new_metadata=", new_metadata)
         merged_metadata = { **new_metadata, **(parquet_table.schema.metadata or {}) }
-        print("merged_metadata=", merged_metadata)
         return parquet_table.replace_schema_metadata(merged_metadata)
 
+    @timed_step
+    def save_to_csv_file(
+            self, csv_content,
+            csv_file:str,
+            csv_skip_rows:int=-1,
+            csv_skip_signature:str=None,
+            csv_keep_metadata:bool=False,
+            csv_sep:str=",",
+            rename_column:str=None,
+            rename_column_index:int=1,
+            rename_column_old_name:str=None):
+        parsed = self.parse_csv_content(
+            csv_content=csv_content,
+            csv_skip_rows=csv_skip_rows,
+            csv_skip_signature=csv_skip_signature,
+            csv_sep=csv_sep,
+            rename_column=rename_column,
+            rename_column_index=rename_column_index,
+            rename_column_old_name=rename_column_old_name)
+        self.write_csv_file(parsed=parsed, csv_file=csv_file,
+                            csv_keep_metadata=csv_keep_metadata)
+
+    @timed_step
+    def save_to_parquet_file(
+            self, csv_content,
+            parquet_file:str,
+            csv_skip_rows:int=-1,
+            csv_skip_signature:str=None,
+            csv_keep_metadata:bool=False,
+            csv_sep:str=",",
+            rename_column:str=None,
+            rename_column_index:int=1,
+            rename_column_old_name:str=None):
+        parsed = self.parse_csv_content(
+            csv_content=csv_content,
+            csv_skip_rows=csv_skip_rows,
+            csv_skip_signature=csv_skip_signature,
+            csv_sep=csv_sep,
+            rename_column=rename_column,
+            rename_column_index=rename_column_index,
+            rename_column_old_name=rename_column_old_name)
+        self.write_parquet_file(parsed=parsed, parquet_file=parquet_file,
+                                csv_keep_metadata=csv_keep_metadata)
+
+    @timed_step
+    def reset_workspace(self) -> bool:
+        """
+            Reload the portal to clear the previous plot selections,
+            keeping the logged-in session.
+        """
+        if not self.driver:
+            return False
+        self.driver.get(self.giovanni_root)
+        self._wait(timeout=30).until(
+            EC.invisibility_of_element((By.ID, "progressModal")))
+        return True
 
     def __del__(self):
         if self.driver:
@@ -1391,8 +2126,721 @@ class Giovanni:
             self.driver.quit()
             self.driver = None
 
+
+class GiovanniHttpClient(Giovanni):
+    """
+        Browserless Giovanni client.
+
+        Submits the same request as the web portal (plot type, dates, area,
+        variable) straight to the Giovanni service manager, polls it until
+        the result is ready and downloads the CSV. The public methods mirror
+        Giovanni so that giovanni_main can use either backend.
+
+        All endpoints are relative to giovanni_root, e.g. a local stand-in
+        server can be used with giovanni_root="http://127.0.0.1:8000/giovanni".
+
+        Expected responses (JSON):
+            service_path - {"session": {"id": .., "resultset": {"id": ..,
+                            "result": {"id": .., "status": {"percentComplete": ..}}}}}
+                           Polling with session/resultset/result returns the
+                           same document; the CSV link is any URL in it that
+                           points to a CSV file.
+            catalog_path - Solr select response: {"response": {"docs": [
+                            {"dataFieldId": .., "dataFieldLongName": .., ...}]}}
+            shape_path   - {"available": {<shapefile>: {"title": <group>,
+                            "shapes": [{"name": .., "id": ..}, ...]}}}
+    """
+    service_path = "/daac-bin/service_manager.pl"
+    catalog_path = GiovanniVariableCatalog.catalog_path
+    shape_path = GiovanniShapeCatalog.shape_path
+
+    def __init__(self, user_name=None, password=None,
+                 giovanni_root:str=None,
+                 poll_interval:float=2.0,
+                 poll_timeout:float=900.0,
+                 request_timeout:float=60.0,
+                 earthdata_cookie_file:str=None,
+                 variable_catalog:GiovanniVariableCatalog=None,
+                 shape_catalog:GiovanniShapeCatalog=None) -> None:
+        super().__init__(user_name=user_name, password=password,
+                         earthdata_cookie_file=earthdata_cookie_file,
+                         variable_catalog=variable_catalog,
+                         shape_catalog=shape_catalog)
+        if giovanni_root:
+            self.giovanni_root = giovanni_root.rstrip("/")
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.request_timeout = request_timeout
+        self.session = None
+        self.plot_request = dict()
+        self.plot_result = None
+
+    @timed_step
+    def _init_driver(self) -> None:
+        self.session = self._get_earthdata_session()
+
+    def _get_json(self, path:str, params:list|dict=None):
+        if not self.session:
+            self._init_driver()
+        response = self.session.get(
+            self.giovanni_root + path,
+            params=params,
+            timeout=self.request_timeout)
+        response.raise_for_status()
+        return response.json()
+
+    @timed_step
+    def login(self, user_name, password) -> bool:
+        """
+            Register Earthdata credentials for the service and data requests.
+        """
+        if not user_name:
+            return False
+        if not password:
+            return False
+        self.user_name = user_name
+        self.password = password
+        self._init_driver()
+        return True
+
+    @timed_step
+    def logout(self) -> bool:
+        self.user_name = None
+        self.password = None
+        self.session = None
+        return True
+
+    @timed_step
+    def reset_workspace(self) -> bool:
+        self.plot_request = dict()
+        self.plot_result = None
+        return True
+
+    @timed_step
+    def select_plot_type(self,
+                    plot_type:GiovanniPlotTypes=GiovanniPlotTypes.ArAvTs)->bool:
+        if not plot_type:
+            return False
+        self.plot_request["service"] = plot_type.name
+        return True
+
+    @timed_step
+    def select_plot_start_date(
+            self,
+            start_date:maya.MayaDT)->bool:
+        if not start_date:
+            return False
+        self.plot_request["starttime"] = start_date.datetime().strftime(
+            "%Y-%m-%dT00:00:00Z")
+        return True
+
+    @timed_step
+    def select_plot_end_date(
+            self,
+            end_date:maya.MayaDT)->bool:
+        if not end_date:
+            return False
+        self.plot_request["endtime"] = end_date.datetime().strftime(
+            "%Y-%m-%dT23:59:59Z")
+        return True
+
+    @timed_step
+    def select_plot_area_by_bbox(
+            self, bbox_str=None)->bool:
+        if not bbox_str:
+            return False
+        self.plot_request["bbox"] = bbox_str.replace(" ", "")
+        return True
+
+    @timed_step
+    def select_plot_area_by_shape(
+            self, shape_str=None)->bool:
+        return self.select_plot_area_by_shape_selector(shape_str=shape_str)
+
+    @timed_step
+    def select_plot_area_by_shape_selector(
+            self, shape_str=None)->bool:
+        if not shape_str:
+            return False
+        if not self.shape_catalog:
+            self.shape_catalog = GiovanniShapeCatalog()
+        found = self.shape_catalog.lookup(shape_str)
+        if not (found and found[2]):
+            # unknown shape or name only: fetch the shape list once
+            if not self.session:
+                self._init_driver()
+            self.shape_catalog.refresh(
+                session=self.session,
+                giovanni_root=self.giovanni_root,
+                timeout=self.request_timeout)
+            found = self.shape_catalog.lookup(shape_str)
+        if not (found and found[2]):
+            logging.error("Shape not found: '"+shape_str+"'")
+            return False
+        self.plot_request["shape"] = found[2]
+        return True
+
+    @timed_step
+    def select_plot_variable_by_keywords(
+            self, var_str=None)->bool:
+        if not var_str:
+            return False
+        if self.variable_catalog:
+            var_id = self.variable_catalog.resolve(var_str)
+            if var_id:
+                return self.select_plot_variable_by_id(var_id=var_id)
+        result = self._get_json(
+            self.catalog_path,
+            params={"q": var_str, "wt": "json", "rows": 100})
+        docs = result.get("response", {}).get("docs", [])
+        if self.variable_catalog and docs:
+            self.variable_catalog.add(docs)
+            self.variable_catalog.save()
+        # same as the portal: sort by variable name, first match wins
+        docs = sorted(docs, key=lambda doc: doc.get("dataFieldLongName", ""))
+        if not docs:
+            logging.error("No variable matches '"+var_str+"'")
+            return False
+        return self.select_plot_variable_by_id(var_id=docs[0]["dataFieldId"])
+
+    @timed_step
+    def select_plot_variable_by_id(
+            self, var_id=None)->bool:
+        """
+            Adds var_id to the variables of the plot request.
+        """
+        if not var_id:
+            return False
+        var_ids = self.plot_request.get("data", "").split(",")
+        if var_id not in var_ids:
+            self.plot_request["data"] = ",".join(
+                [data_id for data_id in var_ids if data_id] + [var_id])
+        return True
+
+    def _find_status(self, obj) -> (dict | None):
+        if isinstance(obj, dict):
+            if "percentComplete" in obj:
+                return obj
+            for value in obj.values():
+                status = self._find_status(value)
+                if status is not None:
+                    return status
+        elif isinstance(obj, list):
+            for value in obj:
+                status = self._find_status(value)
+                if status is not None:
+                    return status
+        return None
+
+    def _find_csv_urls(self, obj, url_strs:list=None) -> list[str]:
+        if url_strs is None:
+            url_strs = list()
+        if isinstance(obj, str):
+            lower_obj = obj.lower()
+            if (lower_obj.startswith("http")
+                and (lower_obj.endswith(".csv") or "format=csv" in lower_obj)
+                and obj not in url_strs):
+                url_strs.append(obj)
+        elif isinstance(obj, dict):
+            for value in obj.values():
+                self._find_csv_urls(value, url_strs)
+        elif isinstance(obj, list):
+            for value in obj:
+                self._find_csv_urls(value, url_strs)
+        return url_strs
+
+    @timed_step
+    def plot_data(self):
+        for key in ("service", "starttime", "endtime", "data"):
+            if key not in self.plot_request:
+                logging.error("Plot request is missing '"+key+"'")
+                return False
+        params = dict(self.plot_request)
+        params["portal"] = "GIOVANNI"
+        params["format"] = "json"
+        result = self._get_json(self.service_path, params=params)
+        try:
+            session = result["session"]
+            resultset = session["resultset"]
+            poll_params = {
+                "session": session["id"],
+                "resultset": resultset["id"],
+                "result": resultset["result"]["id"],
+                "portal": "GIOVANNI",
+                "format": "json"}
+        except (KeyError, TypeError) as ee:
+            logging.error("Unexpected service response: "+repr(ee))
+            return False
+        deadline = time.monotonic() + self.poll_timeout
+        while True:
+            status = self._find_status(result) or {}
+            if float(status.get("percentComplete", 0)) >= 100:
+                break
+            if str(status.get("code", "0")) not in ("0", ""):
+                logging.error("Plot failed: "+str(status.get("message")))
+                return False
+            if time.monotonic() > deadline:
+                logging.error("Timed out waiting for plot result")
+                return False
+            time.sleep(self.poll_interval)
+            result = self._get_json(self.service_path, params=poll_params)
+        self.plot_result = result
+        return True
+
+    @timed_step
+    def get_results_csv_urls(self) -> list[str]:
+        if not self.plot_result:
+            return []
+        s_urls = self._find_csv_urls(self.plot_result)
+        print("URLs=", s_urls)
+        return s_urls
+
+    @timed_step
+    def download_from_earthdata(
+            self,url_str:str, username:str, password:str,
+            to_file:str=None):
+        if username and password and username != self.user_name:
+            self.login(user_name=username, password=password)
+        if not self.session:
+            self._init_driver()
+        if to_file:
+            self.count_step(nbytes=self.session.download_to_file(
+                url_str, file_path=to_file, timeout=self.request_timeout))
+            return to_file
+        content = self.session.download(url_str, timeout=self.request_timeout)
+        self.count_step(nbytes=len(content))
+        return content
+
+class GiovanniTransientError(Exception):
+    """
+        A Giovanni step failed in a way that may pass on a retry
+        (plot not rendered, no result URL, empty download).
+    """
+
+
+class GiovanniPermanentError(Exception):
+    """
+        A Giovanni job cannot succeed as given (bad date, unknown shape or
+        variable); retrying does not help.
+    """
+
+
+class GiovanniRetryPolicy:
+    """
+        Exponential backoff with full jitter: the delay before retry n
+        (n = 1, 2, ...) is uniform in [0, min(max_delay, base_delay*2**(n-1))].
+        max_retries is the number of retries after the first attempt.
+    """
+    def __init__(self, max_retries:int=2,
+                 base_delay:float=10.0,
+                 max_delay:float=300.0) -> None:
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, nretry:int) -> float:
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (nretry-1)))
+
+    @staticmethod
+    def is_transient(error:BaseException) -> bool:
+        if isinstance(error, GiovanniTransientError):
+            return True
+        if isinstance(error, requests.HTTPError):
+            status_code = error.response.status_code if error.response is not None else None
+            return status_code is None or status_code == 429 or status_code >= 500
+        # network errors, timeouts and browser hiccups (stale elements,
+        # lost sessions) may pass; bad input and bad data do not
+        return isinstance(error, (
+            requests.ConnectionError,
+            requests.Timeout,
+            TimeoutError,
+            ConnectionError,
+            WebDriverException))
+
+
+class GiovanniCircuitBreaker:
+    """
+        Shared by the workers of a pool. After failure_threshold transient
+        failures in a row the breaker opens and every worker pauses for
+        cooldown seconds before taking a job, instead of burning through
+        the batch while Giovanni is degraded. After the pause one more
+        transient failure opens it again; a success closes it.
+    """
+    def __init__(self, failure_threshold:int=5, cooldown:float=120.0) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        while True:
+            with self._lock:
+                pause = self.open_until - time.monotonic()
+            if pause <= 0:
+                return
+            time.sleep(min(pause, 1.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold:
+                return
+            logging.warning(f"{self.failures} transient failures in a row, "
+                            f"pausing the workers for {self.cooldown:.1f}s")
+            self.open_until = time.monotonic() + self.cooldown
+            # half-open: the next failure opens it again
+            self.failures = self.failure_threshold - 1
+
+
+class GiovanniWorkerPool:
+    """
+        Runs Giovanni jobs concurrently on a pool of Giovanni instances.
+
+        Each worker thread owns one instance (e.g. a headless Chrome with its
+        own login) created by giovanni_factory, and takes jobs from a shared
+        queue until it is empty. num_workers caps the concurrency.
+
+        job_runner(gv, job) does the work for one job; it defaults to
+        run_giovanni_job. A truthy return value means success and is kept
+        as the "output" of the job. A fake factory/driver can be passed in for testing.
+
+        A job that raises a transient error (GiovanniRetryPolicy.is_transient)
+        goes back to the queue with a backoff delay, so the worker moves on
+        to other jobs meanwhile. Transient failures also feed the shared
+        circuit_breaker. A worker whose browser fails while resetting the
+        workspace starts a new one, retried under the same policy; if that
+        fails too the worker stops and leaves its job to the others.
+    """
+    def __init__(self, giovanni_factory,
+                 num_workers:int=2,
+                 job_runner=None,
+                 retry_policy:GiovanniRetryPolicy=None,
+                 circuit_breaker:GiovanniCircuitBreaker=None) -> None:
+        self.giovanni_factory = giovanni_factory
+        self.num_workers = max(1, num_workers)
+        self.job_runner = job_runner
+        self.retry_policy = retry_policy or GiovanniRetryPolicy(max_retries=0)
+        self.circuit_breaker = circuit_breaker
+        self.results = list()
+        self._lock = threading.Lock()
+
+    def _record(self, njob:int, job, status:bool, error:str=None,
+                worker:int=None, elapsed:float=None,
+                timings:list=None, output=None, attempts:int=1) -> None:
+        with self._lock:
+            self.results.append({
+                "job": njob,
+                "status": status,
+                "output": output,
+                "error": error,
+                "worker": worker,
+                "elapsed": elapsed,
+                "timings": timings or [],
+                "attempts": attempts,
+                "args": job})
+
+    def _start_giovanni(self):
+        gv = self.giovanni_factory()
+        gv.__enter__()
+        return gv
+
+    @staticmethod
+    def _reset_giovanni(nworker:int, gv) -> bool:
+        try:
+            return bool(gv.reset_workspace())
+        except Exception as ee:
+            logging.warning(f"Worker {nworker} restarting the browser: {ee!r}")
+            return False
+
+    def _restart_giovanni(self, nworker:int):
+        """
+            Start a new browser, retried under the retry policy. Returns
+            None if it cannot be started.
+        """
+        for attempt in range(1, self.retry_policy.max_retries+2):
+            try:
+                gv = self._start_giovanni()
+                if gv.login_status:
+                    return gv
+                gv.__exit__(None, None, None)
+                error = "login failed"
+            except Exception as ee:
+                error = repr(ee)
+            if attempt > self.retry_policy.max_retries:
+                break
+            delay = self.retry_policy.delay(attempt)
+            logging.warning(f"Worker {nworker} browser restart {attempt}: "
+                            f"{error}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+        logging.error(f"Worker {nworker} could not restart the browser: "
+                      f"{error}, stopping")
+        return None
+
+    def _worker(self, nworker:int, jobs:queue.Queue) -> None:
+        job_runner = self.job_runner or run_giovanni_job
+        try:
+            gv = self._start_giovanni()
+        except Exception as ee:
+            logging.error(f"Worker {nworker} failed to start: {ee!r}")
+            # leave the jobs to the other workers
+            return
+        try:
+            if not gv.login_status:
+                logging.error(f"Worker {nworker} failed to log in")
+                return
+            first_job = True
+            while True:
+                if self.circuit_breaker:
+                    self.circuit_breaker.wait()
+                try:
+                    njob, job, attempt, not_before, timings = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                pause = not_before - time.monotonic()
+                if pause > 0:
+                    # backing off: leave it for later, take another job
+                    jobs.put((njob, job, attempt, not_before, timings))
+                    jobs.task_done()
+                    time.sleep(min(pause, 0.2))
+                    continue
+                if not first_job and not self._reset_giovanni(nworker, gv):
+                    gv.__exit__(None, None, None)
+                    gv = self._restart_giovanni(nworker)
+                    if not gv:
+                        # leave the job to the other workers
+                        jobs.put((njob, job, attempt, not_before, timings))
+                        jobs.task_done()
+                        return
+                first_job = False
+                start = time.monotonic()
+                try:
+                    output = job_runner(gv, job)
+                    if self.circuit_breaker:
+                        self.circuit_breaker.record_success()
+                    self._record(njob, job, bool(output),
+                                 output=output,
+                                 worker=nworker,
+                                 elapsed=time.monotonic()-start,
+                                 timings=timings+gv.pop_step_timings(),
+                                 attempts=attempt)
+                except Exception as ee:
+                    transient = self.retry_policy.is_transient(ee)
+                    if transient and self.circuit_breaker:
+                        self.circuit_breaker.record_failure()
+                    if transient and attempt <= self.retry_policy.max_retries:
+                        delay = self.retry_policy.delay(attempt)
+                        logging.warning(f"Worker {nworker} job {njob} attempt "
+                                        f"{attempt}: {ee!r}, retrying in {delay:.1f}s")
+                        jobs.put((njob, job, attempt+1,
+                                  time.monotonic()+delay,
+                                  timings+gv.pop_step_timings()))
+                        continue
+                    logging.error(f"Worker {nworker} job {njob}: {ee!r}")
+                    self._record(njob, job, False, error=repr(ee),
+                                 worker=nworker,
+                                 elapsed=time.monotonic()-start,
+                                 timings=timings+gv.pop_step_timings(),
+                                 attempts=attempt)
+                finally:
+                    jobs.task_done()
+        finally:
+            if gv:
+                gv.__exit__(None, None, None)
+
+    def run(self, jobs:list) -> list[dict]:
+        """
+            Returns one result per job, in job order:
+                {"job", "status", "output", "error", "worker", "elapsed",
+                 "timings", "attempts", "args"}
+            The timings of the first job of a worker include starting the
+            browser and logging in.
+            Jobs left over because no worker could start are marked failed.
+        """
+        self.results = list()
+        job_queue = queue.Queue()
+        for njob, job in enumerate(jobs):
+            # (job index, job, attempt, not before, timings of earlier attempts)
+            job_queue.put((njob, job, 1, 0.0, []))
+        threads = [
+            threading.Thread(target=self._worker,
+                             args=(nworker, job_queue),
+                             name=f"giovanni-worker-{nworker}")
+            for nworker in range(min(self.num_workers, len(jobs)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        while not job_queue.empty():
+            njob, job, attempt, _, timings = job_queue.get_nowait()
+            self._record(njob, job, False, error="No worker available",
+                         timings=timings, attempts=attempt)
+        return sorted(self.results, key=lambda result: result["job"])
+
+class GiovanniResultCache:
+    """
+        Content-addressed on-disk cache of Giovanni result CSVs.
+
+        Entries are keyed by a hash of the normalized request (plot type,
+        variable, shape, bbox, start and end date). Each entry keeps the raw
+        CSV bytes in <key>.csv and the request, source URL and CSV header
+        lines in <key>.json. Entries older than ttl seconds are ignored, and
+        the least recently used ones are evicted once the cache grows beyond
+        max_bytes. get() and put() hand out paths that are read later, so
+        entries used within the last in_use_seconds are never evicted.
+    """
+    def __init__(self, cache_dir:str,
+                 ttl:float=7*24*3600,
+                 max_bytes:int=1024*1024*1024,
+                 in_use_seconds:float=3600) -> None:
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.in_use_seconds = in_use_seconds
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def normalize_request(args) -> dict:
+        plot_type = args.plot_type
+        if isinstance(plot_type, GiovanniPlotTypes):
+            plot_type = plot_type.name
+        # keyword search does not depend on case or word order
+        variable = ";".join(
+            var if is_id else " ".join(sorted(var.lower().split()))
+            for var, is_id in job_variables(args)) or None
+        bbox = None
+        if args.plot_area_bbox:
+            bbox = ",".join(
+                str(float(v)) for v in args.plot_area_bbox.split(","))
+        # a stand-in server does not share entries with the real service
+        backend = getattr(args, "backend", None) or GiovanniBackends.selenium
+        giovanni_root = Giovanni.default_root
+        if backend == GiovanniBackends.http and getattr(args, "giovanni_root", None):
+            giovanni_root = args.giovanni_root.rstrip("/")
+        return {
+            "backend": str(backend),
+            "giovanni_root": giovanni_root,
+            "plot_type": plot_type,
+            "variable": variable,
+            "shape": args.plot_area_shape.strip() if args.plot_area_shape else None,
+            "bbox": bbox,
+            "start_date": args.plot_start_date.datetime().strftime("%Y-%m-%d"),
+            "end_date": args.plot_end_date.datetime().strftime("%Y-%m-%d")}
+
+    @staticmethod
+    def key(args) -> str:
+        request = json.dumps(GiovanniResultCache.normalize_request(args),
+                             sort_keys=True)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def _paths(self, key:str) -> tuple[str, str]:
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + ".csv", base + ".json"
+
+    def get(self, key:str) -> (str | None):
+        """
+            Returns the path of the cached CSV, or None.
+        """
+        csv_path, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, "r") as f:
+                    metadata = json.load(f)
+                if self.ttl and time.time() - metadata["created"] > self.ttl:
+                    return None
+                # mark as recently used
+                os.utime(csv_path)
+            except (OSError, ValueError, KeyError):
+                return None
+        return csv_path
+
+    def get_metadata(self, key:str) -> (dict | None):
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key:str, csv_content:bytes|str, args=None,
+            url_str:str=None) -> str:
+        """
+            csv_content is the CSV bytes or the path of a CSV file, which is
+            moved into the cache. Returns the path of the cached CSV.
+        """
+        csv_path, meta_path = self._paths(key)
+        if isinstance(csv_content, (bytes, bytearray)):
+            lines = io.BytesIO(csv_content)
+            size = len(csv_content)
+        else:
+            lines = open(csv_content, "rb")
+            size = os.path.getsize(csv_content)
+        header = list()
+        with lines:
+            for line in lines:
+                line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+                if (args is not None and args.csv_skip_signature
+                    and args.csv_skip_signature in line):
+                    break
+                header.append(line)
+                if len(header) >= 100:
+                    break
+        metadata = {
+            "created": time.time(),
+            "size": size,
+            "url": url_str,
+            "request": self.normalize_request(args) if args is not None else None,
+            "header": header}
+        with self._lock:
+            os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+            with replace_file(csv_path) as tmp_file:
+                if isinstance(csv_content, (bytes, bytearray)):
+                    with open(tmp_file, "wb") as f:
+                        f.write(csv_content)
+                else:
+                    shutil.move(csv_content, tmp_file)
+            with atomic_write(meta_path) as f:
+                f.write(json.dumps(metadata, indent=2))
+            self._evict(keep=csv_path)
+        return csv_path
+
+    def _evict(self, keep:str=None) -> None:
+        entries = list()
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(".csv"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        entries.sort()
+        in_use_since = time.time() - self.in_use_seconds
+        for mtime, size, path in entries:
+            if total <= self.max_bytes or mtime >= in_use_since:
+                break
+            if path == keep:
+                continue
+            meta_path = path[:-len(".csv")] + ".json"
+            for entry_path in (path, meta_path):
+                try:
+                    os.remove(entry_path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
 #--------main-----------
-def get_args():
+def get_args(argv:list[str]=None):
     parser = argparse.ArgumentParser(
         description="Giovanni Tool"
     )
@@ -1421,12 +2869,41 @@ def get_args():
                         dest="plot_area_shape",
                         type=str,
                         help="Shape string. It should start with the group name in exact spelling"
-                        ", followed by shape name")
+                        ", followed by shape name. A shape name alone is looked up in "
+                        "the shape catalog.")
     parser.add_argument("--plot-variable",
                         dest="plot_variable",
                         type=str,
+                        action="append",
                         help="Variable keywords. It should uniquely identify one variable. "
-                        "First match will be used.")
+                        "First match will be used. Repeat it to plot several variables "
+                        "in one job; their results are joined on time.")
+    parser.add_argument("--plot-variable-id",
+                        dest="plot_variable_id",
+                        type=str,
+                        action="append",
+                        help="Variable ID, e.g. M2TMNXFLX_5_12_4_PRECTOT. "
+                        "It takes precedence over --plot-variable. Repeatable.")
+    parser.add_argument("--variable-catalog",
+                        dest="variable_catalog",
+                        type=str,
+                        help="JSON file of the local variable catalog used to resolve "
+                        "--plot-variable keywords. It is built on the first run. "
+                        "Default = <cache-dir>/variables.json")
+    parser.add_argument("--refresh-variable-catalog",
+                        dest="refresh_variable_catalog",
+                        action="store_true",
+                        help="Rebuild the local variable catalog from Giovanni.")
+    parser.add_argument("--shape-catalog",
+                        dest="shape_catalog",
+                        type=str,
+                        help="JSON file of the local shape catalog used to resolve "
+                        "--plot-area-shape. It is built on the first run. "
+                        "Default = <cache-dir>/shapes.json")
+    parser.add_argument("--refresh-shape-catalog",
+                        dest="refresh_shape_catalog",
+                        action="store_true",
+                        help="Rebuild the local shape catalog from Giovanni.")
     parser.add_argument("--csv-separator",
                         dest="csv_separator",
                         type=str,
@@ -1435,7 +2912,9 @@ def get_args():
     parser.add_argument("--rename-column",
                         dest="rename_column",
                         type=str,
-                        help="New name of the column at rename-column-index, which default to 1.")
+                        action="append",
+                        help="New name of the column at rename-column-index, which default to 1. "
+                        "With several variables, give it once per variable, in order.")
     parser.add_argument("--rename-column-index",
                         dest="rename_column_index",
                         type=int,
@@ -1468,86 +2947,918 @@ def get_args():
                         type=str,
                         help="Save to a Parquet file if given the full file path "
                         "to be written into.")
-    args = parser.parse_args()
+    parser.add_argument("--backend",
+                        dest="backend",
+                        type=GiovanniBackends,
+                        default=GiovanniBackends.selenium,
+                        choices=list(GiovanniBackends),
+                        metavar=[gb.value for gb in GiovanniBackends],
+                        help="selenium drives the web portal in Chrome; "
+                        "http talks to the Giovanni service directly.")
+    parser.add_argument("--giovanni-root",
+                        dest="giovanni_root",
+                        type=str,
+                        help="Giovanni root URL for the http backend. "
+                        "Default = https://giovanni.gsfc.nasa.gov/giovanni")
+    parser.add_argument("--jobs",
+                        dest="jobs",
+                        type=str,
+                        help="JSON or YAML manifest with a list of jobs to run in one "
+                        "logged-in session. Job options override the command line ones.")
+    parser.add_argument("--workers",
+                        dest="workers",
+                        type=int,
+                        default=1,
+                        help="Number of Giovanni sessions (browsers) running jobs "
+                        "concurrently. Default = 1")
+    parser.add_argument("--headless",
+                        dest="headless",
+                        action="store_true",
+                        help="Run Chrome without a window.")
+    parser.add_argument("--timing-report",
+                        dest="timing_report",
+                        type=str,
+                        help="Write the per-job step timings to this JSON file.")
+    parser.add_argument("--trace-file",
+                        dest="trace_file",
+                        type=str,
+                        help="Write one JSON line per step (wall time, bytes, rows) "
+                        "to this file.")
+    parser.add_argument("--earthdata-cookie-file",
+                        dest="earthdata_cookie_file",
+                        type=str,
+                        help="File to keep the Earthdata Login cookies between runs.")
+    parser.add_argument("--cache-dir",
+                        dest="cache_dir",
+                        type=str,
+                        default="~/.cache/ag-climate-toolkit/giovanni",
+                        help="Directory of the Giovanni result cache. "
+                        "Default = ~/.cache/ag-climate-toolkit/giovanni")
+    parser.add_argument("--incremental",
+                        dest="incremental",
+                        action="store_true",
+                        help="Only fetch the dates after the last time in the "
+                        "--save-to-parquet-file and merge them into it.")
+    parser.add_argument("--chunk-years",
+                        dest="chunk_years",
+                        type=int,
+                        default=0,
+                        help="Split date ranges longer than this many years into "
+                        "chunks that are fetched concurrently and joined. Default = 0 (off)")
+    parser.add_argument("--job-retries",
+                        dest="job_retries",
+                        type=int,
+                        default=2,
+                        help="Retries of a job after a transient error (server error, "
+                        "time-out, plot not rendered). Default = 2")
+    parser.add_argument("--retry-base-delay",
+                        dest="retry_base_delay",
+                        type=float,
+                        default=10.0,
+                        help="Base of the exponential backoff between retries, with "
+                        "full jitter, in seconds. Default = 10")
+    parser.add_argument("--retry-max-delay",
+                        dest="retry_max_delay",
+                        type=float,
+                        default=300.0,
+                        help="Longest backoff between retries in seconds. Default = 300")
+    parser.add_argument("--breaker-threshold",
+                        dest="breaker_threshold",
+                        type=int,
+                        default=5,
+                        help="Transient failures in a row that pause all workers. "
+                        "Default = 5")
+    parser.add_argument("--breaker-cooldown",
+                        dest="breaker_cooldown",
+                        type=float,
+                        default=120.0,
+                        help="Pause of the workers when Giovanni looks degraded, in "
+                        "seconds. Default = 120")
+    parser.add_argument("--force",
+                        dest="force",
+                        action="store_true",
+                        help="Run the job even if its outputs are up to date "
+                        "(see the <output>.manifest.json files).")
+    parser.add_argument("--no-cache",
+                        dest="no_cache",
+                        action="store_true",
+                        help="Do not read or write the Giovanni result cache.")
+    parser.add_argument("--cache-ttl-hours",
+                        dest="cache_ttl_hours",
+                        type=float,
+                        default=7*24,
+                        help="Age in hours after which cached results are fetched again. "
+                        "Default = 168")
+    parser.add_argument("--cache-max-mb",
+                        dest="cache_max_mb",
+                        type=int,
+                        default=1024,
+                        help="Size limit of the cache; least recently used results are "
+                        "removed first. Default = 1024")
+    args = parser.parse_args(argv)
     return args
 
-def giovanni_main()->bool:
-    args = get_args()
-    with Giovanni() as gv:
-        #print("object inited")
-        #print("current login status =", gv.login_status)
-
-        gv.login_status = gv.login(user_name=args.username, password=args.password)
-        #gv.login_status = gv.login(user_name=args.username, password=args.password)
-        #print("after login status=", gv.login_status)
-        # print(gv.driver.page_source)
-        if not gv.select_plot_type(plot_type=args.plot_type):
-            return False
+def get_giovanni(args,
+                 variable_catalog:GiovanniVariableCatalog=None,
+                 shape_catalog:GiovanniShapeCatalog=None) -> Giovanni:
+    if args.backend == GiovanniBackends.http:
+        return GiovanniHttpClient(
+            user_name=args.username,
+            password=args.password,
+            giovanni_root=args.giovanni_root,
+            earthdata_cookie_file=args.earthdata_cookie_file,
+            variable_catalog=variable_catalog,
+            shape_catalog=shape_catalog)
+    return Giovanni(user_name=args.username, password=args.password,
+                    headless=args.headless,
+                    earthdata_cookie_file=args.earthdata_cookie_file,
+                    variable_catalog=variable_catalog,
+                    shape_catalog=shape_catalog)
+
+def get_retry_policy(args) -> GiovanniRetryPolicy:
+    return GiovanniRetryPolicy(
+        max_retries=args.job_retries,
+        base_delay=args.retry_base_delay,
+        max_delay=args.retry_max_delay)
+
+def get_variable_catalog(args) -> GiovanniVariableCatalog:
+    catalog_file = args.variable_catalog
+    if not catalog_file:
+        catalog_file = os.path.join(args.cache_dir, "variables.json")
+    variable_catalog = GiovanniVariableCatalog(catalog_file=catalog_file)
+    # built once on the first run, then only on demand
+    if args.refresh_variable_catalog or not variable_catalog.variables:
+        try:
+            nvariables = variable_catalog.refresh(
+                session=EarthdataSession.shared(
+                    user_name=args.username,
+                    password=args.password,
+                    cookie_file=args.earthdata_cookie_file),
+                giovanni_root=args.giovanni_root or Giovanni.default_root)
+        except (requests.RequestException, ValueError) as ee:
+            if args.refresh_variable_catalog:
+                raise
+            logging.warning(f"Variable catalog not built: {ee!r}")
+            return variable_catalog
+        print(f"Variable catalog refreshed: {nvariables} variables")
+    return variable_catalog
+
+def get_shape_catalog(args) -> GiovanniShapeCatalog:
+    catalog_file = args.shape_catalog
+    if not catalog_file:
+        catalog_file = os.path.join(args.cache_dir, "shapes.json")
+    shape_catalog = GiovanniShapeCatalog(catalog_file=catalog_file)
+    # built once on the first run, then only on demand
+    if args.refresh_shape_catalog or not shape_catalog.shapes:
+        try:
+            nshapes = shape_catalog.refresh(
+                session=EarthdataSession.shared(
+                    user_name=args.username,
+                    password=args.password,
+                    cookie_file=args.earthdata_cookie_file),
+                giovanni_root=args.giovanni_root or Giovanni.default_root)
+        except (requests.RequestException, ValueError) as ee:
+            if args.refresh_shape_catalog:
+                raise
+            logging.warning(f"Shape catalog not built: {ee!r}")
+            return shape_catalog
+        print(f"Shape catalog refreshed: {nshapes} shapes")
+    return shape_catalog
+
+def load_jobs(jobs_file:str, args) -> list[argparse.Namespace]:
+    """
+        Read a JSON or YAML job manifest.
 
-        if not gv.select_plot_start_date(start_date=args.plot_start_date):
-            return False
-        
-        if not gv.select_plot_end_date(end_date=args.plot_end_date):
-            return False
+        The manifest is a list of jobs (or {"jobs": [...]}). Each job uses the
+        long option names of this tool, with either dashes or underscores,
+        e.g. {"plot-variable": "...", "plot-area-shape": "US States Indiana",
+        "rename-column": "precipitation", "save-to-parquet-file": "..."}.
+        Options not given in a job fall back to the command line values.
+    """
+    with open(jobs_file, "r") as f:
+        if jobs_file.endswith((".yaml", ".yml")):
+            import yaml
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("jobs", [])
+    dest_names = {
+        "earthdata_login_name": "username",
+        "earthdata_login_pass": "password"}
+    jobs = list()
+    for job in manifest:
+        job_args = dict(vars(args))
+        for key, value in job.items():
+            key = key.lstrip("-").replace("-", "_")
+            job_args[dest_names.get(key, key)] = value
+        if isinstance(job_args.get("plot_type"), str):
+            job_args["plot_type"] = GiovanniPlotTypes(job_args["plot_type"])
+        for key in ("plot_start_date", "plot_end_date"):
+            if isinstance(job_args.get(key), str):
+                job_args[key] = maya.parse(job_args[key])
+        jobs.append(argparse.Namespace(**job_args))
+    return jobs
+
+def get_parquet_max_time(parquet_file:str, time_column:str="time"):
+    """
+        Latest time_column value of a Parquet file, taken from the row group
+        statistics (only the column is read if they are missing).
+        Returns None if the file or the column does not exist.
+    """
+    if not os.path.exists(parquet_file):
+        return None
+    pf = pq.ParquetFile(parquet_file)
+    index = pf.schema_arrow.get_field_index(time_column)
+    if index < 0:
+        return None
+    max_time = None
+    for nrow_group in range(pf.metadata.num_row_groups):
+        stats = pf.metadata.row_group(nrow_group).column(index).statistics
+        if stats is None or not stats.has_min_max:
+            max_time = pc.max(
+                pf.read(columns=[time_column])[time_column]).as_py()
+            break
+        if max_time is None or stats.max > max_time:
+            max_time = stats.max
+    if max_time is None:
+        return None
+    if isinstance(max_time, str):
+        return maya.parse(max_time)
+    return maya.MayaDT.from_datetime(max_time)
 
-        if args.plot_area_bbox:
-            if not gv.select_plot_area_by_bbox(bbox_str=args.plot_area_bbox):
-                return False
-        if args.plot_area_shape:
-            if not gv.select_plot_area_by_shape_selector(shape_str=args.plot_area_shape):
-                return False
-        if args.plot_variable:
-            if not gv.select_plot_variable_by_keywords(var_str=args.plot_variable):
-                return False
-        if not gv.plot_data():
-            return False
-        csv_url = gv.get_results_csv_url()
-        if not csv_url:
-            return False
-        csv_content = gv.download_from_earthdata(
-            url_str=csv_url,
-            username=args.username,
-            password=args.password)
-        #print(csv_content)
-        if not csv_content:
-            return False
-        #save to CSV file
-        if args.save_to_csv_file:
-            gv.save_to_csv_file(
-                csv_content=csv_content,                
-                csv_file=args.save_to_csv_file,
-                csv_keep_metadata=args.save_to_csv_file_metadata,
-                csv_skip_rows=args.csv_skip_rows,
-                csv_skip_signature=args.csv_skip_signature,
-                csv_sep=args.csv_separator,
-                rename_column_old_name=args.rename_column_old_name,
-                rename_column=args.rename_column,
-                rename_column_index=args.rename_column_index)
-        if args.save_to_parquet_file:
-            gv.save_to_parquet_file(
-                csv_content=csv_content,                
-                parquet_file=args.save_to_parquet_file,
-                csv_keep_metadata=args.save_to_csv_file_metadata,
-                csv_skip_rows=args.csv_skip_rows,
-                csv_skip_signature=args.csv_skip_signature,
-                csv_sep=args.csv_separator,
-                rename_column_old_name=args.rename_column_old_name,
-                rename_column=args.rename_column,
-                rename_column_index=args.rename_column_index)
-        """
-        if args.plot_area_shape:
-            if not gv.select_plot_area_by_shape(shape_str=args.plot_area_shape):
-                return False
+def get_parquet_time_step(parquet_file:str, time_column:str="time") -> (dict | None):
+    """
+        Time step of the rows of a Parquet file as maya add() arguments,
+        e.g. {"months": 1} for monthly data, from the last times of the
+        last row group. Returns None if it has fewer than two times.
+    """
+    if not os.path.exists(parquet_file):
+        return None
+    pf = pq.ParquetFile(parquet_file)
+    if pf.schema_arrow.get_field_index(time_column) < 0:
+        return None
+    times = pf.read_row_group(
+        pf.metadata.num_row_groups-1, columns=[time_column])[time_column]
+    if len(times) < 2:
+        times = pf.read(columns=[time_column])[time_column]
+    times = sorted(set(pd.to_datetime(times.to_pandas()).tolist()))[-13:]
+    if len(times) < 2:
+        return None
+    steps = sorted((later - earlier).total_seconds()
+                   for earlier, later in zip(times, times[1:]))
+    step = steps[len(steps)//2]
+    if step >= 365*24*3600:
+        return {"years": 1}
+    if step >= 28*24*3600:
+        return {"months": 1}
+    return {"seconds": step}
+
+def apply_incremental(args) -> bool:
+    """
+        Move the job start date one time step (a day, or a month for
+        monthly data) past the last time already in its Parquet file.
+        Returns False if there is nothing new to fetch.
+    """
+    if not (args.incremental and args.save_to_parquet_file):
+        return True
+    max_time = get_parquet_max_time(args.save_to_parquet_file)
+    if max_time is None:
+        return True
+    start_date = max_time.add(
+        **get_parquet_time_step(args.save_to_parquet_file) or {"days": 1})
+    if start_date > args.plot_end_date:
+        return False
+    if start_date > args.plot_start_date:
+        print(f"Incremental: fetching from {start_date.datetime():%Y-%m-%d} "
+              f"for {args.save_to_parquet_file}")
+        # the output still covers the job's dates (see giovanni_output_manifests)
+        args.requested_start_date = args.plot_start_date
+        args.plot_start_date = start_date
+    return True
 
-        print(gv.driver.page_source)
-        print(args.plot_start_date)
-        print(args.plot_end_date)
+def as_list(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
 
-        #Test destroy
-        #gv.__del__()
-        gv = None
-        """
+def job_variables(args) -> list[tuple[str, bool]]:
+    """
+        (variable, is_id) for each variable of a job. Variable IDs take
+        precedence over keywords.
+    """
+    var_ids = as_list(getattr(args, "plot_variable_id", None))
+    if var_ids:
+        return [(var_id, True) for var_id in var_ids]
+    return [(var_str, False) for var_str in as_list(args.plot_variable)]
+
+def variable_job(args, nvariable:int) -> argparse.Namespace:
+    """
+        The single-variable job of variable nvariable of a job, e.g. to
+        share cache entries between single and multi-variable jobs.
+    """
+    var, is_id = job_variables(args)[nvariable]
+    job = argparse.Namespace(**vars(args))
+    job.plot_variable_id = [var] if is_id else None
+    job.plot_variable = None if is_id else [var]
+    rename_columns = as_list(args.rename_column)
+    job.rename_column = (
+        [rename_columns[nvariable]] if nvariable < len(rename_columns) else None)
+    return job
+
+def get_cached_csv_files(cache:GiovanniResultCache, args) -> (list[str] | None):
+    """
+        The cached CSV of each variable of a job, or None unless all are
+        cached.
+    """
+    csv_files = [
+        cache.get(cache.key(variable_job(args, nvariable)))
+        for nvariable in range(len(job_variables(args)))]
+    if not csv_files or not all(csv_files):
+        return None
+    return csv_files
+
+def resolved_variable_ids(gv:Giovanni, variables:list[tuple[str, bool]]) -> list[str]:
+    """
+        The variable ID of each (variable, is_id) of a job, or None for
+        keywords that the variable catalog cannot resolve.
+    """
+    return [var if is_id
+            else (gv.variable_catalog.resolve(var) if gv.variable_catalog else None)
+            for var, is_id in variables]
+
+def match_csv_urls(csv_urls:list[str], var_ids:list[str]) -> list[str]:
+    """
+        One result URL per variable: by variable ID when the URL holds it,
+        otherwise in the order Giovanni lists the results. The downloads
+        are checked against the IDs by match_csv_files.
+    """
+    remaining = list(csv_urls)
+    matched = [None] * len(var_ids)
+    for nvariable, var_id in enumerate(var_ids):
+        for csv_url in remaining:
+            if var_id and names_variable(urllib.parse.unquote(csv_url), var_id):
+                matched[nvariable] = csv_url
+                remaining.remove(csv_url)
+                break
+    for nvariable in range(len(var_ids)):
+        if matched[nvariable] is None and remaining:
+            matched[nvariable] = remaining.pop(0)
+    return matched
+
+def csv_holds_variable(csv_file:str, var_id:str, csv_sep:str=",",
+                       head_bytes:int=64*1024) -> bool:
+    """
+        True if the data column (mean_<ID>, or the bare ID) or the Title
+        line of the CSV header names var_id.
+    """
+    with open(csv_file, "rb") as f:
+        head = f.read(head_bytes).decode("utf-8", errors="replace")
+    for row in csv.reader(head.splitlines()[:-1] or head.splitlines(),
+                          delimiter=csv_sep):
+        cells = [cell.strip() for cell in row]
+        if var_id in cells or "mean_"+var_id in cells:
+            return True
+        if len(cells) > 1 and cells[0] == "Title:" and names_variable(cells[1], var_id):
+            return True
+    return False
+
+def names_variable(text:str, var_id:str) -> bool:
+    """
+        var_id occurs in text as a whole ID, e.g. not as the start of
+        M2TMNXFLX_5_12_4_PRECTOTCORR for M2TMNXFLX_5_12_4_PRECTOT.
+    """
+    return re.search(
+        r"(?<![A-Za-z0-9_])"+re.escape(var_id)+r"(?![A-Za-z0-9_])", text) is not None
+
+def match_csv_files(csv_files:list[str], var_ids:list[str],
+                    csv_sep:str=",") -> list[str]:
+    """
+        Reorder the downloaded CSVs so that each holds the variable of
+        the same index. Variables without an ID (unresolved keywords)
+        take the remaining files in order.
+
+        Raises GiovanniPermanentError if no CSV holds a variable ID.
+    """
+    remaining = list(csv_files)
+    matched = [None] * len(var_ids)
+    for nvariable, var_id in enumerate(var_ids):
+        if not var_id:
+            continue
+        for csv_file in remaining:
+            if csv_holds_variable(csv_file, var_id, csv_sep=csv_sep):
+                matched[nvariable] = csv_file
+                remaining.remove(csv_file)
+                break
+        else:
+            raise GiovanniPermanentError(
+                f"No result CSV holds variable {var_id}")
+    for nvariable in range(len(var_ids)):
+        if matched[nvariable] is None:
+            matched[nvariable] = remaining.pop(0)
+    return matched
+
+def fetch_giovanni_csv(gv:Giovanni, args, cache:GiovanniResultCache=None)->list[str]:
+    """
+        Run the plot and stream its CSVs to files, one per variable.
+        Returns the file paths: the cache entries when cache is given,
+        otherwise temporary files that the caller removes.
+
+        Raises GiovanniPermanentError when a selection step fails and
+        GiovanniTransientError when the plot or its download fails.
+    """
+    if not gv.select_plot_type(plot_type=args.plot_type):
+        raise GiovanniPermanentError("select_plot_type failed")
+
+    if not gv.select_plot_start_date(start_date=args.plot_start_date):
+        raise GiovanniPermanentError("select_plot_start_date failed")
+
+    if not gv.select_plot_end_date(end_date=args.plot_end_date):
+        raise GiovanniPermanentError("select_plot_end_date failed")
+
+    if args.plot_area_bbox:
+        if not gv.select_plot_area_by_bbox(bbox_str=args.plot_area_bbox):
+            raise GiovanniPermanentError(
+                "select_plot_area_by_bbox failed: "+str(args.plot_area_bbox))
+    if args.plot_area_shape:
+        if not gv.select_plot_area_by_shape_selector(shape_str=args.plot_area_shape):
+            raise GiovanniPermanentError(
+                "select_plot_area_by_shape_selector failed: "+str(args.plot_area_shape))
+    # all variables go into one plot request
+    variables = job_variables(args)
+    for var, is_id in variables:
+        if is_id:
+            if not gv.select_plot_variable_by_id(var_id=var):
+                raise GiovanniPermanentError(
+                    "select_plot_variable_by_id failed: "+var)
+        elif not gv.select_plot_variable_by_keywords(var_str=var):
+            raise GiovanniPermanentError(
+                "select_plot_variable_by_keywords failed: "+var)
+    if not gv.plot_data():
+        raise GiovanniTransientError("plot_data failed")
+    csv_urls = gv.get_results_csv_urls()
+    if len(csv_urls) < len(variables):
+        raise GiovanniTransientError(
+            f"{len(csv_urls)} CSV result URLs for {len(variables)} variables")
+    var_ids = resolved_variable_ids(gv, variables)
+    csv_files = list()
+    try:
+        csv_urls = match_csv_urls(csv_urls, var_ids)
+        for nvariable, csv_url in enumerate(csv_urls):
+            # named after the result URL: a retried job gets a new URL and
+            # concurrent identical jobs do not share a .part file
+            url_key = hashlib.sha256(csv_url.encode("utf-8")).hexdigest()
+            csv_file = os.path.join(
+                tempfile.gettempdir(), f"giovanni_{url_key}.csv")
+            csv_files.append(csv_file)
+            gv.download_from_earthdata(
+                url_str=csv_url,
+                username=args.username,
+                password=args.password,
+                to_file=csv_file)
+            if os.path.getsize(csv_file) == 0:
+                raise GiovanniTransientError("Empty CSV download: "+csv_url)
+        matched_files = match_csv_files(
+            csv_files, var_ids, csv_sep=args.csv_separator)
+        if cache:
+            csv_files = [
+                cache.put(key=cache.key(variable_job(args, nvariable)),
+                          csv_content=csv_file,
+                          args=variable_job(args, nvariable),
+                          url_str=csv_urls[csv_files.index(csv_file)])
+                for nvariable, csv_file in enumerate(matched_files)]
+        else:
+            csv_files = matched_files
+    except Exception:
+        # the retry downloads from a new URL, so its .part files are of no use
+        for csv_file in csv_files:
+            for path in (csv_file, csv_file+".part", csv_file+".part.json"):
+                if os.path.exists(path):
+                    os.remove(path)
+        raise
+    return csv_files
+
+def parse_giovanni_csv(gv:Giovanni, csv_content:bytes|str|list, args,
+                       time_column:str="time")->dict:
+    """
+        csv_content is one CSV, or a list with the CSV of each variable of
+        the job, which are joined on time_column. The csv_metadata of a
+        joined result is keyed by the data column of each variable, and
+        its rename is the list of the variable renames.
+    """
+    if not isinstance(csv_content, list):
+        csv_content = [csv_content]
+    rename_columns = as_list(args.rename_column)
+    parsed_variables = [
+        gv.parse_csv_content(
+            csv_content=variable_content,
+            csv_skip_rows=args.csv_skip_rows,
+            csv_skip_signature=args.csv_skip_signature,
+            csv_sep=args.csv_separator,
+            rename_column_old_name=args.rename_column_old_name,
+            rename_column=(rename_columns[nvariable]
+                           if nvariable < len(rename_columns) else None),
+            rename_column_index=args.rename_column_index,
+            time_column=time_column)
+        for nvariable, variable_content in enumerate(csv_content)]
+    parsed = parsed_variables[0]
+    if len(parsed_variables) == 1:
+        return parsed
+    table = parsed["table"]
+    for parsed_variable in parsed_variables[1:]:
+        table = table.join(parsed_variable["table"], keys=time_column,
+                           join_type="inner")
+    joined = dict(parsed)
+    joined["table"] = table.sort_by(time_column).replace_schema_metadata(
+        parsed["table"].schema.metadata)
+    # keep the header of every variable in the .metadata file
+    joined["header_lines"] = [
+        line for parsed_variable in parsed_variables
+        for line in parsed_variable["header_lines"]]
+    # and the metadata and rename of every variable, by data column
+    joined["csv_metadata"] = {
+        data_column(parsed_variable["table"], time_column): parsed_variable["csv_metadata"]
+        for parsed_variable in parsed_variables}
+    joined["rename"] = [
+        parsed_variable["rename"] for parsed_variable in parsed_variables
+        if parsed_variable["rename"]] or None
+    return joined
+
+def data_column(table:pa.Table, time_column:str="time") -> str:
+    return next((name for name in table.column_names if name != time_column),
+                time_column)
+
+def giovanni_output_manifests(args) -> list[OutputManifest]:
+    """
+        One manifest per output file of a job: the normalized Giovanni
+        request and the CSV options that shape the output. An incremental
+        run records the job's start date, not the one it fetched from.
+    """
+    params = GiovanniResultCache.normalize_request(args)
+    requested_start_date = getattr(args, "requested_start_date", None)
+    if requested_start_date is not None:
+        params["start_date"] = requested_start_date.datetime().strftime("%Y-%m-%d")
+    params.update({
+        "csv_separator": args.csv_separator,
+        "csv_skip_rows": args.csv_skip_rows,
+        "csv_skip_signature": args.csv_skip_signature,
+        "rename_column": as_list(args.rename_column),
+        "rename_column_index": args.rename_column_index,
+        "rename_column_old_name": args.rename_column_old_name,
+        "csv_keep_metadata": args.save_to_csv_file_metadata})
+    return [
+        OutputManifest(output=output, tool_file=__file__,
+                       params=dict(params, output_format=output_format))
+        for output, output_format in ((args.save_to_csv_file, "csv"),
+                                      (args.save_to_parquet_file, "parquet"))
+        if output]
+
+def giovanni_outputs_up_to_date(args) -> bool:
+    manifests = giovanni_output_manifests(args)
+    return bool(manifests) and all(
+        manifest.is_up_to_date() for manifest in manifests)
+
+def save_giovanni_csv(gv:Giovanni, csv_content:bytes|str, args,
+                      parsed:dict=None)->bool:
+    if not (args.save_to_csv_file or args.save_to_parquet_file):
+        return True
+    # parse once, write every requested format from the same table
+    if parsed is None:
+        parsed = parse_giovanni_csv(gv=gv, csv_content=csv_content, args=args)
+    if args.incremental and args.save_to_parquet_file:
+        parsed = gv.upsert_parquet_table(
+            parsed=parsed, parquet_file=args.save_to_parquet_file)
+    #save to CSV file
+    if args.save_to_csv_file:
+        gv.write_csv_file(
+            parsed=parsed,
+            csv_file=args.save_to_csv_file,
+            csv_keep_metadata=args.save_to_csv_file_metadata)
+    if args.save_to_parquet_file:
+        gv.write_parquet_file(
+            parsed=parsed,
+            parquet_file=args.save_to_parquet_file,
+            csv_keep_metadata=args.save_to_csv_file_metadata)
+    for manifest in giovanni_output_manifests(args):
+        manifest.write()
+    return True
+
+def run_giovanni_job(gv:Giovanni, args, cache:GiovanniResultCache=None)->bool:
+    csv_files = None
+    if cache:
+        csv_files = get_cached_csv_files(cache=cache, args=args)
+    if not csv_files:
+        csv_files = fetch_giovanni_csv(gv=gv, args=args, cache=cache)
+    try:
+        return save_giovanni_csv(gv=gv, csv_content=csv_files, args=args)
+    finally:
+        if not cache:
+            for csv_file in csv_files:
+                os.remove(csv_file)
+
+def split_date_range(start_date:maya.MayaDT, end_date:maya.MayaDT,
+                     chunk_years:int) -> list[tuple]:
+    """
+        Split [start_date, end_date] into consecutive windows of chunk_years.
+    """
+    windows = list()
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        next_start = chunk_start.add(years=chunk_years)
+        chunk_end = next_start.subtract(days=1)
+        if chunk_end > end_date:
+            chunk_end = end_date
+        windows.append((chunk_start, chunk_end))
+        chunk_start = next_start
+    return windows
+
+def make_chunk_jobs(args, chunk_years:int) -> list[argparse.Namespace]:
+    chunk_jobs = list()
+    windows = split_date_range(
+        start_date=args.plot_start_date,
+        end_date=args.plot_end_date,
+        chunk_years=chunk_years)
+    for nchunk, (chunk_start, chunk_end) in enumerate(windows):
+        chunk_job = argparse.Namespace(**vars(args))
+        chunk_job.plot_start_date = chunk_start
+        chunk_job.plot_end_date = chunk_end
+        chunk_job.chunk = nchunk
+        chunk_jobs.append(chunk_job)
+    return chunk_jobs
+
+def fetch_giovanni_chunk(gv:Giovanni, args,
+                         cache:GiovanniResultCache=None)->list[str]:
+    csv_files = None
+    if cache:
+        csv_files = get_cached_csv_files(cache=cache, args=args)
+    if not csv_files:
+        csv_files = fetch_giovanni_csv(gv=gv, args=args, cache=cache)
+    return csv_files
+
+def stitch_giovanni_chunks(gv:Giovanni, args, csv_files:list[list[str]],
+                           time_column:str="time") -> dict:
+    """
+        Join the chunk CSVs of one job (in date order, one list of
+        variable CSVs per chunk) into one table,
+        ordered by time_column without duplicates. Rows repeated at the
+        chunk boundaries are checked to hold the same values.
+    """
+    parsed_chunks = [
+        parse_giovanni_csv(gv=gv, csv_content=chunk_files, args=args)
+        for chunk_files in csv_files]
+    tables = [parsed["table"] for parsed in parsed_chunks]
+    schema = tables[0].schema
+    for ntable, table in enumerate(tables[1:], start=1):
+        if table.column_names != schema.names:
+            raise ValueError(f"Chunk {ntable} columns {table.column_names} "
+                             f"differ from {schema.names}")
+        if (table.num_rows and tables[ntable-1].num_rows
+            and pc.min(table[time_column]).as_py()
+                < pc.min(tables[ntable-1][time_column]).as_py()):
+            raise ValueError(f"Chunk {ntable} starts before chunk {ntable-1}")
+    table = pa.concat_tables(
+        [table.cast(schema) for table in tables]).sort_by(time_column)
+    if table.num_rows > 1:
+        previous = table.slice(0, table.num_rows-1)
+        current = table.slice(1)
+        duplicated = pc.equal(current[time_column], previous[time_column])
+        if pc.any(duplicated).as_py():
+            for name in table.column_names:
+                same = pc.equal(current[name], previous[name]).filter(duplicated)
+                if not pc.all(same).as_py():
+                    logging.warning(f"Overlapping chunk rows differ in '{name}'")
+            keep = pa.concat_arrays([
+                pa.array([True]),
+                pc.invert(duplicated).combine_chunks()])
+            table = table.filter(keep)
+    stitched = dict(parsed_chunks[0])
+    stitched["table"] = table
+    first_metadata = stitched["csv_metadata"]
+    last_metadata = parsed_chunks[-1]["csv_metadata"]
+    if len(job_variables(args)) > 1:
+        stitched["csv_metadata"] = {
+            column: stitch_csv_metadata(metadata, last_metadata.get(column, {}))
+            for column, metadata in first_metadata.items()}
+    else:
+        stitched["csv_metadata"] = stitch_csv_metadata(first_metadata, last_metadata)
+    return stitched
+
+def stitch_csv_metadata(first_metadata:dict, last_metadata:dict) -> dict:
+    csv_metadata = dict(first_metadata)
+    if "User End Date" in last_metadata:
+        csv_metadata["User End Date"] = last_metadata["User End Date"]
+    return csv_metadata
+
+def run_giovanni_chunked_jobs(pool:GiovanniWorkerPool,
+                              pending_jobs:list[tuple],
+                              chunk_years:int,
+                              cache:GiovanniResultCache=None) -> list[dict]:
+    """
+        Run the pending (njob, job) list on the pool. Jobs longer than
+        chunk_years are split into chunks, which run concurrently, are
+        retried on their own by the pool's retry policy and are then
+        stitched together.
+    """
+    pool_jobs = list()
+    for njob, job in pending_jobs:
+        chunk_jobs = list()
+        if chunk_years:
+            chunk_jobs = make_chunk_jobs(args=job, chunk_years=chunk_years)
+        if len(chunk_jobs) > 1:
+            pool_jobs.extend((njob, chunk_job) for chunk_job in chunk_jobs)
+        else:
+            pool_jobs.append((njob, job))
+
+    def job_runner(gv, job):
+        if getattr(job, "chunk", None) is None:
+            return run_giovanni_job(gv=gv, args=job, cache=cache)
+        return fetch_giovanni_chunk(gv=gv, args=job, cache=cache)
+
+    pool.job_runner = job_runner
+    pool_results = pool.run([job for _, job in pool_jobs])
+
+    results = list()
+    chunk_results = dict()
+    for result in pool_results:
+        njob, job = pool_jobs[result["job"]]
+        if getattr(job, "chunk", None) is None:
+            result["job"] = njob
+            results.append(result)
+        else:
+            chunk_results.setdefault(njob, list()).append(result)
+    saver = Giovanni()
+    for njob, job in pending_jobs:
+        if njob not in chunk_results:
+            continue
+        chunks = sorted(chunk_results[njob], key=lambda result: result["args"].chunk)
+        result = {
+            "job": njob,
+            "status": False,
+            "output": None,
+            "error": "; ".join(
+                f"chunk {chunk['args'].chunk}: {chunk['error']}"
+                for chunk in chunks if not chunk["status"]) or None,
+            "worker": None,
+            "elapsed": sum(chunk["elapsed"] or 0 for chunk in chunks),
+            "timings": [timing for chunk in chunks for timing in chunk["timings"]],
+            "attempts": sum(chunk["attempts"] for chunk in chunks),
+            "args": job}
+        csv_files = [chunk["output"] for chunk in chunks if chunk["status"]]
+        try:
+            if len(csv_files) == len(chunks):
+                stitched = stitch_giovanni_chunks(
+                    gv=saver, args=job, csv_files=csv_files)
+                result["status"] = save_giovanni_csv(
+                    gv=saver, csv_content=None, args=job, parsed=stitched)
+        except (ValueError, pa.ArrowInvalid) as ee:
+            result["error"] = repr(ee)
+        finally:
+            result["timings"] += saver.pop_step_timings()
+            if not cache:
+                for chunk_files in csv_files:
+                    for csv_file in chunk_files:
+                        os.remove(csv_file)
+        results.append(result)
+    return results
+
+def write_timing_report(results:list[dict], report_file:str) -> None:
+    """
+        The results with their step spans as one JSON document; the
+        console report is print_trace_summary.
+    """
+    report = [
+        {key: value for key, value in result.items()
+         if key not in ("args", "output")}
+        for result in results]
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+def write_trace_file(results:list[dict], trace_file:str) -> None:
+    """
+        One JSON line per step span, tagged with its job and worker.
+    """
+    with open(trace_file, "w") as f:
+        for result in results:
+            for span in result["timings"]:
+                f.write(json.dumps({
+                    "job": result["job"],
+                    "worker": result["worker"],
+                    **span}) + "\n")
+
+def print_trace_summary(results:list[dict]) -> None:
+    """
+        Totals per step over all jobs, slowest first.
+    """
+    summary = dict()
+    for result in results:
+        for span in result["timings"]:
+            step = summary.setdefault(span["step"], {
+                "count": 0, "errors": 0, "total": 0.0, "max": 0.0,
+                "bytes": 0, "rows": 0})
+            step["count"] += 1
+            step["errors"] += span.get("status") == "error"
+            step["total"] += span["elapsed"]
+            step["max"] = max(step["max"], span["elapsed"])
+            step["bytes"] += span.get("bytes") or 0
+            step["rows"] += span.get("rows") or 0
+    if not summary:
+        return
+    print(f"{'step':<36}{'count':>7}{'errors':>7}{'total s':>10}"
+          f"{'mean s':>10}{'max s':>10}{'MB':>10}{'rows':>10}")
+    for name, step in sorted(summary.items(),
+                             key=lambda item: -item[1]["total"]):
+        print(f"{name:<36}{step['count']:>7}{step['errors']:>7}"
+              f"{step['total']:>10.2f}{step['total']/step['count']:>10.2f}"
+              f"{step['max']:>10.2f}{step['bytes']/1024/1024:>10.2f}"
+              f"{step['rows']:>10}")
+
+def giovanni_main()->bool:
+    args = get_args()
+    jobs = [args]
+    if args.jobs:
+        jobs = load_jobs(jobs_file=args.jobs, args=args)
+    cache = None
+    if not args.no_cache:
+        cache = GiovanniResultCache(
+            cache_dir=args.cache_dir,
+            ttl=args.cache_ttl_hours*3600,
+            max_bytes=args.cache_max_mb*1024*1024)
+    # cache hits are saved without starting a browser
+    results = list()
+    pending_jobs = list()
+    saver = Giovanni()
+    for njob, job in enumerate(jobs):
+        if (not (job.force or job.incremental)
+                and giovanni_outputs_up_to_date(job)):
+            print(f"Job {njob}: outputs are up to date")
+            results.append({
+                "job": njob, "status": True, "output": None, "error": None, "worker": None,
+                "elapsed": 0.0, "timings": [], "attempts": 0, "args": job})
+            continue
+        if not apply_incremental(job):
+            print(f"Job {njob}: {job.save_to_parquet_file} is up to date")
+            results.append({
+                "job": njob, "status": True, "output": None, "error": None, "worker": None,
+                "elapsed": 0.0, "timings": [], "attempts": 0, "args": job})
+            continue
+        csv_files = get_cached_csv_files(cache=cache, args=job) if cache else None
+        if not csv_files:
+            pending_jobs.append((njob, job))
+            continue
+        print(f"Job {njob}: using cached result")
+        results.append({
+            "job": njob,
+            "status": save_giovanni_csv(gv=saver, csv_content=csv_files, args=job),
+            "output": None,
+            "error": None,
+            "worker": None,
+            "elapsed": 0.0,
+            "timings": saver.pop_step_timings(),
+            "attempts": 0,
+            "args": job})
+    # the catalogs may be fetched from the portal: only when there is
+    # something to download, or a refresh is asked for
+    if pending_jobs or args.refresh_variable_catalog:
+        variable_catalog = get_variable_catalog(args)
+    if pending_jobs or args.refresh_shape_catalog:
+        shape_catalog = get_shape_catalog(args)
+    if pending_jobs:
+        # one browser and one login per worker, shared by all of its jobs
+        pool = GiovanniWorkerPool(
+            giovanni_factory=lambda: get_giovanni(
+                args,
+                variable_catalog=variable_catalog,
+                shape_catalog=shape_catalog),
+            num_workers=args.workers,
+            retry_policy=get_retry_policy(args),
+            circuit_breaker=GiovanniCircuitBreaker(
+                failure_threshold=args.breaker_threshold,
+                cooldown=args.breaker_cooldown))
+        results.extend(run_giovanni_chunked_jobs(
+            pool=pool,
+            pending_jobs=pending_jobs,
+            chunk_years=args.chunk_years,
+            cache=cache))
+    results.sort(key=lambda result: result["job"])
+    failed_jobs = list()
+    if args.timing_report:
+        write_timing_report(results=results, report_file=args.timing_report)
+    if args.trace_file:
+        write_trace_file(results=results, trace_file=args.trace_file)
+    print_trace_summary(results=results)
+    for result in results:
+        if not result["status"]:
+            job = result["args"]
+            logging.error(f"Job {result['job']} failed: {job.plot_variable} "
+                          f"{job.plot_area_shape or job.plot_area_bbox} "
+                          f"{result['error'] or ''}")
+            failed_jobs.append(result["job"])
     print("Done")
+    if failed_jobs:
+        print(f"Failed jobs: {failed_jobs} of {len(jobs)}")
+        return False
     return True
 if __name__ == '__main__':
     if not giovanni_main():
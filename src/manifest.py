@@ -0,0 +1,148 @@
+"""
+    Module
+"""
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import threading
+
+__version__ = "0.1.0"
+
+@contextlib.contextmanager
+def replace_file(path:str):
+    """
+        Yield a temporary path next to path. When the block completes, the
+        temporary file replaces path, so readers never see a partial file;
+        when it fails, the temporary file is removed and path is untouched.
+    """
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_file
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+@contextlib.contextmanager
+def atomic_write(path:str, mode:str="w"):
+    """
+        open() for writing through replace_file.
+    """
+    with replace_file(path) as tmp_file:
+        with open(tmp_file, mode) as f:
+            yield f
+
+def file_sha256(file_path:str) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024*1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+@functools.lru_cache
+def tool_version(tool_file:str) -> str:
+    """
+        Toolkit version plus a hash of the tool's source, so editing a
+        tool invalidates the outputs it made.
+    """
+    return f"{__version__}+{file_sha256(tool_file)[:12]}"
+
+
+class OutputManifest:
+    """
+        Sidecar manifest <output>.manifest.json of a produced file:
+            {"tool", "version", "params", "inputs": [[path, sha256], ...],
+             "output": {"sha256", "size", "mtime_ns"}, "source"}
+
+        is_up_to_date() is True when the output is unchanged and was made
+        by the same tool version, with the same parameters, from inputs
+        with the same content, so the work can be skipped. Input hashes
+        are taken from the inputs' own manifests when their size and mtime
+        still match, so a chain of outputs is hashed once.
+
+        source, when given, records the state of a remote input (e.g. a
+        record count and fetch time). It is not compared here: the tool
+        checks it against the remote and updates it with write_source().
+    """
+    suffix = ".manifest.json"
+
+    def __init__(self, output:str, tool_file:str, params:dict,
+                 inputs:list[str]=None, source:dict=None) -> None:
+        self.output = output
+        self.tool_file = tool_file
+        self.params = params
+        self.inputs = inputs or []
+        self.source = source
+
+    @classmethod
+    def path(cls, output:str) -> str:
+        return output + cls.suffix
+
+    @classmethod
+    def load(cls, output:str) -> (dict | None):
+        try:
+            with open(cls.path(output), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def file_digest(cls, file_path:str) -> str:
+        stat = os.stat(file_path)
+        recorded = (cls.load(file_path) or {}).get("output") or {}
+        if (recorded.get("size") == stat.st_size
+                and recorded.get("mtime_ns") == stat.st_mtime_ns):
+            return recorded["sha256"]
+        return file_sha256(file_path)
+
+    def _expected(self) -> dict:
+        return {
+            "tool": os.path.basename(self.tool_file),
+            "version": tool_version(os.path.abspath(self.tool_file)),
+            # round trip, so tuples, enums and dates compare as stored
+            "params": json.loads(json.dumps(
+                self.params, sort_keys=True, default=str)),
+            "inputs": [[input_file, self.file_digest(input_file)]
+                       for input_file in self.inputs]}
+
+    def is_up_to_date(self) -> bool:
+        recorded = self.load(self.output)
+        if not recorded or not os.path.exists(self.output):
+            return False
+        try:
+            if self.file_digest(self.output) != recorded["output"]["sha256"]:
+                return False
+            expected = self._expected()
+        except (OSError, KeyError, TypeError):
+            return False
+        return all(recorded.get(key) == value
+                   for key, value in expected.items())
+
+    def write(self) -> None:
+        manifest = self._expected()
+        stat = os.stat(self.output)
+        manifest["output"] = {
+            "sha256": file_sha256(self.output),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns}
+        if self.source is not None:
+            manifest["source"] = self.source
+        with atomic_write(self.path(self.output)) as f:
+            json.dump(manifest, f, indent=2)
+
+    def recorded_source(self) -> (dict | None):
+        return (self.load(self.output) or {}).get("source")
+
+    def write_source(self, source:dict) -> None:
+        """
+            Replace the recorded source, leaving the rest of the manifest
+            as it is.
+        """
+        manifest = self.load(self.output)
+        if manifest is None:
+            return
+        manifest["source"] = source
+        with atomic_write(self.path(self.output)) as f:
+            json.dump(manifest, f, indent=2)
@@ -13,14 +13,49 @@ from enum import StrEnum
 import pyarrow as pa
 import pyarrow.csv as pv
 import pyarrow.parquet as pq
+from manifest import OutputManifest, replace_file
 
 class ParquetUtil:
+    @staticmethod
+    def join_manifest(args) -> OutputManifest:
+        return OutputManifest(
+            output=args.output,
+            tool_file=__file__,
+            params={
+                "command": "join",
+                "join_field": args.join_field,
+                "join_method": args.join_method,
+                "new_column": args.new_column,
+                "new_column_regex": args.new_column_regex},
+            inputs=ParquetUtil.expand_files(input_files=args.input_files))
+
+    @staticmethod
+    def aggregate_manifest(args) -> OutputManifest:
+        return OutputManifest(
+            output=args.output,
+            tool_file=__file__,
+            params={
+                "command": "aggregate",
+                "time_string_field": args.time_string_field,
+                "time_agg_level": args.time_agg_level,
+                "agg_method": args.agg_method,
+                "agg_fields": args.agg_fields},
+            inputs=[args.input])
+
+    @staticmethod
+    def write_output(df:pd.DataFrame, manifest:OutputManifest):
+        with replace_file(manifest.output) as tmp_file:
+            df.to_parquet(tmp_file)
+        manifest.write()
+
     @staticmethod
     def join(args):
         #print("args=", args)
-        output = args.output
-        input_files = args.input_files
-        input_files = ParquetUtil.expand_files(input_files=input_files)
+        manifest = ParquetUtil.join_manifest(args)
+        if not getattr(args, "force", False) and manifest.is_up_to_date():
+            print(f"{args.output} is up to date")
+            return
+        input_files = manifest.inputs
         join_method = args.join_method
         join_field = args.join_field
         new_column = args.new_column
@@ -53,7 +88,7 @@ class ParquetUtil:
                 how=join_method.value
             )
         
-        df1.to_parquet(output)
+        ParquetUtil.write_output(df=df1, manifest=manifest)
 
     @staticmethod
     def add_state_code_to_file(
@@ -105,7 +140,10 @@ class ParquetUtil:
     
     @staticmethod
     def aggregate(args):
-        output = args.output
+        manifest = ParquetUtil.aggregate_manifest(args)
+        if not getattr(args, "force", False) and manifest.is_up_to_date():
+            print(f"{args.output} is up to date")
+            return
         input = args.input
         time_fld = args.time_string_field
         time_agg_level = args.time_agg_level
@@ -134,7 +172,7 @@ class ParquetUtil:
         gdf = df.groupby([time_agg_level.value]).agg(ret_fields)
         gdf.columns = ret_fields_names
         gdf.reset_index()
-        gdf.to_parquet(output)
+        ParquetUtil.write_output(df=gdf, manifest=manifest)
 
 class ParquetJoinTypes(StrEnum):
     """
@@ -226,6 +264,10 @@ def get_args():
                           type=str,
                           help=("Regex for extracting the default value of the new column. "
                                 "First group match value as the defualt"))
+    cmd_join.add_argument("--force",
+                          dest="force",
+                          action="store_true",
+                          help="Join even if the output is up to date.")
     cmd_join.add_argument(dest="input_files",
                           nargs='+',
                           type=str)
@@ -256,6 +298,10 @@ def get_args():
                           dest="agg_fields",
                           type=str,
                           help="A string contains column names separated by comma to be included in the aggregation. The default is try aggregate on all fields in the dataset.")
+    cmd_agg.add_argument("--force",
+                          dest="force",
+                          action="store_true",
+                          help="Aggregate even if the output is up to date.")
     args = parser.parse_args()
     return args
 
@@ -0,0 +1,472 @@
+"""
+    Module
+"""
+import argparse
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import giovanni
+from parquet_ops import (
+    ParquetUtil,
+    ParquetJoinTypes,
+    ParquetTemporalAggLevels,
+    ParquetAggregateTypes)
+
+# Giovanni variables of the climate/ag-stats workflow:
+#   (rename column and output name, Giovanni variable keywords)
+CLIMATE_VARIABLES = [
+    ("precipitation", "total surface precipitation precipitation M2TMNXFLX"),
+    ("soil_wetness", "root zone soil wetness M2TMNXLND"),
+    ("temperature", "2-meter Air Temperature monthly mean M2SMNXSLV")]
+
+
+class PipelineStep:
+    """
+        One node of a Pipeline.
+
+        action() writes the outputs. manifests() returns the
+        OutputManifests of the outputs, built by the tool that writes them;
+        it is called when the step is about to run, after the steps in
+        depends_on have finished.
+    """
+    def __init__(self, name:str, action,
+                 outputs:list[str],
+                 manifests,
+                 depends_on:list[str]=None) -> None:
+        self.name = name
+        self.action = action
+        self.outputs = outputs
+        self.manifests = manifests
+        self.depends_on = depends_on or []
+
+    def is_up_to_date(self) -> bool:
+        """
+            Same tool version, parameters and input content as the run that
+            wrote the outputs.
+        """
+        return all(manifest.is_up_to_date() for manifest in self.manifests())
+
+
+class PipelineStepStatus:
+    done = "done"
+    skipped = "skipped"
+    failed = "failed"
+    blocked = "blocked"
+
+
+class Pipeline:
+    """
+        Runs PipelineSteps as a DAG on a thread pool: a step starts as soon
+        as the steps it depends on have finished, so independent steps
+        (e.g. the downloads of different variables and states) run
+        concurrently. Steps whose output manifests are up to date are
+        skipped, so a rerun only redoes the steps whose inputs changed.
+        The dependents of a failed step are not run.
+    """
+    def __init__(self, num_workers:int=4, force:bool=False) -> None:
+        self.num_workers = max(1, num_workers)
+        self.force = force
+        self.steps = dict()
+
+    def add(self, step:PipelineStep) -> PipelineStep:
+        if step.name in self.steps:
+            raise ValueError(f"Duplicate pipeline step: {step.name}")
+        self.steps[step.name] = step
+        return step
+
+    def _check(self) -> None:
+        for step in self.steps.values():
+            for dep in step.depends_on:
+                if dep not in self.steps:
+                    raise ValueError(f"Step {step.name} depends on unknown step {dep}")
+        # Kahn's algorithm: every step must be reachable without a cycle
+        ndeps = {name: len(step.depends_on) for name, step in self.steps.items()}
+        ready = [name for name, count in ndeps.items() if count == 0]
+        nvisited = 0
+        while ready:
+            name = ready.pop()
+            nvisited += 1
+            for other in self.steps.values():
+                if name in other.depends_on:
+                    ndeps[other.name] -= 1
+                    if ndeps[other.name] == 0:
+                        ready.append(other.name)
+        if nvisited != len(self.steps):
+            raise ValueError("Pipeline steps have a dependency cycle")
+
+    def _run_step(self, step:PipelineStep) -> str:
+        if not self.force and step.is_up_to_date():
+            print(f"[{step.name}] up to date")
+            return PipelineStepStatus.skipped
+        print(f"[{step.name}] started")
+        start = time.monotonic()
+        if step.action() is False:
+            raise RuntimeError(f"Step {step.name} returned False")
+        missing = [output for output in step.outputs if not os.path.exists(output)]
+        if missing:
+            raise RuntimeError(f"Step {step.name} did not write {missing}")
+        print(f"[{step.name}] done in {time.monotonic()-start:.1f}s")
+        return PipelineStepStatus.done
+
+    def run(self) -> dict[str, str]:
+        """
+            Returns {step name: PipelineStepStatus}.
+        """
+        self._check()
+        status = dict()
+        running = dict()
+        with ThreadPoolExecutor(max_workers=self.num_workers,
+                                thread_name_prefix="pipeline") as executor:
+            while len(status) < len(self.steps):
+                for name, step in self.steps.items():
+                    if name in status or name in running.values():
+                        continue
+                    dep_status = [status.get(dep) for dep in step.depends_on]
+                    if any(dep in (PipelineStepStatus.failed,
+                                   PipelineStepStatus.blocked)
+                           for dep in dep_status):
+                        status[name] = PipelineStepStatus.blocked
+                        logging.error(f"[{name}] not run, a dependency failed")
+                    elif all(dep in (PipelineStepStatus.done,
+                                     PipelineStepStatus.skipped)
+                             for dep in dep_status):
+                        running[executor.submit(self._run_step, step)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as ee:
+                        logging.error(f"[{name}] failed: {ee!r}")
+                        status[name] = PipelineStepStatus.failed
+        return status
+
+
+class GiovanniSessionPool:
+    """
+        Logged-in Giovanni sessions shared by the download steps. At most
+        max_sessions are started; a step waits for a free one, and the
+        workspace is reset before a session is reused.
+    """
+    def __init__(self, giovanni_factory, max_sessions:int=1) -> None:
+        self.giovanni_factory = giovanni_factory
+        self.max_sessions = max(1, max_sessions)
+        self.sessions = list()
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> giovanni.Giovanni:
+        while True:
+            with self._lock:
+                start_new = (self._idle.empty()
+                             and len(self.sessions) < self.max_sessions)
+                if start_new:
+                    self.sessions.append(None)
+            if start_new:
+                return self._start()
+            gv = self._idle.get()
+            # None: a session was discarded, its slot is free again
+            if gv and self._reset(gv):
+                return gv
+            if gv:
+                self.discard(gv)
+
+    def release(self, gv:giovanni.Giovanni, failed:bool=False) -> None:
+        """
+            A session whose job failed is only kept if its workspace
+            still resets.
+        """
+        if failed and not self._reset(gv):
+            self.discard(gv)
+            return
+        self._idle.put(gv)
+
+    def discard(self, gv:giovanni.Giovanni) -> None:
+        try:
+            gv.__exit__(None, None, None)
+        except Exception as ee:
+            logging.warning(f"closing a broken Giovanni session: {ee!r}")
+        with self._lock:
+            if gv in self.sessions:
+                self.sessions.remove(gv)
+        # wake a step waiting for a session, it starts a new one
+        self._idle.put(None)
+
+    def close(self) -> None:
+        for gv in self.sessions:
+            if gv:
+                gv.__exit__(None, None, None)
+        self.sessions = list()
+
+    def _start(self) -> giovanni.Giovanni:
+        gv = None
+        try:
+            gv = self.giovanni_factory()
+            gv.__enter__()
+            if not gv.login_status:
+                raise RuntimeError("Giovanni login failed")
+        except Exception:
+            if gv:
+                gv.__exit__(None, None, None)
+            with self._lock:
+                self.sessions.remove(None)
+            self._idle.put(None)
+            raise
+        with self._lock:
+            self.sessions[self.sessions.index(None)] = gv
+        return gv
+
+    @staticmethod
+    def _reset(gv:giovanni.Giovanni) -> bool:
+        try:
+            return bool(gv.reset_workspace())
+        except Exception as ee:
+            logging.warning(f"Giovanni workspace reset failed: {ee!r}")
+            return False
+
+
+def giovanni_download_action(sessions:GiovanniSessionPool,
+                             job:argparse.Namespace,
+                             cache:giovanni.GiovanniResultCache=None):
+    retry_policy = giovanni.get_retry_policy(job)
+    def action():
+        if cache and giovanni.get_cached_csv_files(cache=cache, args=job):
+            # cache hits are saved without a browser session
+            return giovanni.run_giovanni_job(
+                gv=giovanni.Giovanni(), args=job, cache=cache)
+        nretry = 0
+        while True:
+            gv = sessions.acquire()
+            try:
+                status = giovanni.run_giovanni_job(gv=gv, args=job, cache=cache)
+            except Exception as ee:
+                sessions.release(gv, failed=True)
+                if (not retry_policy.is_transient(ee)
+                        or nretry >= retry_policy.max_retries):
+                    raise
+                nretry += 1
+                delay = retry_policy.delay(nretry)
+                logging.warning(f"{job.save_to_parquet_file}: {ee!r}, "
+                                f"retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            sessions.release(gv, failed=not status)
+            return status
+    return action
+
+def parquet_join_args(output:str, input_files:list[str],
+                      join_field:str,
+                      join_method:ParquetJoinTypes) -> argparse.Namespace:
+    return argparse.Namespace(
+        output=output,
+        input_files=input_files,
+        join_field=join_field,
+        join_method=join_method,
+        new_column=None,
+        new_column_regex=None,
+        # the pipeline already checked the manifest
+        force=True)
+
+def parquet_aggregate_args(output:str, input_file:str) -> argparse.Namespace:
+    return argparse.Namespace(
+        output=output,
+        input=input_file,
+        time_string_field="time",
+        time_agg_level=ParquetTemporalAggLevels.year,
+        agg_method=ParquetAggregateTypes.mean,
+        agg_fields=None,
+        force=True)
+
+def parse_state(state:str) -> tuple[str, str]:
+    """
+        "IN:Indiana" -> ("in", "Indiana")
+    """
+    state_code, _, state_name = state.partition(":")
+    if not state_name:
+        raise ValueError(f"State should be <code>:<name>, e.g. IN:Indiana: {state}")
+    return state_code.lower(), state_name
+
+def add_state_steps(pipeline:Pipeline, args, state:str,
+                    sessions:GiovanniSessionPool,
+                    cache:giovanni.GiovanniResultCache=None) -> None:
+    """
+        download (one per variable) -> monthly join -> yearly aggregate
+        -> ag-stats join, as in bin/gv_download_pq_left_join_ag_stats.sh
+    """
+    state_code, state_name = parse_state(state)
+    output_dir = os.path.expanduser(args.output_dir)
+    ag_stats_dir = os.path.expanduser(args.ag_stats_dir or args.output_dir)
+    monthly_files = list()
+    download_steps = list()
+    for variable_name, plot_variable in CLIMATE_VARIABLES:
+        parquet_file = os.path.join(
+            output_dir, f"{state_code}_monthly_{variable_name}.parquet")
+        job = giovanni.get_args(args.giovanni_argv + [
+            "--plot-type", "Time Series, Area-Averaged",
+            "--plot-start-date", args.plot_start_date,
+            "--plot-end-date", args.plot_end_date,
+            "--plot-area-shape", f"US States {state_name}",
+            "--plot-variable", plot_variable,
+            "--rename-column", variable_name,
+            "--rename-column-index", "1",
+            "--save-to-csv-file", os.path.join(
+                output_dir, f"{state_code}_monthly_{variable_name}.csv"),
+            "--save-to-csv-file-metadata",
+            "--csv-skip-signature", "time, mean_",
+            "--save-to-parquet-file", parquet_file])
+        step = pipeline.add(PipelineStep(
+            name=f"{state_code}/download/{variable_name}",
+            action=giovanni_download_action(
+                sessions=sessions, job=job, cache=cache),
+            outputs=[parquet_file],
+            manifests=functools.partial(giovanni.giovanni_output_manifests, job)))
+        download_steps.append(step.name)
+        monthly_files.append(parquet_file)
+
+    monthly_file = os.path.join(output_dir, f"{state_code}_monthly_combine.parquet")
+    monthly_args = parquet_join_args(
+        output=monthly_file,
+        input_files=monthly_files,
+        join_field="time",
+        join_method=ParquetJoinTypes.inner)
+    pipeline.add(PipelineStep(
+        name=f"{state_code}/monthly_join",
+        action=functools.partial(ParquetUtil.join, monthly_args),
+        outputs=[monthly_file],
+        manifests=lambda: [ParquetUtil.join_manifest(monthly_args)],
+        depends_on=download_steps))
+
+    year_file = os.path.join(output_dir, f"{state_code}_year_combine.parquet")
+    year_args = parquet_aggregate_args(output=year_file, input_file=monthly_file)
+    pipeline.add(PipelineStep(
+        name=f"{state_code}/yearly_aggregate",
+        action=functools.partial(ParquetUtil.aggregate, year_args),
+        outputs=[year_file],
+        manifests=lambda: [ParquetUtil.aggregate_manifest(year_args)],
+        depends_on=[f"{state_code}/monthly_join"]))
+
+    # the one wide table of bin/ag_state_crop.sh, not the older
+    # survey_<state>_<crop>_<statistic>.parquet files left in the directory
+    ag_stats_file = os.path.join(ag_stats_dir, f"survey_{state_code}_crops.parquet")
+    join_file = os.path.join(output_dir, f"{state_code}_climate_ag_stats.parquet")
+    join_args = parquet_join_args(
+        output=join_file,
+        input_files=[year_file, ag_stats_file],
+        join_field="year",
+        join_method=ParquetJoinTypes.left)
+    pipeline.add(PipelineStep(
+        name=f"{state_code}/ag_stats_join",
+        action=functools.partial(ParquetUtil.join, join_args),
+        outputs=[join_file],
+        manifests=lambda: [ParquetUtil.join_manifest(join_args)],
+        depends_on=[f"{state_code}/yearly_aggregate"]))
+
+#--------main-----------
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Climate and ag-stats pipeline: Giovanni downloads, "
+        "monthly join, yearly aggregate and ag-stats join for each state"
+    )
+    parser.add_argument("--output-dir",
+                        dest="output_dir",
+                        type=str,
+                        required=True)
+    parser.add_argument("--ag-stats-dir",
+                        dest="ag_stats_dir",
+                        type=str,
+                        help="Directory of the survey_<state>_crops.parquet ag stats files. "
+                        "Default = output dir")
+    parser.add_argument("--states",
+                        dest="states",
+                        type=str,
+                        nargs="+",
+                        required=True,
+                        help="States as <code>:<name>, e.g. IN:Indiana OH:Ohio")
+    parser.add_argument("--plot-start-date",
+                        dest="plot_start_date",
+                        type=str,
+                        default="January 1, 2001")
+    parser.add_argument("--plot-end-date",
+                        dest="plot_end_date",
+                        type=str,
+                        default="2023-12-31")
+    parser.add_argument("--earthdata-login-name",
+                        dest="username",
+                        type=str)
+    parser.add_argument("--earthdata-login-pass",
+                        dest="password",
+                        type=str)
+    parser.add_argument("--workers",
+                        dest="workers",
+                        type=int,
+                        default=4,
+                        help="Number of steps running concurrently. Default = 4")
+    parser.add_argument("--giovanni-workers",
+                        dest="giovanni_workers",
+                        type=int,
+                        default=1,
+                        help="Number of Giovanni sessions (browsers) shared by the "
+                        "download steps. Default = 1")
+    parser.add_argument("--force",
+                        dest="force",
+                        action="store_true",
+                        help="Run every step, even when its outputs are up to date.")
+    parser.add_argument("--giovanni-option",
+                        dest="giovanni_options",
+                        type=str,
+                        action="append",
+                        default=[],
+                        help="Extra giovanni.py option for the downloads, e.g. "
+                        "--giovanni-option=--headless or "
+                        "--giovanni-option=--backend=http. Repeatable.")
+    args = parser.parse_args()
+    args.giovanni_argv = list(args.giovanni_options)
+    if args.username:
+        args.giovanni_argv += ["--earthdata-login-name", args.username]
+    if args.password:
+        args.giovanni_argv += ["--earthdata-login-pass", args.password]
+    return args
+
+def pipeline_main()->bool:
+    args = get_args()
+    giovanni_args = giovanni.get_args(args.giovanni_argv)
+    cache = None
+    if not giovanni_args.no_cache:
+        cache = giovanni.GiovanniResultCache(
+            cache_dir=giovanni_args.cache_dir,
+            ttl=giovanni_args.cache_ttl_hours*3600,
+            max_bytes=giovanni_args.cache_max_mb*1024*1024)
+    variable_catalog = giovanni.get_variable_catalog(giovanni_args)
+    shape_catalog = giovanni.get_shape_catalog(giovanni_args)
+    sessions = GiovanniSessionPool(
+        giovanni_factory=lambda: giovanni.get_giovanni(
+            giovanni_args,
+            variable_catalog=variable_catalog,
+            shape_catalog=shape_catalog),
+        max_sessions=args.giovanni_workers)
+    pipeline = Pipeline(num_workers=args.workers, force=args.force)
+    for state in args.states:
+        add_state_steps(pipeline=pipeline, args=args, state=state,
+                        sessions=sessions, cache=cache)
+    try:
+        status = pipeline.run()
+    finally:
+        sessions.close()
+    failed = [name for name, step_status in status.items()
+              if step_status in (PipelineStepStatus.failed,
+                                 PipelineStepStatus.blocked)]
+    for name in failed:
+        print(f"{name}: {status[name]}")
+    return not failed
+
+if __name__ == "__main__":
+    if not pipeline_main():
+        print("Failed.")
+    else:
+        print("Success!")
@@ -0,0 +1,211 @@
+"""
+    Module
+"""
+import argparse
+import csv
+import io
+import json
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from agstats import (NassQuickStatsClient, NassQuickStatsCrops, NassQuickStatsFormat,
+                     NassQuickStatsUtil, NassQuickStatsValueType)
+from manifest import OutputManifest
+
+def test_convert_values_int64():
+    batch = pa.record_batch({"Value": [" 1,234 ", "(D)", "12.5", "n/a", "", "12.0"]})
+    converted = NassQuickStatsUtil.convert_values(
+        batch=batch, value_column="Value", value_type=NassQuickStatsValueType.int64)
+    assert converted.schema.field("Value").type == pa.int64()
+    assert converted.column(0).to_pylist() == [1234, None, None, None, None, 12]
+    assert converted.column(1).to_pylist() == [None, "(D)", "12.5", "n/a", None, None]
+
+def test_convert_values_float64():
+    batch = pa.record_batch({"Value": ["(Z)", "0.5", "-3"]})
+    converted = NassQuickStatsUtil.convert_values(
+        batch=batch, value_column="Value", value_type=NassQuickStatsValueType.float64)
+    assert converted.column(0).to_pylist() == [None, 0.5, -3.0]
+    assert converted.column(1).to_pylist() == ["(Z)", None, None]
+
+def test_convert_values_string():
+    batch = pa.record_batch({"Value": ["(D)", "1,234"]})
+    assert NassQuickStatsUtil.convert_values(
+        batch=batch, value_column="Value",
+        value_type=NassQuickStatsValueType.string) is batch
+
+def test_json_and_csv_batches_have_the_same_schema(monkeypatch):
+    records = [{"year": 2000+n, "state_alpha": "IN", "CV (%)": "1.5" if n < 20 else "(D)",
+                "Value": f"{n},000"} for n in range(40)]
+    json_body = io.BytesIO(json.dumps({"data": records}).encode("utf-8"))
+    csv_body = io.StringIO()
+    writer = csv.DictWriter(csv_body, fieldnames=list(records[0]))
+    writer.writeheader()
+    writer.writerows(records)
+    # several CSV blocks, so "(D)" comes after blocks of numbers
+    monkeypatch.setattr(NassQuickStatsUtil, "chunk_size", 256)
+    tables = [
+        pa.Table.from_batches(list(NassQuickStatsUtil.response_batches(
+            data_file=data_file, response_format=response_format,
+            columns=[], names=[], batch_rows=16,
+            value_type=NassQuickStatsValueType.float64)))
+        for data_file, response_format in (
+            (json_body, NassQuickStatsFormat.json),
+            (io.BytesIO(csv_body.getvalue().encode("utf-8")), NassQuickStatsFormat.csv))]
+    assert tables[0].schema == tables[1].schema
+    assert tables[0].schema.field("CV (%)").type == pa.string()
+    assert tables[0].equals(tables[1])
+
+class FakeQuickStatsClient:
+    """
+        get_counts and get_param_values over in-memory records; repeated
+        fields are ORed like the QuickStats API does.
+    """
+    max_records = 10
+    partition_fields = NassQuickStatsClient.partition_fields
+
+    def __init__(self, records:list[dict]) -> None:
+        self.records = records
+        self.calls = 0
+
+    def _matches(self, search_conditions:list[str]) -> list[dict]:
+        values = dict()
+        for qstr in search_conditions:
+            field, _, value = qstr.split(";")
+            values.setdefault(field, set()).add(value)
+        return [record for record in self.records
+                if all(str(record[field]) in field_values
+                       for field, field_values in values.items())]
+
+    def get_counts(self, search_conditions:list[str]) -> dict:
+        self.calls += 1
+        return {"count": len(self._matches(search_conditions))}
+
+    def get_param_values(self, parameter:str, search_conditions:list[str]) -> dict:
+        self.calls += 1
+        return {parameter: sorted({str(record[parameter])
+                                   for record in self._matches(search_conditions)})}
+
+def test_partition_conditions_fits_max_records():
+    records = [{"year": 2020, "state_alpha": state, "county_ansi": f"{county:03d}"}
+               for state in ("IN", "IL", "OH")
+               for county in range(8)]
+    client = FakeQuickStatsClient(records)
+    partitions = NassQuickStatsUtil.partition_conditions(
+        client=client, search_conditions=["state_alpha;;IN", "state_alpha;;IL"])
+    assert sum(count for _, count in partitions) == 16
+    assert all(0 < count <= client.max_records for _, count in partitions)
+    # the IN list is split into its values, not queried with get_param_values
+    assert sorted(conditions[-1] for conditions, _ in partitions) == [
+        "state_alpha;;IL", "state_alpha;;IN"]
+
+def test_partition_conditions_splits_on_get_param_values():
+    records = [{"year": year, "state_alpha": "IN", "county_ansi": "001"}
+               for year in range(2000, 2012)] * 2
+    client = FakeQuickStatsClient(records)
+    partitions = NassQuickStatsUtil.partition_conditions(
+        client=client, search_conditions=[])
+    assert [conditions for conditions, _ in partitions] == [
+        [f"year;;{year}"] for year in range(2000, 2012)]
+
+def test_partition_conditions_fails_when_it_can_not_split():
+    client = FakeQuickStatsClient(
+        [{"year": 2020, "state_alpha": "IN", "county_ansi": "001"}] * 11)
+    with pytest.raises(ValueError):
+        NassQuickStatsUtil.partition_conditions(client=client, search_conditions=[])
+
+def test_iter_records_across_chunks(monkeypatch):
+    records = [{"year": 2000+n, "short_desc": "CORN, GRAIN - YIELD",
+                "county_name": "LA PORTE éè", "note": 'brace } and "quote" ['}
+               for n in range(50)]
+    body = json.dumps({"data": records}, ensure_ascii=False).encode("utf-8")
+    # chunks end inside records, strings, escapes and multi-byte characters
+    for chunk_size in (1, 2, 3, 7, 64):
+        monkeypatch.setattr(NassQuickStatsUtil, "chunk_size", chunk_size)
+        assert list(NassQuickStatsUtil.iter_records(io.BytesIO(body))) == records
+
+def test_iter_records_empty_data():
+    assert list(NassQuickStatsUtil.iter_records(io.BytesIO(b'{"data": []}'))) == []
+
+class FakeCountsClient:
+    """
+        get_counts of a query with count records, loaded more records
+        since the last fetch.
+    """
+    def __init__(self, count:int, loaded:int=0) -> None:
+        self.count = count
+        self.loaded = loaded
+        self.calls = 0
+
+    def get_counts(self, search_conditions:list[str]) -> dict:
+        self.calls += 1
+        if any(qstr.startswith("load_time;") for qstr in search_conditions):
+            return {"count": self.loaded}
+        return {"count": self.count}
+
+@pytest.mark.parametrize("count, loaded, current", [
+    (5, 0, True), (6, 0, False), (5, 1, False)])
+def test_is_current_revalidates_after_ttl(monkeypatch, tmp_path, count, loaded, current):
+    output = str(tmp_path / "data.parquet")
+    with open(output, "wb") as f:
+        f.write(b"data")
+    search_conditions = ["year;;2020"]
+    manifest = OutputManifest(output=output, tool_file=__file__,
+                              params={"search_conditions": search_conditions})
+    fetched = time.time() - 48*3600
+    manifest.source = NassQuickStatsUtil.manifest_source(5, fetched)
+    manifest.write()
+    client = FakeCountsClient(count=count, loaded=loaded)
+    monkeypatch.setattr(NassQuickStatsUtil, "get_client", lambda args: client)
+
+    # checked within the TTL: no request
+    args = argparse.Namespace(force=False, cache_ttl_hours=72)
+    assert NassQuickStatsUtil.is_current(args, manifest, search_conditions)
+    assert client.calls == 0
+
+    args = argparse.Namespace(force=False, cache_ttl_hours=24)
+    assert NassQuickStatsUtil.is_current(args, manifest, search_conditions) == current
+    assert client.calls > 0
+    validated = manifest.recorded_source()["validated"]
+    assert (validated > fetched) == current
+    assert manifest.recorded_source()["fetched"] == fetched
+
+def crop_rows_batch(rows:list[tuple]) -> pa.RecordBatch:
+    columns = NassQuickStatsCrops.columns
+    batch = pa.RecordBatch.from_arrays(
+        [pa.array([str(row[n]) for row in rows], pa.string()) for n in range(len(columns))],
+        names=columns)
+    batch = batch.set_column(1, "year", batch.column(1).cast(pa.int64()))
+    return NassQuickStatsUtil.convert_values(
+        batch=batch, value_column="Value", value_type=NassQuickStatsValueType.float64)
+
+@pytest.mark.parametrize("rows", [[
+    ("IN", 2020, "CORN", "YIELD", "BU / ACRE", "GRAIN", "180.5"),
+    ("IN", 2020, "SOYBEANS", "YIELD", "BU / ACRE", "ALL UTILIZATION PRACTICES", "(D)"),
+    ("IN", 2021, "CORN", "YIELD", "BU / ACRE", "GRAIN", "190"),
+    ("IN", 2021, "CORN", "AREA PLANTED", "ACRES", "ALL UTILIZATION PRACTICES", "5,400,000"),
+], []])
+def test_crops_keeps_the_value_flags(monkeypatch, tmp_path, rows):
+    def for_each_batch(args, columns, names, consume):
+        if rows:
+            consume(crop_rows_batch(rows))
+        return len(rows)
+
+    monkeypatch.setattr(NassQuickStatsUtil, "for_each_batch", for_each_batch)
+    output = str(tmp_path / "crops.parquet")
+    args = argparse.Namespace(
+        output=output, commodities="CORN;SOYBEANS", statistics="yield;acres",
+        search_conditions=["state_alpha;;IN"], format="json", force=True)
+    NassQuickStatsUtil.crops(args)
+    table = pq.read_table(output)
+    assert table.column_names == [
+        "state_alpha", "year",
+        "corn_yield", "corn_yield_flag", "corn_acres", "corn_acres_flag",
+        "soybeans_yield", "soybeans_yield_flag", "soybeans_acres", "soybeans_acres_flag"]
+    assert pa.types.is_dictionary(table.schema.field("soybeans_yield_flag").type)
+    if rows:
+        assert table["corn_yield"].to_pylist() == [180.5, 190.0]
+        assert table["corn_acres"].to_pylist() == [None, 5400000.0]
+        assert table["soybeans_yield"].to_pylist() == [None, None]
+        assert table["soybeans_yield_flag"].to_pylist() == ["(D)", None]
+        assert table["corn_yield_flag"].to_pylist() == [None, None]
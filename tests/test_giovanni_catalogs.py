@@ -0,0 +1,21 @@
+"""
+    Module
+"""
+import giovanni
+from giovanni import GiovanniShapeCatalog, GiovanniShapeGroups
+
+def test_shape_lookup_is_exact():
+    catalog = GiovanniShapeCatalog()
+    catalog.add(GiovanniShapeGroups.TIGERLINE_USSTATES, "Arkansas", "tl_2014_us_state/shp_4")
+    catalog.add(GiovanniShapeGroups.TIGERLINE_USSTATES, "Indiana", "tl_2014_us_state/shp_13")
+    assert catalog.lookup("US States indiana") == (
+        GiovanniShapeGroups.TIGERLINE_USSTATES, "Indiana", "tl_2014_us_state/shp_13")
+    assert catalog.lookup("US States Kansas") is None
+
+def test_variable_resolve_by_keywords():
+    catalog = giovanni.GiovanniVariableCatalog()
+    catalog.add([{"dataFieldId": "M2TMNXFLX_5_12_4_PRECTOT",
+                  "dataFieldLongName": "Total precipitation",
+                  "dataProductShortName": "M2TMNXFLX"}])
+    assert catalog.resolve("precipitation M2TMNXFLX") == "M2TMNXFLX_5_12_4_PRECTOT"
+    assert catalog.resolve("snowfall") is None
@@ -0,0 +1,96 @@
+"""
+    Module
+"""
+import http.server
+import json
+import threading
+import pytest
+from giovanni import EarthdataSession
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+        Serves server.body with a strong ETag, honouring Range only when
+        If-Range matches it.
+    """
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.body
+        start = 0
+        range_str = self.headers.get("Range")
+        if range_str and self.headers.get("If-Range") == server.etag:
+            start = int(range_str.split("=")[1].rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body)-1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(body)-start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+@pytest.fixture
+def range_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.requests = list()
+    server.body = b"0123456789"
+    server.etag = '"v1"'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def leave_part(file_path:str, content:bytes, url_str:str=None, validator:str=None) -> None:
+    with open(file_path + ".part", "wb") as f:
+        f.write(content)
+    if url_str:
+        with open(file_path + ".part.json", "w") as f:
+            json.dump({"url": url_str, "validator": validator}, f)
+
+def url(server) -> str:
+    return f"http://127.0.0.1:{server.server_port}/result.csv"
+
+def download(server, file_path:str) -> bytes:
+    with EarthdataSession() as session:
+        nbytes = session.download_to_file(url(server), file_path=file_path)
+    with open(file_path, "rb") as f:
+        content = f.read()
+    assert nbytes == len(content)
+    return content
+
+def test_download_resumes_a_validated_part(range_server, tmp_path):
+    file_path = str(tmp_path / "result.csv")
+    leave_part(file_path, b"0123", url(range_server), '"v1"')
+    assert download(range_server, file_path) == b"0123456789"
+    assert range_server.requests[0]["Range"] == "bytes=4-"
+    assert not (tmp_path / "result.csv.part").exists()
+    assert not (tmp_path / "result.csv.part.json").exists()
+
+def test_download_refetches_a_changed_file(range_server, tmp_path):
+    file_path = str(tmp_path / "result.csv")
+    leave_part(file_path, b"abcd", url(range_server), '"v0"')
+    assert download(range_server, file_path) == b"0123456789"
+
+@pytest.mark.parametrize("meta_url", [None, "http://127.0.0.1:1/other.csv"])
+def test_download_restarts_an_unvalidated_part(range_server, tmp_path, meta_url):
+    file_path = str(tmp_path / "result.csv")
+    leave_part(file_path, b"abcd", meta_url, '"v1"')
+    assert download(range_server, file_path) == b"0123456789"
+    assert "Range" not in range_server.requests[0]
+
+def test_download_restarts_on_416(range_server, tmp_path):
+    file_path = str(tmp_path / "result.csv")
+    leave_part(file_path, b"0123456789abc", url(range_server), '"v1"')
+    assert download(range_server, file_path) == b"0123456789"
+    assert len(range_server.requests) == 2
+    assert "Range" not in range_server.requests[1]
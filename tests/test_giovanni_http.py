@@ -0,0 +1,140 @@
+"""
+    Module
+"""
+import http.server
+import json
+import sys
+import threading
+import urllib.parse
+import pyarrow.parquet as pq
+import pytest
+import giovanni
+
+VARIABLE_ID = "M2TMNXFLX_5_12_4_PRECTOT"
+RESULT_CSV = (
+    f"Title:,Area-averaged time series of {VARIABLE_ID}\n"
+    "User Start Date:,2020-01-01T00:00:00Z\n"
+    "User End Date:,2020-03-31T23:59:59Z\n"
+    "\n"
+    f"time,mean_{VARIABLE_ID}\n"
+    "2020-01-01 00:00:00,1.5\n"
+    "2020-02-01 00:00:00,2.5\n"
+    "2020-03-01 00:00:00,3.5\n")
+
+class FakeGiovanniHandler(http.server.BaseHTTPRequestHandler):
+    """
+        Stand-in for the Giovanni service manager, catalog, shape and
+        result endpoints. A plot is complete on its second poll.
+    """
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, body:bytes, content_type:str="application/json") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        server = self.server
+        server.requests.append((url.path, params))
+        root = f"http://127.0.0.1:{server.server_port}/giovanni"
+        if url.path.endswith(giovanni.GiovanniHttpClient.service_path):
+            complete = "session" in params
+            if not complete:
+                server.plot_data = params["data"][0]
+            status = {"percentComplete": 100 if complete else 50, "code": 0}
+            result = {"id": "R1", "status": status}
+            if complete:
+                result["data"] = [{"url": f"{root}/session/R1/"
+                                          f"g4.areaAvgTimeSeries.{server.plot_data}.csv"}]
+            self._send(json.dumps({"session": {
+                "id": "S1", "resultset": {"id": "RS1", "result": result}}}).encode())
+        elif url.path.endswith(giovanni.GiovanniHttpClient.catalog_path):
+            self._send(json.dumps({"response": {"numFound": 1, "docs": [{
+                "dataFieldId": VARIABLE_ID,
+                "dataFieldLongName": "Total precipitation",
+                "dataProductShortName": "M2TMNXFLX"}]}}).encode())
+        elif url.path.endswith(giovanni.GiovanniHttpClient.shape_path):
+            self._send(json.dumps({"available": {"tl_2014_us_state": {
+                "title": "US States",
+                "shapes": [{"name": "Indiana", "id": "shp_13"}]}}}).encode())
+        elif url.path.endswith(".csv"):
+            self._send(RESULT_CSV.encode(), content_type="text/csv")
+        else:
+            self.send_error(404)
+
+@pytest.fixture
+def fake_giovanni():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeGiovanniHandler)
+    server.requests = list()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def giovanni_argv(server, tmp_path) -> list[str]:
+    return ["--backend", "http",
+            "--earthdata-login-name", "user", "--earthdata-login-pass", "pass",
+            "--giovanni-root", f"http://127.0.0.1:{server.server_port}/giovanni",
+            "--plot-type", giovanni.GiovanniPlotTypes.ArAvTs.value,
+            "--plot-start-date", "2020-01-01",
+            "--plot-end-date", "2020-03-31",
+            "--plot-area-shape", "US States Indiana",
+            "--plot-variable", "precipitation M2TMNXFLX",
+            "--rename-column", "precipitation",
+            "--csv-skip-signature", "time,",
+            "--cache-dir", str(tmp_path / "cache"),
+            "--save-to-parquet-file", str(tmp_path / "in_precipitation.parquet")]
+
+def test_http_client_polls_and_downloads(fake_giovanni, tmp_path):
+    args = giovanni.get_args(giovanni_argv(fake_giovanni, tmp_path))
+    gv = giovanni.GiovanniHttpClient(
+        giovanni_root=args.giovanni_root, poll_interval=0.01,
+        variable_catalog=giovanni.get_variable_catalog(args),
+        shape_catalog=giovanni.get_shape_catalog(args))
+    assert giovanni.run_giovanni_job(gv=gv, args=args)
+    table = pq.read_table(args.save_to_parquet_file)
+    assert table.column_names == ["time", "precipitation"]
+    assert table["precipitation"].to_pylist() == [1.5, 2.5, 3.5]
+    plot_params = [params for path, params in fake_giovanni.requests
+                   if path.endswith(giovanni.GiovanniHttpClient.service_path)]
+    # submitted once, then polled until complete
+    assert len(plot_params) == 2
+    assert plot_params[0]["data"] == [VARIABLE_ID]
+    assert plot_params[0]["shape"] == ["tl_2014_us_state/shp_13"]
+    assert plot_params[1]["session"] == ["S1"]
+
+def test_giovanni_main_http_backend(fake_giovanni, tmp_path, monkeypatch):
+    argv = giovanni_argv(fake_giovanni, tmp_path)
+    monkeypatch.setattr(sys, "argv", ["giovanni.py"] + argv)
+    assert giovanni.giovanni_main()
+    assert pq.read_table(tmp_path / "in_precipitation.parquet").num_rows == 3
+    # the second run is served from the manifest, without a plot request
+    nrequests = len(fake_giovanni.requests)
+    assert giovanni.giovanni_main()
+    assert len(fake_giovanni.requests) == nrequests
+    # nor are the catalogs rebuilt for it
+    for catalog_file in (tmp_path / "cache").glob("*.json"):
+        catalog_file.unlink()
+    assert giovanni.giovanni_main()
+    assert len(fake_giovanni.requests) == nrequests
+
+def test_incremental_manifest_keeps_the_job_start_date(fake_giovanni, tmp_path, monkeypatch):
+    argv = giovanni_argv(fake_giovanni, tmp_path)
+    monkeypatch.setattr(sys, "argv", ["giovanni.py"] + argv)
+    assert giovanni.giovanni_main()
+    argv[argv.index("--plot-end-date")+1] = "2020-06-30"
+    monkeypatch.setattr(sys, "argv", ["giovanni.py"] + argv + ["--incremental"])
+    assert giovanni.giovanni_main()
+    plot_params = [params for path, params in fake_giovanni.requests
+                   if path.endswith(giovanni.GiovanniHttpClient.service_path)
+                   and "starttime" in params]
+    assert plot_params[-1]["starttime"][0].startswith("2020-04-01")
+    manifest = giovanni.OutputManifest.load(str(tmp_path / "in_precipitation.parquet"))
+    assert manifest["params"]["start_date"] == "2020-01-01"
+    assert manifest["params"]["end_date"] == "2020-06-30"
@@ -0,0 +1,132 @@
+"""
+    Module
+"""
+import threading
+import time
+import giovanni
+from giovanni import GiovanniRetryPolicy, GiovanniTransientError, GiovanniWorkerPool
+
+class FakeGiovanni:
+    """
+        Stands in for a logged-in Giovanni browser.
+    """
+    def __init__(self, login_status:bool=True, reset_error:Exception=None) -> None:
+        self.login_status = login_status
+        self.reset_error = reset_error
+        self.entered = False
+        self.exited = False
+        self.step_timings = list()
+
+    def __enter__(self):
+        self.entered = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.exited = True
+
+    def reset_workspace(self) -> bool:
+        if self.reset_error:
+            raise self.reset_error
+        return True
+
+    def pop_step_timings(self) -> list[dict]:
+        step_timings = self.step_timings
+        self.step_timings = list()
+        return step_timings
+
+def no_delay_policy(max_retries:int) -> GiovanniRetryPolicy:
+    return GiovanniRetryPolicy(max_retries=max_retries, base_delay=0.0, max_delay=0.0)
+
+def test_pool_caps_concurrency_and_keeps_job_order():
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+    instances = list()
+
+    def factory():
+        instances.append(FakeGiovanni())
+        return instances[-1]
+
+    def job_runner(gv, job):
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return f"output {job}"
+
+    pool = GiovanniWorkerPool(giovanni_factory=factory, num_workers=3,
+                              job_runner=job_runner)
+    results = pool.run(list(range(10)))
+    assert [result["output"] for result in results] == [f"output {n}" for n in range(10)]
+    assert all(result["status"] for result in results)
+    assert max_running <= 3 and len(instances) == 3
+    assert all(gv.exited for gv in instances)
+
+def test_pool_retries_transient_errors_only():
+    attempts = dict()
+
+    def job_runner(gv, job):
+        attempts[job] = attempts.get(job, 0) + 1
+        if job == "flaky" and attempts[job] == 1:
+            raise GiovanniTransientError("plot_data failed")
+        if job == "bad":
+            raise giovanni.GiovanniPermanentError("select_plot_type failed")
+        return True
+
+    pool = GiovanniWorkerPool(giovanni_factory=FakeGiovanni, num_workers=1,
+                              job_runner=job_runner, retry_policy=no_delay_policy(2))
+    flaky, bad = pool.run(["flaky", "bad"])
+    assert flaky["status"] and flaky["attempts"] == 2
+    assert not bad["status"] and bad["attempts"] == 1
+    assert "select_plot_type failed" in bad["error"]
+
+def test_pool_restarts_a_broken_browser():
+    instances = [FakeGiovanni(reset_error=RuntimeError("browser gone")), FakeGiovanni()]
+    started = iter(instances)
+    pool = GiovanniWorkerPool(giovanni_factory=lambda: next(started), num_workers=1,
+                              job_runner=lambda gv, job: id(gv))
+    first, second = pool.run(["a", "b"])
+    assert first["output"] == id(instances[0])
+    assert second["output"] == id(instances[1])
+    assert instances[0].exited
+
+def test_pool_stops_a_worker_whose_browser_can_not_restart():
+    instances = [FakeGiovanni(reset_error=RuntimeError("browser gone")),
+                 FakeGiovanni(login_status=False), FakeGiovanni(login_status=False)]
+    started = iter(instances)
+    pool = GiovanniWorkerPool(giovanni_factory=lambda: next(started), num_workers=1,
+                              job_runner=lambda gv, job: True,
+                              retry_policy=no_delay_policy(1))
+    first, second = pool.run(["a", "b"])
+    assert first["status"]
+    assert not second["status"] and second["error"] == "No worker available"
+    assert all(gv.exited for gv in instances)
+
+def test_pool_without_login_leaves_the_jobs_failed():
+    pool = GiovanniWorkerPool(giovanni_factory=lambda: FakeGiovanni(login_status=False),
+                              num_workers=2, job_runner=lambda gv, job: True)
+    results = pool.run(["a", "b"])
+    assert [result["error"] for result in results] == ["No worker available"] * 2
+
+def test_chunked_job_result_sums_the_chunk_attempts(monkeypatch, tmp_path):
+    job = giovanni.get_args([
+        "--plot-start-date", "2000-01-01", "--plot-end-date", "2003-12-31",
+        "--plot-variable", "precipitation",
+        "--save-to-parquet-file", str(tmp_path / "precipitation.parquet")])
+
+    def fetch_giovanni_chunk(gv, args, cache=None):
+        raise GiovanniTransientError("plot_data failed")
+
+    monkeypatch.setattr(giovanni, "fetch_giovanni_chunk", fetch_giovanni_chunk)
+    pool = GiovanniWorkerPool(giovanni_factory=FakeGiovanni, num_workers=2,
+                              retry_policy=no_delay_policy(1))
+    result, = giovanni.run_giovanni_chunked_jobs(
+        pool=pool, pending_jobs=[(0, job)], chunk_years=1)
+    assert not result["status"]
+    # 4 one-year chunks, each tried twice
+    assert result["attempts"] == 8
+    assert set(result) == {"job", "status", "output", "error", "worker", "elapsed",
+                           "timings", "attempts", "args"}
@@ -0,0 +1,56 @@
+"""
+    Module
+"""
+import argparse
+import pytest
+import giovanni
+
+def write_result_csv(tmp_path, name:str, var_id:str) -> str:
+    csv_file = tmp_path / name
+    csv_file.write_text(
+        f"Title:,Area-averaged time series of {var_id}\n"
+        "User Start Date:,2000-01-01\n"
+        "User End Date:,2000-03-01\n"
+        "\n"
+        f"time,mean_{var_id}\n"
+        "2000-01-01 00:00:00,1.5\n"
+        "2000-02-01 00:00:00,2.5\n")
+    return str(csv_file)
+
+def test_match_csv_urls_by_id():
+    csv_urls = ["https://g/session/g4.areaAvgTimeSeries.M2_PRECTOTCORR.csv",
+                "https://g/session/g4.areaAvgTimeSeries.M2_PRECTOT.csv"]
+    assert giovanni.match_csv_urls(csv_urls, ["M2_PRECTOT", "M2_PRECTOTCORR"]) == [
+        csv_urls[1], csv_urls[0]]
+
+def test_match_csv_urls_in_order_without_id():
+    csv_urls = ["https://g/result/1.csv", "https://g/result/2.csv"]
+    assert giovanni.match_csv_urls(csv_urls, [None, None]) == csv_urls
+
+def test_match_csv_files_by_data_column(tmp_path):
+    corr = write_result_csv(tmp_path, "a.csv", "M2_PRECTOTCORR")
+    total = write_result_csv(tmp_path, "b.csv", "M2_PRECTOT")
+    assert giovanni.match_csv_files([corr, total], ["M2_PRECTOT", "M2_PRECTOTCORR"]) == [
+        total, corr]
+    assert giovanni.match_csv_files([corr, total], [None, "M2_PRECTOTCORR"]) == [
+        total, corr]
+
+def test_match_csv_files_fails_on_missing_variable(tmp_path):
+    total = write_result_csv(tmp_path, "b.csv", "M2_PRECTOT")
+    with pytest.raises(giovanni.GiovanniPermanentError):
+        giovanni.match_csv_files([total], ["M2_PRECTOTCORR"])
+
+def test_parse_giovanni_csv_keeps_metadata_per_variable(tmp_path):
+    csv_files = [write_result_csv(tmp_path, "a.csv", "M2_PRECTOT"),
+                 write_result_csv(tmp_path, "b.csv", "M2_PRECTOTCORR")]
+    args = argparse.Namespace(
+        rename_column=["precip", "precip_corr"],
+        rename_column_old_name=None, rename_column_index=1,
+        csv_skip_rows=-1, csv_skip_signature="time,", csv_separator=",",
+        plot_variable_id=["M2_PRECTOT", "M2_PRECTOTCORR"], plot_variable=None)
+    parsed = giovanni.parse_giovanni_csv(
+        gv=giovanni.Giovanni(), csv_content=csv_files, args=args)
+    assert parsed["table"].column_names == ["time", "precip", "precip_corr"]
+    assert sorted(parsed["csv_metadata"]) == ["precip", "precip_corr"]
+    assert [rename["old_col_name"] for rename in parsed["rename"]] == [
+        "mean_M2_PRECTOT", "mean_M2_PRECTOTCORR"]
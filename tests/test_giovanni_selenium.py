@@ -0,0 +1,134 @@
+"""
+    Module
+"""
+from selenium.webdriver.common.by import By
+from giovanni import Giovanni, GiovanniVariableCatalog
+
+VARIABLE_ROWS = [
+    ("M2TMNXFLX_5_12_4_PRECTOTCORR", "Total precipitation (bias corrected)"),
+    ("M2TMNXFLX_5_12_4_PRECTOT", "Total precipitation"),
+    ("M2TMNXSLV_5_12_4_T2M", "2-meter air temperature")]
+
+class FakeElement:
+    """
+        Stands in for a WebElement of the variable search page.
+    """
+    def __init__(self, driver, attributes:dict=None, row=None) -> None:
+        self.driver = driver
+        self.attributes = attributes or dict()
+        self.row = row
+        self.text = ""
+        self.selected = False
+        self.on_click = None
+
+    def get_attribute(self, name:str):
+        return self.attributes.get(name)
+
+    def is_displayed(self) -> bool:
+        return True
+
+    def is_enabled(self) -> bool:
+        return True
+
+    def is_selected(self) -> bool:
+        return self.selected
+
+    def clear(self) -> None:
+        self.text = ""
+
+    def send_keys(self, text:str) -> None:
+        self.text += text
+
+    def click(self) -> None:
+        if self.on_click:
+            self.on_click()
+        else:
+            self.selected = not self.selected
+        self.driver.clicks.append(self)
+
+    def find_element(self, by:str, value:str):
+        assert (by, value) == (By.XPATH, "./ancestor::tr[1]")
+        return self.row
+
+class FakeSearchDriver:
+    """
+        Faceted variable search: the table lists the rows whose ID or
+        name contains the search text, checked rows stay checked.
+    """
+    def __init__(self) -> None:
+        self.clicks = list()
+        self.search_input = FakeElement(self)
+        self.search_button = FakeElement(self)
+        self.search_button.on_click = self._search
+        self.sort_link = FakeElement(self, {"title": "Click to sort descending"})
+        self.checkboxes = dict()
+        for var_id, long_name in VARIABLE_ROWS:
+            row = FakeElement(self, {
+                "outerHTML": f"<tr><td><input type='checkbox'></td>"
+                             f"<td><a href='info?dataFieldId={var_id}'>{long_name}</a></td></tr>"})
+            self.checkboxes[var_id] = FakeElement(
+                self, {"title": f"Select {long_name}"}, row=row)
+        self.searches = list()
+        self.rows = list()
+
+    def _search(self) -> None:
+        search = self.search_input.text
+        self.searches.append(search)
+        self.rows = [
+            self.checkboxes[var_id]
+            for var_id, long_name in VARIABLE_ROWS
+            if search.lower() in var_id.lower() or search.lower() in long_name.lower()]
+
+    def quit(self) -> None:
+        pass
+
+    def find_element(self, by:str, value:str):
+        elems = self.find_elements(by=by, value=value)
+        return elems[0] if elems else None
+
+    def find_elements(self, by:str, value:str) -> list:
+        if (by, value) == (By.ID, "facetedSearchBarInput"):
+            return [self.search_input]
+        if (by, value) == (By.ID, "facetedSearchButton"):
+            return [self.search_button]
+        if value == "//a[@href='yui-dt0-href-varName']":
+            return [self.sort_link]
+        if value.startswith("//input[@type='checkbox'"):
+            return list(self.rows)
+        return list()
+
+def fake_giovanni(variable_catalog:GiovanniVariableCatalog=None) -> tuple[Giovanni, FakeSearchDriver]:
+    gv = Giovanni(variable_catalog=variable_catalog)
+    gv.driver = FakeSearchDriver()
+    return gv, gv.driver
+
+def test_select_two_variables_by_id():
+    gv, driver = fake_giovanni()
+
+    assert gv.select_plot_variable_by_id(var_id="M2TMNXFLX_5_12_4_PRECTOT")
+    assert gv.select_plot_variable_by_id(var_id="M2TMNXSLV_5_12_4_T2M")
+
+    # each search starts from an empty box
+    assert driver.searches == ["M2TMNXFLX_5_12_4_PRECTOT", "M2TMNXSLV_5_12_4_T2M"]
+    # the PRECTOT search also lists PRECTOTCORR, first in the table
+    assert driver.checkboxes["M2TMNXFLX_5_12_4_PRECTOT"].selected
+    assert not driver.checkboxes["M2TMNXFLX_5_12_4_PRECTOTCORR"].selected
+    assert driver.checkboxes["M2TMNXSLV_5_12_4_T2M"].selected
+
+def test_select_checked_variable_keeps_it_checked():
+    gv, driver = fake_giovanni()
+
+    assert gv.select_plot_variable_by_id(var_id="M2TMNXFLX_5_12_4_PRECTOT")
+    assert gv.select_plot_variable_by_id(var_id="M2TMNXFLX_5_12_4_PRECTOT")
+
+    assert driver.checkboxes["M2TMNXFLX_5_12_4_PRECTOT"].selected
+
+def test_select_variable_by_keywords_matches_title():
+    gv, driver = fake_giovanni()
+
+    assert gv.select_plot_variable_by_keywords(var_str="Total precipitation")
+    assert gv.select_plot_variable_by_keywords(var_str="air temperature")
+
+    assert driver.searches == ["Total precipitation", "air temperature"]
+    assert driver.checkboxes["M2TMNXFLX_5_12_4_PRECTOTCORR"].selected
+    assert driver.checkboxes["M2TMNXSLV_5_12_4_T2M"].selected